@@ -0,0 +1,14 @@
+"""Cache settings shared by the apps' system checks."""
+from django.conf import settings
+
+# Cache backends that keep a separate copy per process
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def process_local_backend(alias) -> str | None:
+    """The backend of cache `alias` if every worker would get its own copy of it, else None."""
+    backend = settings.CACHES.get(alias, {}).get("BACKEND")
+    return backend if backend in PROCESS_LOCAL_CACHES else None
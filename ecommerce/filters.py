@@ -0,0 +1,25 @@
+"""Query parameter parsing shared by the apps' filter backends."""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+def parse_bound(name, value, end_of_day=False):
+    """An aware datetime from an ISO date or datetime; a bare date as an end bound means the next midnight."""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({name: "Use an ISO 8601 date or datetime."})
+        parsed = datetime.combine(day + timedelta(days=1) if end_of_day else day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_flag(name, value):
+    if value.lower() not in ("true", "false", "1", "0"):
+        raise ValidationError({name: "Expected true or false."})
+    return value.lower() in ("true", "1")
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'users',
@@ -120,6 +121,34 @@ DATABASES = {
 }
 
 
+# Caches
+# The catalog alias backs products.cache and the auth alias the role/user caches in
+# users.auth; point CATALOG_CACHE_* and AUTH_CACHE_* at a shared store (e.g.
+# django.core.cache.backends.redis.RedisCache) when running more than one worker so
+# invalidation is seen by every process. `manage.py check --deploy` fails while
+# either is a per-process cache.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "catalog": {
+        "BACKEND": os.environ.get("CATALOG_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CATALOG_CACHE_LOCATION", "catalog"),
+    },
+    "auth": {
+        "BACKEND": os.environ.get("AUTH_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("AUTH_CACHE_LOCATION", "auth"),
+    },
+    # Session store for the cache and cached_db session modes; must be shared across
+    # workers for those modes (users.sessions refuses locmem)
+    "sessions": {
+        "BACKEND": os.environ.get("SESSION_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("SESSION_CACHE_LOCATION", "sessions"),
+    },
+}
+CATALOG_CACHE_ALIAS = "catalog"
+CATALOG_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -173,7 +202,7 @@ AUTH_USER_MODEL = 'users.CustomUser'
 from datetime import timedelta
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticatedOrReadOnly",),
 }
@@ -182,7 +211,18 @@ SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
     "AUTH_HEADER_TYPES": ("Bearer",),
+    # Embeds the role flags so refresh can tell admins apart without a user lookup
+    "TOKEN_OBTAIN_SERIALIZER": "users.auth.RoleTokenObtainPairSerializer",
+    # Re-reads the role flags (and is_active) instead of copying them from the refresh token
+    "TOKEN_REFRESH_SERIALIZER": "users.auth.RoleTokenRefreshSerializer",
 }
+# How long refreshes and requests may trust a cached copy of a user's roles and
+# is_active (saving the user clears it)
+AUTH_ROLE_CACHE_ALIAS = "auth"
+AUTH_ROLE_CACHE_TIMEOUT = 60
+# Seconds a request may reuse another's copy of the full user row; off (0) unless set, so
+# deactivations and permission changes apply at once
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get("AUTH_USER_CACHE_TIMEOUT", "0"))
 
 
 ESEWA_MERCHANT_ID = "EPAYTEST"  # test merchant
@@ -199,6 +239,25 @@ ESEWA_FAILURE_REDIRECT = f"{FRONTEND_BASE_URL}/payment/failure"
 KHALTI_SECRET_KEY = "test_secret_key_xxx"
 KHALTI_VERIFY_URL = "https://khalti.com/api/v2/payment/verify/"
 
+# HTTP client tuning per gateway (see payments.gateways.DEFAULT_CLIENT_OPTIONS)
+PAYMENT_GATEWAY_CLIENTS = {
+    "esewa": {"connect_timeout": 3.05, "read_timeout": 10, "retries": 2},
+    "khalti": {"connect_timeout": 3.05, "read_timeout": 8, "retries": 2},
+}
+
+# Background payment verification (payments.queue); run `manage.py run_payment_worker`.
+# Set PAYMENT_VERIFY_INLINE=1 to verify inside the callback request when no worker runs.
+PAYMENT_VERIFY_INLINE = os.environ.get("PAYMENT_VERIFY_INLINE", "") == "1"
+PAYMENT_VERIFY_CONCURRENCY = {"esewa": 8, "khalti": 4, "fonepay": 4}
+PAYMENT_VERIFY_MAX_ATTEMPTS = 5
+# Gateway answers are reused per (gateway, ref_id, pid); see payments.results
+PAYMENT_RESULT_CACHE_ALIAS = "default"
+PAYMENT_RESULT_TTL = 24 * 3600
+PAYMENT_NEGATIVE_RESULT_TTL = 60
+# Signed eSewa forms handed back to repeat initiations; see payments.initiation
+PAYMENT_INITIATION_CACHE_ALIAS = "default"
+PAYMENT_INITIATION_CACHE_TIMEOUT = 15 * 60
+
 FONEPAY_MERCHANT_CODE = "YOURCODE"
 FONEPAY_CHECKSUM_KEY = "YOURCHECKSUM"
 FONEPAY_PAYMENT_URL = "https://dev-clientapi.fonepay.com/api/merchantRequest"
@@ -235,6 +294,11 @@ SESSION_COOKIE_SAMESITE = 'Lax'
 CSRF_COOKIE_SECURE = False
 SESSION_COOKIE_SECURE = False
 
-# Use database sessions (default) and expire when the browser closes
-SESSION_ENGINE = "django.contrib.sessions.backends.db"
+# Sessions (admin and CSRF only) expire when the browser closes. SESSION_MODE is
+# signed_cookies, cache, cached_db or db (see users.sessions); the cache modes need
+# a shared SESSION_CACHE_BACKEND. Run `manage.py sweep_sessions` (or clearsessions)
+# on a schedule to clear expired django_session rows.
+SESSION_MODE = os.environ.get("SESSION_MODE", "db")
+SESSION_ENGINE = f"django.contrib.sessions.backends.{SESSION_MODE}"
+SESSION_CACHE_ALIAS = "sessions"
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
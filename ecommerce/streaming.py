@@ -0,0 +1,14 @@
+"""Helpers for responses streamed line by line."""
+import csv
+
+
+class _Echo:
+    """A file-like object whose `write` hands the line back instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def csv_line_writer():
+    """A csv writer whose `writerow` returns the formatted line, for StreamingHttpResponse."""
+    return csv.writer(_Echo())
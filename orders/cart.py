@@ -0,0 +1,97 @@
+"""Server-side cart mutations and totals.
+
+A batch of operations is first collapsed into one net change per product, then
+written with a fixed number of statements however many lines it touches:
+
+* ``set`` lines are one upsert (``INSERT ... ON CONFLICT (user, product) DO UPDATE``).
+* ``add`` lines insert any missing rows with ``ON CONFLICT DO NOTHING`` and then
+  apply every increment in one ``UPDATE ... SET quantity = quantity + CASE ...``,
+  so concurrent adds to the same line are never lost.
+* ``remove`` lines (and ``set`` to 0) are one DELETE.
+"""
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Sum, When
+from django.db.models.functions import Coalesce
+
+from .models import CartItem
+from .money import ZERO, quantize, sum_lines
+
+ADD = "add"
+SET = "set"
+REMOVE = "remove"
+OPERATIONS = (ADD, SET, REMOVE)
+
+
+def collapse_operations(operations) -> dict[int, tuple[str, int]]:
+    """Reduce ordered `{"op", "product", "quantity"}` dicts to one net change per product id."""
+    changes: dict[int, tuple[str, int]] = {}
+    for operation in operations:
+        product_id, op = operation["product"], operation["op"]
+        quantity = operation.get("quantity", 1)
+        previous = changes.get(product_id)
+        if op == REMOVE or (op == SET and quantity == 0):
+            changes[product_id] = (REMOVE, 0)
+        elif op == SET:
+            changes[product_id] = (SET, quantity)
+        elif previous is None:
+            changes[product_id] = (ADD, quantity)
+        elif previous[0] == REMOVE:
+            # Removed earlier in this batch, so the line ends up holding exactly this much
+            changes[product_id] = (SET, quantity)
+        else:
+            changes[product_id] = (previous[0], previous[1] + quantity)
+    return changes
+
+
+@transaction.atomic
+def apply_cart_operations(user, operations) -> dict[int, tuple[str, int]]:
+    """Apply a batch of cart operations for `user`; product ids must already be validated."""
+    changes = collapse_operations(operations)
+    adds = {pk: qty for pk, (op, qty) in changes.items() if op == ADD}
+    sets = {pk: qty for pk, (op, qty) in changes.items() if op == SET}
+    removes = [pk for pk, (op, _) in changes.items() if op == REMOVE]
+
+    if removes:
+        CartItem.objects.filter(user=user, product_id__in=removes).delete()
+    if sets:
+        CartItem.objects.bulk_create(
+            [CartItem(user=user, product_id=pk, quantity=qty) for pk, qty in sets.items()],
+            update_conflicts=True,
+            unique_fields=["user", "product"],
+            update_fields=["quantity"],
+        )
+    if adds:
+        CartItem.objects.bulk_create(
+            [CartItem(user=user, product_id=pk, quantity=0) for pk in adds],
+            ignore_conflicts=True,
+        )
+        CartItem.objects.filter(user=user, product_id__in=adds).update(
+            quantity=F("quantity") + Case(*(When(product_id=pk, then=qty) for pk, qty in adds.items()))
+        )
+    return changes
+
+
+def cart_summary(user) -> dict:
+    """Line count, unit count and subtotal of `user`'s cart in one aggregate query."""
+    totals = CartItem.objects.filter(user=user).aggregate(
+        lines=Count("id"),
+        units=Coalesce(Sum("quantity"), 0),
+        subtotal=Sum(
+            F("quantity") * F("product__price"),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+    return {
+        "lines": totals["lines"],
+        "units": totals["units"],
+        "subtotal": str(quantize(totals["subtotal"] or ZERO)),
+    }
+
+
+def lines_summary(items) -> dict:
+    """`cart_summary` worked out from cart items already loaded with their products."""
+    return {
+        "lines": len(items),
+        "units": sum(item.quantity for item in items),
+        "subtotal": str(sum_lines((item.product.price, item.quantity) for item in items)),
+    }
@@ -0,0 +1,55 @@
+from django.db.models import Exists, OuterRef
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from ecommerce.filters import parse_bound, parse_flag
+from payments.models import Payment
+
+from .models import Order
+
+
+class OrderFilterBackend(BaseFilterBackend):
+    """Filter orders by status, is_paid, created_after/created_before, payment_method and user.
+
+    Every filter maps onto a column covered by an Order index (or an EXISTS probe
+    on payments), so filtered lists never fan out into joined duplicates.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        status_value = params.get("status")
+        if status_value:
+            valid = {choice for choice, _ in Order.STATUS_CHOICES}
+            if status_value not in valid:
+                raise ValidationError({"status": f"Expected one of {', '.join(sorted(valid))}."})
+            queryset = queryset.filter(status=status_value)
+
+        is_paid = params.get("is_paid")
+        if is_paid:
+            queryset = queryset.filter(is_paid=parse_flag("is_paid", is_paid))
+
+        created_after = params.get("created_after")
+        if created_after:
+            queryset = queryset.filter(created_at__gte=parse_bound("created_after", created_after))
+
+        created_before = params.get("created_before")
+        if created_before:
+            # A bare date is inclusive: created_before=2025-01-31 keeps the whole day
+            queryset = queryset.filter(
+                created_at__lt=parse_bound("created_before", created_before, end_of_day=True)
+            )
+
+        payment_method = params.get("payment_method")
+        if payment_method:
+            queryset = queryset.filter(
+                Exists(Payment.objects.filter(order=OuterRef("pk"), method=payment_method))
+            )
+
+        user_id = params.get("user")
+        if user_id:
+            if not user_id.isdigit():
+                raise ValidationError({"user": "Expected a user id."})
+            queryset = queryset.filter(user_id=int(user_id))
+
+        return queryset
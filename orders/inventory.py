@@ -0,0 +1,160 @@
+"""Inventory reservation for checkout.
+
+Stock is reserved when an order is placed, follows admin edits of its items, and is
+handed back if the order is cancelled or its payment fails. Reservation locks the affected product rows in primary key
+order, so concurrent checkouts touching overlapping products always queue up in the
+same order and cannot deadlock, then applies every decrement in a single guarded
+UPDATE. The `inventory >= requested` guard keeps the update safe on backends that
+ignore `select_for_update` (SQLite): a lost race shows up as a short row count and
+the whole reservation is rolled back instead of overselling.
+"""
+from collections import Counter
+from dataclasses import asdict, dataclass
+
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+
+from products.models import Product
+
+from .models import Order, OrderItem
+
+
+@dataclass(frozen=True)
+class Shortfall:
+    product_id: int
+    requested: int
+    available: int
+
+    @property
+    def missing(self) -> int:
+        return self.requested - self.available
+
+    def as_dict(self):
+        return {**asdict(self), "missing": self.missing}
+
+
+class InsufficientInventory(Exception):
+    def __init__(self, shortfalls):
+        self.shortfalls = list(shortfalls)
+        super().__init__(f"Insufficient inventory for {len(self.shortfalls)} product(s)")
+
+    def as_response_data(self):
+        return {
+            "detail": "Insufficient inventory",
+            "shortfalls": [shortfall.as_dict() for shortfall in self.shortfalls],
+        }
+
+
+def _demand(lines) -> dict[int, int]:
+    demand = Counter()
+    for product, quantity in lines:
+        demand[getattr(product, "pk", product)] += int(quantity)
+    return dict(sorted(demand.items()))
+
+
+def _per_product(demand):
+    return Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in demand.items()],
+        output_field=PositiveIntegerField(),
+    )
+
+
+def _shortfalls(demand, available):
+    return [
+        Shortfall(pk, quantity, available.get(pk, 0))
+        for pk, quantity in demand.items()
+        if available.get(pk, 0) < quantity
+    ]
+
+
+def reserve_inventory(lines) -> None:
+    """Take stock for `(product, quantity)` lines or raise InsufficientInventory.
+
+    Call it inside the transaction that creates the order so the reservation
+    commits or rolls back together with the order that needs it.
+    """
+    demand = _demand(lines)
+    if not demand:
+        return
+    with transaction.atomic():
+        locked = (
+            Product.objects.select_for_update()
+            .filter(pk__in=demand)
+            .order_by("pk")
+            .values_list("pk", "inventory")
+        )
+        shortfalls = _shortfalls(demand, dict(locked))
+        if shortfalls:
+            raise InsufficientInventory(shortfalls)
+
+        requested = _per_product(demand)
+        updated = Product.objects.filter(pk__in=demand, inventory__gte=requested).update(
+            inventory=F("inventory") - requested
+        )
+        if updated != len(demand):
+            # Only reachable without row locks: someone else took the stock first
+            current = dict(Product.objects.filter(pk__in=demand).values_list("pk", "inventory"))
+            raise InsufficientInventory(_shortfalls(demand, current))
+
+
+def restock(lines) -> None:
+    demand = _demand(lines)
+    if demand:
+        Product.objects.filter(pk__in=demand).update(inventory=F("inventory") + _per_product(demand))
+
+
+def _order_lines(order_id):
+    return OrderItem.objects.filter(order_id=order_id, product__isnull=False).values_list(
+        "product_id", "quantity"
+    )
+
+
+@transaction.atomic
+def reserve_order_inventory(order: Order) -> bool:
+    """Reserve stock for an existing order that does not hold a reservation.
+
+    Returns False if the order already had one, so it is safe to call repeatedly.
+    """
+    claimed = Order.objects.filter(pk=order.pk, inventory_reserved=False).update(inventory_reserved=True)
+    if not claimed:
+        return False
+    reserve_inventory(_order_lines(order.pk))
+    order.inventory_reserved = True
+    return True
+
+
+def adjust_order_reservation(order: Order, old_lines, new_lines) -> bool:
+    """Move a reserved order's stock from `old_lines` to `new_lines`, both `(product, quantity)`.
+
+    Only the difference is taken or handed back; a shortfall raises InsufficientInventory.
+    Call it in the transaction that rewrites the order's items. Orders without a
+    reservation are left alone and False is returned.
+    """
+    if not order.inventory_reserved:
+        return False
+    with transaction.atomic():
+        # Lock the order so a concurrent release cannot hand back the old quantities meanwhile
+        if not Order.objects.select_for_update().filter(pk=order.pk, inventory_reserved=True).exists():
+            return False
+        old, new = _demand(old_lines), _demand(new_lines)
+        taken = {pk: new.get(pk, 0) - old.get(pk, 0) for pk in {*old, *new}}
+        reserve_inventory([(pk, delta) for pk, delta in taken.items() if delta > 0])
+        restock([(pk, -delta) for pk, delta in taken.items() if delta < 0])
+    return True
+
+
+@transaction.atomic
+def release_order_inventory(order_id, unpaid_only=False) -> bool:
+    """Return an order's reserved stock. Idempotent: only the first call restocks.
+
+    Payment failure paths pass `unpaid_only` so a failed retry can never release
+    stock for an order another payment has already settled.
+    """
+    orders = Order.objects.filter(pk=order_id, inventory_reserved=True)
+    if unpaid_only:
+        orders = orders.filter(is_paid=False)
+    released = orders.update(inventory_reserved=False)
+    if not released:
+        return False
+    restock(_order_lines(order_id))
+    return True
@@ -0,0 +1,67 @@
+import json
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from orders import money
+
+PRICES = [Decimal(f"{100 + i * 37 % 900}.{i * 7 % 100:02d}") for i in range(50)]
+LINES = [(price, 1 + i % 4) for i, price in enumerate(PRICES)]
+CALLBACK_AMOUNTS = ["1500", "1500.0", "1500.00", 1500, Decimal("1500.00")]
+
+
+def _baseline_total(lines):
+    return sum((price * quantity for price, quantity in lines), Decimal("0")).quantize(Decimal("0.01"))
+
+
+def _baseline_format(value):
+    decimal_value = value if isinstance(value, Decimal) else Decimal(str(value))
+    return format(decimal_value.quantize(Decimal("0.01")), "f")
+
+
+def _baseline_parse(value):
+    return (value if isinstance(value, Decimal) else Decimal(str(value))).quantize(Decimal("0.01"))
+
+
+def _baseline_paisa(value):
+    return int(Decimal(str(value)) * 100)
+
+
+# (operation, per-call baseline, per-call money helper): the inline patterns
+# the helpers replaced, against the helpers themselves
+CASES = [
+    ("order_total_50_lines", lambda: _baseline_total(LINES), lambda: money.sum_lines(LINES)),
+    ("format_decimal_total", lambda: _baseline_format(PRICES[0]), lambda: money.format_amount(PRICES[0])),
+    ("parse_callback_amounts", lambda: [_baseline_parse(a) for a in CALLBACK_AMOUNTS],
+     lambda: [money.parse_amount(a) for a in CALLBACK_AMOUNTS]),
+    ("khalti_paisa", lambda: _baseline_paisa(PRICES[0]), lambda: money.to_paisa(PRICES[0])),
+]
+
+
+class Command(BaseCommand):
+    help = "Time the shared money helpers against the inline Decimal patterns they replaced."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        for name, baseline, helper in CASES:
+            if baseline() != helper():
+                raise AssertionError(f"{name}: helper disagrees with baseline")
+            self.stdout.write(json.dumps({
+                "operation": name,
+                "baseline_us": self._best_us(baseline, options),
+                "money_us": self._best_us(helper, options),
+            }))
+
+    @staticmethod
+    def _best_us(call, options):
+        best = None
+        for _ in range(options["repeat"]):
+            started = time.perf_counter()
+            for _ in range(options["iterations"]):
+                call()
+            best = min(best or float("inf"), time.perf_counter() - started)
+        return round(best / options["iterations"] * 1e6, 3)
@@ -0,0 +1,78 @@
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from orders.models import Order, OrderItem
+from orders.serializers import OrderCompactSerializer, OrderSerializer, latest_payment_prefetch
+from products.models import Product, ProductImage
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare payload size and serialization time of the full and compact order shapes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=200)
+        parser.add_argument("--lines", type=int, default=5)
+        parser.add_argument("--images", type=int, default=4)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._seed(options)
+                self._run(options["repeat"])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _seed(self, options):
+        user = get_user_model().objects.create_user("bench-orders", "bench-orders@example.com", "bench")
+        products = Product.objects.bulk_create(
+            Product(
+                title=f"Bench product {i}",
+                slug=f"bench-product-{i}",
+                description="Lorem ipsum dolor sit amet. " * 20,
+                price=100 + i,
+                inventory=1000,
+            )
+            for i in range(options["lines"])
+        )
+        ProductImage.objects.bulk_create(
+            ProductImage(product=product, image=f"https://cdn.example.com/{product.slug}/{n}.jpg", is_primary=n == 0)
+            for product in products
+            for n in range(options["images"])
+        )
+        orders = Order.objects.bulk_create(Order(user=user, total=0) for _ in range(options["orders"]))
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=1, price=product.price)
+            for order in orders
+            for product in products
+        )
+
+    def _run(self, repeat):
+        queryset = Order.objects.filter(user__username="bench-orders").select_related("user").prefetch_related(
+            "items__product", "items__product__images", latest_payment_prefetch()
+        )
+        orders = list(queryset)
+        renderer = JSONRenderer()
+        for label, serializer_class in (("full", OrderSerializer), ("compact", OrderCompactSerializer)):
+            best = None
+            for _ in range(repeat):
+                started = time.perf_counter()
+                payload = renderer.render(serializer_class(orders, many=True).data)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write(json.dumps({
+                "shape": label,
+                "orders": len(orders),
+                "bytes": len(payload),
+                "best_ms": round(best * 1000, 2),
+            }))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 00:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='inventory_reserved',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('paid', 'paid'), ('shipped', 'shipped'), ('cancelled', 'cancelled')], default='pending', max_length=20),
+        ),
+    ]
@@ -17,7 +17,7 @@ class CartItem(models.Model):
         return f"{self.user} - {self.product} x {self.quantity}"
 
 class Order(models.Model):
-    STATUS_CHOICES = (("pending", "pending"), ("paid", "paid"), ("shipped", "shipped"))
+    STATUS_CHOICES = (("pending", "pending"), ("paid", "paid"), ("shipped", "shipped"), ("cancelled", "cancelled"))
     user = models.ForeignKey(User, related_name="orders", on_delete=models.CASCADE)
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
@@ -30,8 +30,17 @@ class Order(models.Model):
     shipping_phone = models.CharField(max_length=20, blank=True)
     transaction_id = models.CharField(max_length=255, blank=True, null=True)
     transaction_uuid = models.CharField(max_length=64, blank=True, null=True)
+    # True while the order holds stock taken at checkout (see orders.inventory)
+    inventory_reserved = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="order_created_id_idx"),
+            models.Index(fields=["status", "created_at"], name="order_status_created_idx"),
+            models.Index(fields=["user", "created_at"], name="order_user_created_idx"),
+        ]
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name="items", on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True)
@@ -0,0 +1,53 @@
+"""Money amounts: conversion, rounding to paisa and gateway formatting.
+
+Every amount the shop stores or sends is a Decimal with two places. The helpers
+here share one quantizer instead of building ``Decimal("0.01")`` on each call,
+round once at the end of a sum, and leave values that are already Decimal (or
+int, or str) alone rather than round-tripping them through ``str``. Rounding is
+the Decimal default (half-even), as before.
+"""
+from decimal import Decimal, InvalidOperation
+from itertools import starmap
+from operator import mul
+
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+
+def to_decimal(value) -> Decimal:
+    """Exact Decimal for `value`; floats go through ``str`` so 0.1 stays 0.1."""
+    kind = type(value)
+    if kind is Decimal:
+        return value
+    if kind is str or kind is int:
+        return Decimal(value)
+    return Decimal(str(value))
+
+
+def quantize(value) -> Decimal:
+    """`value` rounded to paisa; raises InvalidOperation for anything that is not a number."""
+    return to_decimal(value).quantize(CENT)
+
+
+def parse_amount(value) -> Decimal | None:
+    """Lenient `quantize` for amounts from outside (gateway responses, callbacks): None if unusable."""
+    if value is None:
+        return None
+    try:
+        return quantize(value)
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+
+
+def format_amount(value) -> str:
+    """Plain two-place string, e.g. ``"1500.00"``, as the gateways expect."""
+    return format(quantize(value), "f")
+
+
+def to_paisa(value) -> int:
+    return int(quantize(value) * 100)
+
+
+def sum_lines(lines) -> Decimal:
+    """Sum of price × quantity over ``(price, quantity)`` pairs, rounded once at the end."""
+    return sum(starmap(mul, lines), ZERO).quantize(CENT)
@@ -1,7 +1,9 @@
 from rest_framework import serializers
-from decimal import Decimal
 from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
+from .cart import ADD, OPERATIONS, SET
 from .models import CartItem, Order, OrderItem
+from .services import create_order, replace_order_items
 from products.serializers import ProductSerializer
 from products.models import Product
 from payments.models import Payment
@@ -10,6 +12,22 @@ from users.serializers import UserSerializer
 
 User = get_user_model()
 
+LATEST_PAYMENT_ATTR = "latest_payments"
+
+
+def latest_payment_prefetch():
+    """Prefetch only the newest payment of each order (a windowed, sliced prefetch)."""
+    return Prefetch(
+        "payment_set",
+        queryset=Payment.objects.order_by("-created_at", "-id")[:1],
+        to_attr=LATEST_PAYMENT_ATTR,
+    )
+
+def cart_products():
+    """Products with what CartItemSerializer renders of them (category, images) loaded."""
+    return Product.objects.select_related("category").prefetch_related("images")
+
+
 class CartItemSerializer(serializers.ModelSerializer):
     product_details = ProductSerializer(source='product', read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
@@ -27,6 +45,38 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = ("id", "user", "product", "product_id", "product_details", "quantity", "added_at")
         read_only_fields = ("id", "user", "product_details", "added_at")
 
+
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=OPERATIONS, default=ADD)
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=0, default=1)
+
+    def validate(self, attrs):
+        if attrs["op"] == ADD and attrs["quantity"] < 1:
+            raise serializers.ValidationError({"quantity": "Ensure this value is greater than or equal to 1."})
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+
+    def validate_operations(self, operations):
+        # Products only have to exist for lines that end up in the cart; one lookup for all of
+        # them, kept in `products` so the response can render those lines without another
+        adding = [item["op"] in (ADD, SET) and item["quantity"] > 0 for item in operations]
+        wanted = {item["product"] for item, adds in zip(operations, adding) if adds}
+        self.products = cart_products().in_bulk(wanted)
+        missing = wanted - self.products.keys()
+        errors = [
+            {"product": [f'Invalid pk "{item["product"]}" - object does not exist.']}
+            if adds and item["product"] in missing else {}
+            for item, adds in zip(operations, adding)
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return operations
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_details = ProductSerializer(source="product", read_only=True)
@@ -74,20 +124,82 @@ class OrderSerializer(serializers.ModelSerializer):
 
 
     def get_payment_details(self, obj):
-        prefetched = getattr(obj, "_prefetched_objects_cache", {})
-        payments = prefetched.get("payment_set") if isinstance(prefetched, dict) else None
-        if payments:
-            payment_instance = payments[0]
-            return PaymentSerializer(payment_instance, context=self.context).data
-        payment_instance = Payment.objects.filter(order=obj).order_by("-created_at").first()
+        payments = getattr(obj, LATEST_PAYMENT_ATTR, None)
+        if payments is None:
+            # Not loaded through latest_payment_prefetch(): look it up for this order
+            payment_instance = Payment.objects.filter(order=obj).order_by("-created_at", "-id").first()
+        else:
+            payment_instance = payments[0] if payments else None
         if payment_instance:
             return PaymentSerializer(payment_instance, context=self.context).data
         return None
 
+class ProductSummarySerializer(serializers.ModelSerializer):
+    """Just enough of a product to render an order line: no description, one image."""
+
+    image = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = ("id", "title", "slug", "price", "image")
+
+    def get_image(self, obj):
+        # The product's own copy of its primary image (products.read_model), so no images are loaded
+        return obj.primary_image_url or None
+
+
+class OrderItemCompactSerializer(serializers.ModelSerializer):
+    product = ProductSummarySerializer(read_only=True)
+
+    class Meta:
+        model = OrderItem
+        fields = ("id", "product", "quantity", "price")
+
+
+class OrderCompactSerializer(OrderSerializer):
+    """Compact order shape: user id only and summarized products on each line."""
+
+    items = OrderItemCompactSerializer(many=True, read_only=True)
+
+    class Meta(OrderSerializer.Meta):
+        fields = (
+            "id",
+            "user",
+            "total",
+            "status",
+            "is_paid",
+            "transaction_id",
+            "created_at",
+            "items",
+            "payment_details",
+        )
+
+
+class OrderItemInputListSerializer(serializers.ListSerializer):
+    """Resolve every line's product with one query instead of one per line."""
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        products = Product.objects.in_bulk({item["product"] for item in items})
+        errors = [
+            {} if item["product"] in products
+            else {"product": [f'Invalid pk "{item["product"]}" - object does not exist.']}
+            for item in items
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        for item in items:
+            item["product"] = products[item["product"]]
+        return items
+
+
 class OrderItemInputSerializer(serializers.Serializer):
-    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
+    product = serializers.IntegerField(min_value=1)
     quantity = serializers.IntegerField(min_value=1)
 
+    class Meta:
+        list_serializer_class = OrderItemInputListSerializer
+
 
 class OrderSubmitSerializer(serializers.Serializer):
     items = OrderItemInputSerializer(many=True)
@@ -135,36 +247,22 @@ class OrderAdminWriteSerializer(serializers.ModelSerializer):
             "shipping_phone": {"required": False, "allow_blank": True},
         }
 
-    def _create_items(self, order: Order, items_data):
-        total = Decimal("0")
-        for item in items_data:
-            product: Product = item["product"]
-            quantity = item["quantity"]
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                quantity=quantity,
-                price=product.price,
-            )
-            total += product.price * quantity
-        order.total = total
-        order.save()
+    @staticmethod
+    def _lines(items_data):
+        return [(item["product"], item["quantity"]) for item in items_data]
 
     def create(self, validated_data):
         items_data = validated_data.pop("items_data", [])
         if not items_data:
             raise serializers.ValidationError({"items_data": "At least one item is required."})
-        order = Order.objects.create(**validated_data)
-        self._create_items(order, items_data)
-        return order
+        return create_order(lines=self._lines(items_data), **validated_data)
 
     def update(self, instance: Order, validated_data):
         items_data = validated_data.pop("items_data", None)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         if items_data is not None:
-            instance.items.all().delete()
-            self._create_items(instance, items_data)
+            replace_order_items(instance, self._lines(items_data))
         else:
             instance.save()
         return instance
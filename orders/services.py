@@ -0,0 +1,101 @@
+"""Order building shared by checkout and the admin order API.
+
+Totals are computed before anything is written, so an order costs one INSERT for
+the order row and one bulk INSERT for its lines regardless of basket size. The
+admin listing summary is likewise a single aggregate query.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from .inventory import adjust_order_reservation
+from .models import Order, OrderItem
+from .money import ZERO, quantize, sum_lines
+
+
+def normalize_lines(lines):
+    """Materialize `(product, quantity)` pairs so they can be iterated twice."""
+    return [(product, int(quantity)) for product, quantity in lines]
+
+
+def lines_total(lines) -> Decimal:
+    return sum_lines((product.price, quantity) for product, quantity in lines)
+
+
+def _build_items(order: Order, lines):
+    return [
+        OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+        for product, quantity in lines
+    ]
+
+
+@transaction.atomic
+def create_order(user, lines, **fields) -> Order:
+    """Create an order and all of its items atomically."""
+    lines = normalize_lines(lines)
+    order = Order.objects.create(user=user, total=lines_total(lines), **fields)
+    OrderItem.objects.bulk_create(_build_items(order, lines))
+    return order
+
+
+@transaction.atomic
+def replace_order_items(order: Order, lines) -> Order:
+    """Make the order's items match `lines` and save it (with any pending field changes) once.
+
+    Lines are matched to existing items by product. Only what differs is written:
+    one bulk INSERT for new products, one bulk UPDATE for changed quantities and one
+    DELETE for products no longer ordered. Kept lines keep the price they were sold
+    at; new lines take the product's current price. A reserved order's stock
+    reservation follows the change in the same transaction (InsufficientInventory
+    if it cannot).
+    """
+    wanted: dict[int, list] = {}
+    for product, quantity in normalize_lines(lines):
+        entry = wanted.setdefault(product.pk, [product, 0])
+        entry[1] += quantity
+
+    kept, stale, reserved = {}, [], []
+    for item in order.items.all():
+        if item.product_id is not None:
+            reserved.append((item.product_id, item.quantity))
+        if item.product_id in wanted and item.product_id not in kept:
+            kept[item.product_id] = item
+        else:
+            stale.append(item.pk)
+
+    changed = []
+    for product_id, (_, quantity) in wanted.items():
+        item = kept.get(product_id)
+        if item is not None and item.quantity != quantity:
+            item.quantity = quantity
+            changed.append(item)
+    added = _build_items(order, [(product, quantity) for pk, (product, quantity) in wanted.items() if pk not in kept])
+
+    adjust_order_reservation(order, reserved, [(pk, quantity) for pk, (_, quantity) in wanted.items()])
+    if stale:
+        OrderItem.objects.filter(pk__in=stale).delete()
+    if changed:
+        OrderItem.objects.bulk_update(changed, ["quantity"])
+    if added:
+        OrderItem.objects.bulk_create(added)
+
+    order.total = sum_lines((item.price, item.quantity) for item in [*kept.values(), *added])
+    order.save()
+    return order
+
+
+def order_summary(queryset) -> dict:
+    """Count, paid revenue and paid ratio for `queryset` in a single aggregate query."""
+    totals = queryset.order_by().aggregate(
+        count=Count("id"),
+        paid_count=Count("id", filter=Q(is_paid=True)),
+        revenue=Sum("total", filter=Q(is_paid=True)),
+    )
+    count = totals["count"]
+    return {
+        "count": count,
+        "paid_count": totals["paid_count"],
+        "revenue": str(quantize(totals["revenue"] or ZERO)),
+        "paid_ratio": round(totals["paid_count"] / count, 4) if count else 0.0,
+    }
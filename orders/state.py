@@ -0,0 +1,51 @@
+"""Order status transitions.
+
+Each transition is one conditional ``UPDATE ... WHERE status IN (<allowed
+sources>)``, so two requests racing for the same order cannot both apply it:
+the loser's UPDATE matches no row and it gets False back.
+
+    pending --> paid --> shipped
+       \\
+        --> cancelled
+"""
+from django.db.models import Q
+
+from .models import Order
+
+PENDING = "pending"
+PAID = "paid"
+SHIPPED = "shipped"
+CANCELLED = "cancelled"
+
+TRANSITIONS = {
+    PENDING: (PAID, CANCELLED),
+    PAID: (SHIPPED,),
+    SHIPPED: (),
+    CANCELLED: (),
+}
+# Extra conditions on the row being moved
+GUARDS = {
+    PAID: Q(is_paid=False),
+    CANCELLED: Q(is_paid=False),
+}
+
+
+def sources(target: str) -> tuple[str, ...]:
+    return tuple(state for state, targets in TRANSITIONS.items() if target in targets)
+
+
+def transition_order(order_id, target: str, **fields) -> bool:
+    """Move the order to `target` if it is in a state that allows it; returns whether it moved."""
+    orders = Order.objects.filter(pk=order_id, status__in=sources(target))
+    if target in GUARDS:
+        orders = orders.filter(GUARDS[target])
+    return bool(orders.update(status=target, **fields))
+
+
+def mark_paid(order_id, transaction_id=None, transaction_uuid=None) -> bool:
+    fields = {"is_paid": True}
+    if transaction_id:
+        fields["transaction_id"] = transaction_id
+    if transaction_uuid:
+        fields["transaction_uuid"] = transaction_uuid
+    return transition_order(order_id, PAID, **fields)
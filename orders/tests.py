@@ -1,3 +1,450 @@
-from django.test import TestCase
+import threading
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from payments.models import Payment
+from products.models import Product, ProductImage
+
+from .cart import apply_cart_operations, cart_summary
+from .inventory import InsufficientInventory, release_order_inventory, reserve_inventory
+from .models import CartItem, Order, OrderItem
+from .money import format_amount, parse_amount, sum_lines, to_paisa
+from .services import create_order, replace_order_items
+from .state import CANCELLED, SHIPPED, mark_paid, transition_order
+
+User = get_user_model()
+
+SHIPPING = {
+    "shipping_address": "Street 1",
+    "shipping_city": "Kathmandu",
+    "shipping_postal_code": "44600",
+    "shipping_country": "Nepal",
+    "shipping_phone": "9800000000",
+}
+
+
+class InventoryReservationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", "buyer@example.com", "pw")
+        self.phone = Product.objects.create(title="Phone", slug="phone", price=100, inventory=5)
+        self.case = Product.objects.create(title="Case", slug="case", price=10, inventory=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _stock(self, product):
+        product.refresh_from_db(fields=["inventory"])
+        return product.inventory
+
+    def test_reserve_decrements_every_line(self):
+        reserve_inventory([(self.phone, 2), (self.case, 1), (self.phone, 1)])
+        self.assertEqual(self._stock(self.phone), 2)
+        self.assertEqual(self._stock(self.case), 0)
+
+    def test_shortfall_reports_each_line_and_takes_nothing(self):
+        with self.assertRaises(InsufficientInventory) as ctx:
+            reserve_inventory([(self.phone, 6), (self.case, 2)])
+        report = {s.product_id: (s.requested, s.available, s.missing) for s in ctx.exception.shortfalls}
+        self.assertEqual(report, {self.phone.pk: (6, 5, 1), self.case.pk: (2, 1, 1)})
+        self.assertEqual(self._stock(self.phone), 5)
+        self.assertEqual(self._stock(self.case), 1)
+
+    def test_submit_order_rejects_oversell(self):
+        response = self.client.post(
+            "/api/orders/submit/",
+            {"items": [{"product": self.case.pk, "quantity": 2}], **SHIPPING},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["shortfalls"][0]["missing"], 1)
+        self.assertFalse(Order.objects.exists())
+
+    def test_cancel_releases_stock_once(self):
+        response = self.client.post(
+            "/api/orders/submit/",
+            {"items": [{"product": self.phone.pk, "quantity": 3}], **SHIPPING},
+            format="json",
+        )
+        order_id = response.json()["order_id"]
+        self.assertEqual(self._stock(self.phone), 2)
+
+        response = self.client.post(f"/api/orders/orders/{order_id}/cancel/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._stock(self.phone), 5)
+        self.assertFalse(release_order_inventory(order_id))
+        self.assertEqual(self._stock(self.phone), 5)
+
+    def test_failed_payment_does_not_release_paid_order(self):
+        reserve_inventory([(self.phone, 1)])
+        order = create_order(self.user, [(self.phone, 1)], inventory_reserved=True, is_paid=True)
+        self.assertFalse(release_order_inventory(order.pk, unpaid_only=True))
+        self.assertEqual(self._stock(self.phone), 4)
+
+
+class OrderStateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", "buyer@example.com", "pw")
+        self.phone = Product.objects.create(title="Phone", slug="phone", price=100, inventory=5)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_only_paid_orders_ship(self):
+        reserve_inventory([(self.phone, 1)])
+        order = create_order(self.user, [(self.phone, 1)], inventory_reserved=True)
+        admin = APIClient()
+        admin.force_authenticate(User.objects.create_user("admin", "admin@example.com", "pw", is_staff=True))
+        self.assertEqual(admin.post(f"/api/orders/orders/{order.pk}/ship/").status_code, 400)
+        self.assertEqual(self.client.post(f"/api/orders/orders/{order.pk}/ship/").status_code, 403)
+
+        self.assertTrue(mark_paid(order.pk, transaction_id="TX-1"))
+        self.assertFalse(mark_paid(order.pk, transaction_id="TX-2"))
+        self.assertEqual(admin.post(f"/api/orders/orders/{order.pk}/ship/").json()["status"], "shipped")
+        self.assertEqual(self.client.post(f"/api/orders/orders/{order.pk}/cancel/").status_code, 400)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.transaction_id), ("shipped", "TX-1"))
+
+    def test_cancelled_orders_cannot_be_paid_or_shipped(self):
+        order = create_order(self.user, [(self.phone, 1)])
+        self.assertTrue(transition_order(order.pk, CANCELLED))
+        self.assertFalse(mark_paid(order.pk, transaction_id="TX-1"))
+        self.assertFalse(transition_order(order.pk, SHIPPED))
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.is_paid), ("cancelled", False))
+
+
+class SubmitOrderQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("buyer", "buyer@example.com", "pw")
+        cls.products = Product.objects.bulk_create(
+            Product(title=f"Part {i}", slug=f"part-{i}", price=10 + i, inventory=10) for i in range(50)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _submit(self, size):
+        items = [{"product": p.pk, "quantity": 2} for p in self.products[:size]]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/api/orders/submit/", {"items": items, **SHIPPING}, format="json")
+        self.assertEqual(response.status_code, 201)
+        return len(queries)
+
+    def test_submit_query_count_is_constant(self):
+        # products, then one savepoint each for the submit, reservation and order:
+        # lock, decrement, order, items and three releases, whatever the basket size
+        self.assertEqual(self._submit(5), self._submit(50))
+        self.assertEqual(self._submit(50), 11)
+        order = Order.objects.latest("pk")
+        self.assertEqual(order.items.count(), 50)
+        self.assertEqual(order.total, sum_lines((p.price, 2) for p in self.products))
+
+
+class ReplaceOrderItemsTests(TestCase):
+    def test_diffs_items_by_product(self):
+        user = User.objects.create_user("buyer", "buyer@example.com", "pw")
+        phone, case, cable = (
+            Product.objects.create(title=t, slug=t, price=p) for t, p in (("phone", 100), ("case", 10), ("cable", 5))
+        )
+        order = create_order(user, [(phone, 1), (case, 2)])
+        phone_item = order.items.get(product=phone)
+        Product.objects.filter(pk=phone.pk).update(price=150)
+        phone.refresh_from_db()
+
+        with self.assertNumQueries(7):  # savepoint, items, delete, update, insert, order, release
+            replace_order_items(order, [(phone, 1), (phone, 2), (cable, 4)])
+
+        items = {item.product_id: item for item in order.items.all()}
+        self.assertEqual(set(items), {phone.pk, cable.pk})
+        self.assertEqual(items[phone.pk].pk, phone_item.pk)
+        self.assertEqual((items[phone.pk].quantity, items[phone.pk].price), (3, 100))
+        order.refresh_from_db()
+        self.assertEqual(order.total, 320)
+
+
+    def test_admin_item_edits_move_the_reservation(self):
+        user = User.objects.create_user("buyer", "buyer@example.com", "pw")
+        phone = Product.objects.create(title="Phone", slug="phone", price=100, inventory=5)
+        case = Product.objects.create(title="Case", slug="case", price=10, inventory=2)
+        reserve_inventory([(phone, 1)])
+        order = create_order(user, [(phone, 1)], inventory_reserved=True)
+        admin = APIClient()
+        admin.force_authenticate(User.objects.create_user("admin", "admin@example.com", "pw", is_staff=True))
+        url = f"/api/orders/orders/{order.pk}/"
+
+        def stock():
+            return dict(Product.objects.values_list("slug", "inventory"))
+
+        items = [{"product": phone.pk, "quantity": 3}, {"product": case.pk, "quantity": 1}]
+        self.assertEqual(admin.patch(url, {"items_data": items}, format="json").status_code, 200)
+        self.assertEqual(stock(), {"phone": 2, "case": 1})
+
+        response = admin.patch(url, {"items_data": [{"product": case.pk, "quantity": 5}]}, format="json")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(stock(), {"phone": 2, "case": 1})
+        self.assertEqual(order.items.count(), 2)
+
+        self.assertEqual(admin.post(f"{url}cancel/").status_code, 200)
+        self.assertEqual(stock(), {"phone": 5, "case": 2})
+
+
+class OrderListQueryCountTests(TestCase):
+    ORDERS = 500
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user("admin", "admin@example.com", "pw", is_staff=True)
+        cls.customer = customer = User.objects.create_user("customer", "customer@example.com", "pw")
+        products = Product.objects.bulk_create(
+            Product(title=f"P{i}", slug=f"p{i}", price=10 + i, inventory=10) for i in range(3)
+        )
+        for product in products:  # one by one, so each product's primary_image_url follows
+            ProductImage.objects.create(product=product, image=f"{product.slug}.jpg")
+        orders = Order.objects.bulk_create(Order(user=customer, total=30) for _ in range(cls.ORDERS))
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=1, price=product.price)
+            for order in orders
+            for product in products
+        )
+        # Every other order has two payments; the newest one must be reported
+        paid = orders[::2]
+        Payment.objects.bulk_create(
+            Payment(user=customer, order=order, method="esewa", amount=30, status="failed") for order in paid
+        )
+        Payment.objects.bulk_create(
+            Payment(user=customer, order=order, method="khalti", amount=30, status="success") for order in paid
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def test_list_query_count_is_constant(self):
+        # orders+user, items, products, latest payment per order; full also loads every image
+        for profile, expected in (("compact", 4), ("full", 5)):
+            with self.subTest(profile=profile), self.assertNumQueries(expected):
+                response = self.client.get(f"/api/orders/orders/?profile={profile}")
+            self.assertEqual(len(response.json()), self.ORDERS)
+            product = response.json()[0]["items"][0]["product"]
+            image = product["image"] if profile == "compact" else product["images"][0]["image"]
+            self.assertEqual(image, f'{product["slug"]}.jpg')
+
+    def test_reports_latest_payment(self):
+        orders = self.client.get("/api/orders/orders/").json()
+        with_payment = [o["payment_details"] for o in orders if o["payment_details"]]
+        self.assertEqual(len(with_payment), self.ORDERS // 2)
+        self.assertEqual({p["method"] for p in with_payment}, {"khalti"})
+        self.assertEqual(sum(1 for o in orders if o["payment_details"] is None), self.ORDERS // 2)
+
+    def test_admin_list_is_paginated_with_summary(self):
+        self.client.force_authenticate(self.admin)
+        # summary aggregate + the four compact listing queries
+        with self.assertNumQueries(5):
+            response = self.client.get("/api/orders/orders/?page_size=100")
+        body = response.json()
+        self.assertEqual(len(body["results"]), 100)
+        self.assertIsNotNone(body["next"])
+        self.assertEqual(body["summary"]["count"], self.ORDERS)
+
+        seen = len(body["results"])
+        while body["next"]:
+            body = self.client.get(body["next"]).json()
+            seen += len(body["results"])
+        self.assertEqual(seen, self.ORDERS)
+
+    def test_admin_list_filters(self):
+        self.client.force_authenticate(self.admin)
+        Order.objects.filter(pk__in=Payment.objects.filter(status="success").values("order")).update(
+            is_paid=True, status="paid"
+        )
+        body = self.client.get("/api/orders/orders/?payment_method=khalti&is_paid=true").json()
+        self.assertEqual(body["summary"]["count"], self.ORDERS // 2)
+        self.assertEqual(body["summary"]["paid_ratio"], 1.0)
+        self.assertEqual(body["summary"]["revenue"], str(30 * self.ORDERS // 2) + ".00")
+
+        body = self.client.get(f"/api/orders/orders/?status=pending&user={self.customer.pk}").json()
+        self.assertEqual(body["summary"]["count"], self.ORDERS // 2)
+        self.assertEqual(body["summary"]["paid_count"], 0)
+
+        body = self.client.get("/api/orders/orders/?created_before=2000-01-01").json()
+        self.assertEqual(body["summary"]["count"], 0)
+        self.assertEqual(self.client.get("/api/orders/orders/?created_after=yesterday").status_code, 400)
+
+
+class CartTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", "buyer@example.com", "pw")
+        self.products = [
+            Product.objects.create(title=f"P{i}", slug=f"p{i}", price=10 * (i + 1), inventory=50) for i in range(4)
+        ]
+        for product in self.products:
+            ProductImage.objects.create(product=product, image=f"{product.slug}.jpg", is_primary=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _cart(self):
+        return dict(CartItem.objects.filter(user=self.user).values_list("product_id", "quantity"))
+
+    def test_batch_collapses_operations_per_product(self):
+        p0, p1, p2, p3 = (p.pk for p in self.products)
+        CartItem.objects.create(user=self.user, product_id=p0, quantity=2)
+        CartItem.objects.create(user=self.user, product_id=p2, quantity=1)
+        apply_cart_operations(self.user, [
+            {"op": "add", "product": p0, "quantity": 3},
+            {"op": "add", "product": p1, "quantity": 1},
+            {"op": "add", "product": p1, "quantity": 1},
+            {"op": "remove", "product": p2},
+            {"op": "add", "product": p2, "quantity": 4},
+            {"op": "set", "product": p3, "quantity": 5},
+            {"op": "add", "product": p3, "quantity": 1},
+        ])
+        self.assertEqual(self._cart(), {p0: 5, p1: 2, p2: 4, p3: 6})
+        apply_cart_operations(self.user, [{"op": "set", "product": p3, "quantity": 0}])
+        self.assertNotIn(p3, self._cart())
+
+    def test_batch_endpoint_writes_in_constant_queries(self):
+        operations = [{"op": "add", "product": p.pk, "quantity": 2} for p in self.products]
+        # products, images, savepoint, insert, increment, release, lines; the summary is worked out from them
+        with self.assertNumQueries(7):
+            response = self.client.post("/api/orders/cart/batch/", {"operations": operations}, format="json")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(len(body["items"]), 4)
+        self.assertEqual(body["items"][0]["product_details"]["images"][0]["image"], "p0.jpg")
+        self.assertEqual(body["summary"], {"lines": 4, "units": 8, "subtotal": "200.00"})
+
+        # Lines the batch did not touch are loaded for the response too
+        operations = [{"op": "set", "product": self.products[0].pk, "quantity": 1}]
+        body = self.client.post("/api/orders/cart/batch/", {"operations": operations}, format="json").json()
+        self.assertEqual([item["product_details"]["slug"] for item in body["items"]], ["p0", "p1", "p2", "p3"])
+        self.assertEqual(body["summary"], cart_summary(self.user))
+
+    def test_batch_rejects_unknown_products(self):
+        response = self.client.post(
+            "/api/orders/cart/batch/",
+            {"operations": [{"product": self.products[0].pk}, {"product": 999999}, {"op": "remove", "product": 888}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([bool(e) for e in response.json()["operations"]], [False, True, False])
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_add_increments_existing_line(self):
+        for _ in range(2):
+            # product, images, savepoint, insert, increment, release, the line
+            with self.assertNumQueries(7):
+                response = self.client.post("/api/orders/cart/", {"product": self.products[0].pk, "quantity": 2})
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["quantity"], 4)
+        self.assertEqual(response.json()["product_details"]["images"][0]["image"], "p0.jpg")
+        self.assertEqual(cart_summary(self.user), {"lines": 1, "units": 4, "subtotal": "40.00"})
+        self.assertEqual(self.client.post("/api/orders/cart/", {"product": 999999}).status_code, 404)
+
+
+class MoneyTests(SimpleTestCase):
+    def test_format_amount_always_has_two_places(self):
+        self.assertEqual(format_amount(1500), "1500.00")
+        self.assertEqual(format_amount("99.5"), "99.50")
+        self.assertEqual(format_amount(0.1), "0.10")
+        self.assertEqual(format_amount(Decimal("2.675")), "2.68")
+        self.assertEqual(format_amount(Decimal("2.665")), "2.66")
+
+    def test_parse_amount_is_lenient(self):
+        self.assertEqual(parse_amount("1500.0"), Decimal("1500.00"))
+        self.assertEqual(parse_amount(" 12 "), Decimal("12.00"))
+        self.assertIsNone(parse_amount(None))
+        self.assertIsNone(parse_amount("n/a"))
+        self.assertIsNone(parse_amount([]))
+
+    def test_paisa_and_line_totals(self):
+        self.assertEqual(to_paisa("1500.50"), 150050)
+        self.assertEqual(to_paisa(Decimal("0.01")), 1)
+        lines = [(Decimal("10.10"), 3), (Decimal("0.05"), 1)]
+        self.assertEqual(sum_lines(lines), Decimal("30.35"))
+        self.assertEqual(str(sum_lines([])), "0.00")
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Hammer a single hot SKU from many threads and check nothing is oversold.
+
+    Needs a database with real row locks (run with DATABASE_URL pointing at
+    PostgreSQL); SQLite's in-memory test database cannot take concurrent writers.
+    """
+
+    # Each worker thread holds a database connection, so a bounded pool keeps the
+    # test under PostgreSQL's default max_connections (100) while the pool works
+    # through many more checkout attempts than there is stock.
+    WORKERS = 20
+    CHECKOUTS = 200
+    STOCK = 25
+
+    def _run_pool(self, attempt):
+        """Start WORKERS threads together and have them share CHECKOUTS calls of `attempt(i)`."""
+        barrier = threading.Barrier(self.WORKERS)
+
+        def worker(first):
+            barrier.wait()
+            try:
+                for i in range(first, self.CHECKOUTS, self.WORKERS):
+                    attempt(i)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_hot_sku_never_oversells(self):
+        user = User.objects.create_user("buyer", "buyer@example.com", "pw")
+        product = Product.objects.create(title="Hot", slug="hot", price=5, inventory=self.STOCK)
+        outcomes, errors = [], []
+
+        def checkout(_):
+            try:
+                with transaction.atomic():
+                    reserve_inventory([(product.pk, 1)])
+                    create_order(user, [(product, 1)], inventory_reserved=True)
+                outcomes.append("ok")
+            except InsufficientInventory:
+                outcomes.append("short")
+            except Exception as exc:  # deadlocks, lock timeouts, ...
+                errors.append(exc)
+
+        self._run_pool(checkout)
+
+        product.refresh_from_db()
+        self.assertEqual(errors, [])
+        self.assertEqual(outcomes.count("ok"), self.STOCK)
+        self.assertEqual(outcomes.count("short"), self.CHECKOUTS - self.STOCK)
+        self.assertEqual(product.inventory, 0)
+        self.assertEqual(Order.objects.count(), self.STOCK)
+
+    def test_overlapping_baskets_do_not_deadlock(self):
+        user = User.objects.create_user("buyer", "buyer@example.com", "pw")
+        first = Product.objects.create(title="A", slug="a", price=5, inventory=self.CHECKOUTS)
+        second = Product.objects.create(title="B", slug="b", price=5, inventory=self.CHECKOUTS)
+        errors = []
+        # Half the baskets list the products in the opposite order
+        baskets = [[(first.pk, 1), (second.pk, 1)], [(second.pk, 1), (first.pk, 1)]]
+
+        def checkout(i):
+            try:
+                with transaction.atomic():
+                    reserve_inventory(baskets[i % 2])
+            except Exception as exc:
+                errors.append(exc)
+
+        self._run_pool(checkout)
+
+        self.assertEqual(errors, [])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.inventory, second.inventory), (0, 0))
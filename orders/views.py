@@ -1,17 +1,27 @@
 from rest_framework import viewsets, permissions, status
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework.response import Response
 from rest_framework.decorators import action, api_view, permission_classes
-from .models import CartItem, Order, OrderItem
+from .cart import ADD, apply_cart_operations, cart_summary, lines_summary
+from .models import CartItem, Order
 from .serializers import (
+    CartBatchSerializer,
     CartItemSerializer,
+    CartOperationSerializer,
+    OrderCompactSerializer,
     OrderSerializer,
     OrderSubmitSerializer,
     OrderAdminWriteSerializer,
+    cart_products,
+    latest_payment_prefetch,
 )
-from django.shortcuts import get_object_or_404
-from products.models import Product
-from decimal import Decimal
+from .inventory import InsufficientInventory, release_order_inventory, reserve_inventory
+from .filters import OrderFilterBackend
+from .pagination import OrderCursorPagination
+from .services import create_order, order_summary
+from .state import CANCELLED, SHIPPED, transition_order
+from django.http.request import MediaType
+from users.auth import is_admin_user
 from django.db import transaction
 
 class CartViewSet(viewsets.ModelViewSet):
@@ -19,44 +29,114 @@ class CartViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return CartItem.objects.filter(user=self.request.user).select_related("product")
+        return (
+            CartItem.objects.filter(user=self.request.user)
+            .select_related("product__category")
+            .prefetch_related("product__images")
+            .order_by("added_at", "id")
+        )
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def _lines(self, products):
+        """The user's cart lines with `products` attached; only products not in it are loaded."""
+        items = list(CartItem.objects.filter(user=self.request.user).order_by("added_at", "id"))
+        missing = {item.product_id for item in items} - products.keys()
+        if missing:
+            products = {**products, **cart_products().in_bulk(missing)}
+        for item in items:
+            item.product = products[item.product_id]
+        return items
+
     def create(self, request, *args, **kwargs):
-        # increment if already exists
-        product_id = request.data.get("product") or request.data.get("product_id")
-        qty = int(request.data.get("quantity", 1))
-        product = get_object_or_404(Product, pk=product_id)
-        obj, created = CartItem.objects.get_or_create(user=request.user, product=product)
-        if not created:
-            obj.quantity = obj.quantity + qty
-            obj.save()
-        else:
-            obj.quantity = qty
-            obj.save()
-        serializer = self.get_serializer(obj)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        # Adding a product already in the cart increments its line
+        operation = CartOperationSerializer(data={
+            "op": ADD,
+            "product": request.data.get("product") or request.data.get("product_id"),
+            "quantity": request.data.get("quantity", 1),
+        })
+        operation.is_valid(raise_exception=True)
+        product_id = operation.validated_data["product"]
+        products = cart_products().in_bulk([product_id])
+        if not products:
+            raise NotFound("No Product matches the given query.")
+        apply_cart_operations(request.user, [operation.validated_data])
+        item = CartItem.objects.get(user=request.user, product_id=product_id)
+        item.product = products[product_id]
+        return Response(self.get_serializer(item).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        """Apply `{"operations": [{"op": "add"|"set"|"remove", "product": id, "quantity": n}, ...]}` in order."""
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        apply_cart_operations(request.user, serializer.validated_data["operations"])
+        items = self._lines(serializer.products)
+        return Response({"items": self.get_serializer(items, many=True).data, "summary": lines_summary(items)})
+
+    @action(detail=False, methods=["get"])
+    def summary(self, request):
+        return Response(cart_summary(request.user))
+
+
 class OrderViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [OrderFilterBackend]
+    pagination_class = OrderCursorPagination
 
     def _is_admin(self, user):
-        return getattr(user, "is_staff", False) or getattr(user, "is_superuser", False) or getattr(user, "is_admin", False)
+        return is_admin_user(user)
 
     def get_queryset(self):
         queryset = Order.objects.all().select_related("user").prefetch_related(
             "items__product",
-            "items__product__images",
-            "payment_set",
+            latest_payment_prefetch(),
         )
+        # Only the full shape lists every product image; compact lines use the product's primary_image_url
+        if self.get_serializer_class() is not OrderCompactSerializer:
+            queryset = queryset.prefetch_related("items__product__images")
         if not self._is_admin(self.request.user):
             queryset = queryset.filter(user=self.request.user)
         return queryset
 
+    @property
+    def paginator(self):
+        # Only the shop-wide admin listing is paginated; a customer's own order
+        # history keeps its plain list shape.
+        if not self._is_admin(self.request.user):
+            return None
+        return super().paginator
+
+    def list(self, request, *args, **kwargs):
+        if not self._is_admin(request.user):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        summary = order_summary(queryset)
+        page = self.paginate_queryset(queryset)
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        response.data["summary"] = summary
+        return response
+
+    def _representation(self):
+        """Pick "compact" or "full" from ?profile= or an Accept profile parameter.
+
+        Lists default to compact; the full nested shape (both product copies per
+        line and the embedded user) is opt-in there and the default for detail.
+        """
+        requested = self.request.query_params.get("profile")
+        accepted = getattr(self.request, "accepted_media_type", None)
+        if not requested and accepted:
+            requested = MediaType(accepted).params.get("profile")
+        if requested in ("compact", "full"):
+            return requested
+        return "compact" if self.action == "list" else "full"
+
     def get_serializer_class(self):
         if self._is_admin(self.request.user) and self.action in {"create", "update", "partial_update"}:
             return OrderAdminWriteSerializer
+        if self._representation() == "compact":
+            return OrderCompactSerializer
         return OrderSerializer
 
     def _ensure_admin(self):
@@ -69,34 +149,65 @@ class OrderViewSet(viewsets.ModelViewSet):
 
     def update(self, request, *args, **kwargs):
         self._ensure_admin()
-        return super().update(request, *args, **kwargs)
+        try:
+            return super().update(request, *args, **kwargs)
+        except InsufficientInventory as exc:
+            return Response(exc.as_response_data(), status=status.HTTP_409_CONFLICT)
 
     def partial_update(self, request, *args, **kwargs):
         self._ensure_admin()
         return super().partial_update(request, *args, **kwargs)
 
+    def perform_update(self, serializer):
+        order = serializer.save()
+        if order.status == "cancelled":
+            release_order_inventory(order.pk)
+
     def destroy(self, request, *args, **kwargs):
         self._ensure_admin()
         return super().destroy(request, *args, **kwargs)
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            release_order_inventory(instance.pk)
+            instance.delete()
+
+    @action(detail=True, methods=["post"])
+    def cancel(self, request, pk=None):
+        """Cancel an unpaid pending order and hand its reserved stock back."""
+        order = self.get_object()
+        with transaction.atomic():
+            if not transition_order(order.pk, CANCELLED):
+                return Response({"detail": "Only unpaid pending orders can be cancelled"}, status=status.HTTP_400_BAD_REQUEST)
+            release_order_inventory(order.pk)
+        return Response({"order_id": order.pk, "status": CANCELLED})
+
+    @action(detail=True, methods=["post"])
+    def ship(self, request, pk=None):
+        """Admin-only: mark a paid order as shipped."""
+        self._ensure_admin()
+        order = self.get_object()
+        if not transition_order(order.pk, SHIPPED):
+            return Response({"detail": "Only paid orders can be shipped"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"order_id": order.pk, "status": SHIPPED})
+
 @api_view(["POST"])
 @permission_classes([permissions.IsAuthenticated])
 def create_order_from_cart(request):
     # Create order from cart items of current user
-    cart_items = CartItem.objects.filter(user=request.user).select_related("product")
-    if not cart_items.exists():
-        return Response({"detail": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST)
-
-    total = Decimal(0)
-    order = Order.objects.create(user=request.user, total=0)
-    for item in cart_items:
-        price = item.product.price
-        OrderItem.objects.create(order=order, product=item.product, quantity=item.quantity, price=price)
-        total += price * item.quantity
-    order.total = total
-    order.save()
-    # clear cart
-    cart_items.delete()
+    try:
+        with transaction.atomic():
+            cart_items = list(CartItem.objects.filter(user=request.user).select_related("product"))
+            if not cart_items:
+                return Response({"detail": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST)
+
+            lines = [(item.product, item.quantity) for item in cart_items]
+            reserve_inventory(lines)
+            order = create_order(request.user, lines, inventory_reserved=True)
+            # clear only the lines that went into the order
+            CartItem.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+    except InsufficientInventory as exc:
+        return Response(exc.as_response_data(), status=status.HTTP_409_CONFLICT)
     return Response({"order_id": order.id, "total": order.total}, status=status.HTTP_201_CREATED)
 
 
@@ -117,15 +228,19 @@ def submit_order(request):
         "shipping_phone": serializer.validated_data["shipping_phone"],
     }
 
-    with transaction.atomic():
-        total = Decimal(0)
-        order = Order.objects.create(user=request.user, total=0, status="pending", is_paid=False, **shipping)
-        for item in items_data:
-            product: Product = item["product"]
-            qty = int(item["quantity"])
-            OrderItem.objects.create(order=order, product=product, quantity=qty, price=product.price)
-            total += product.price * qty
-        order.total = total
-        order.save()
+    lines = [(item["product"], item["quantity"]) for item in items_data]
+    try:
+        with transaction.atomic():
+            reserve_inventory(lines)
+            order = create_order(
+                request.user,
+                lines,
+                status="pending",
+                is_paid=False,
+                inventory_reserved=True,
+                **shipping,
+            )
+    except InsufficientInventory as exc:
+        return Response(exc.as_response_data(), status=status.HTTP_409_CONFLICT)
 
     return Response({"order_id": order.id, "total": str(order.total)}, status=status.HTTP_201_CREATED)
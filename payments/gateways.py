@@ -0,0 +1,149 @@
+"""HTTP clients for talking to payment gateways.
+
+One client per gateway is kept for the life of the process. Each wraps a pooled
+`requests.Session` (keep-alive connections are reused across callbacks), applies
+that gateway's connect/read timeouts, retries transient failures with exponential
+backoff, and sits behind a circuit breaker so a gateway that is down fails fast
+instead of pinning every worker for the full timeout.
+
+Per-gateway settings come from ``settings.PAYMENT_GATEWAY_CLIENTS``; anything not
+configured falls back to ``DEFAULT_CLIENT_OPTIONS``.
+"""
+import asyncio
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_CLIENT_OPTIONS = {
+    "connect_timeout": 3.05,
+    "read_timeout": 10,
+    "retries": 2,
+    "backoff_factor": 0.3,
+    "pool_maxsize": 20,
+    "failure_threshold": 5,
+    "reset_timeout": 30,
+}
+
+
+class GatewayUnavailable(requests.RequestException):
+    """Raised without contacting the gateway while its circuit is open."""
+
+
+class CircuitBreaker:
+    """Open after `failure_threshold` consecutive failures; probe again after `reset_timeout`.
+
+    Once the cool-down has passed the breaker is half-open: the first caller is
+    let through as the probe and everyone else is still turned away until the
+    probe records a success (close) or a failure (open again). A probe that never
+    reports back is given up on after another `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probe_started_at = None
+        self._lock = threading.Lock()
+
+    def _rejects(self, now):
+        if self._opened_at is None:
+            return False
+        if now - self._opened_at < self.reset_timeout:
+            return True
+        return self._probe_started_at is not None and now - self._probe_started_at < self.reset_timeout
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._rejects(time.monotonic())
+
+    def before_call(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._rejects(now):
+                raise GatewayUnavailable("Circuit open")
+            if self._opened_at is not None:
+                self._probe_started_at = now
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_started_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                # (Re)open: a failed half-open probe restarts the cool-down
+                self._opened_at = time.monotonic()
+                self._probe_started_at = None
+
+
+class GatewayClient:
+    def __init__(self, name, **options):
+        opts = {**DEFAULT_CLIENT_OPTIONS, **options}
+        self.name = name
+        self.timeout = (opts["connect_timeout"], opts["read_timeout"])
+        self.breaker = CircuitBreaker(opts["failure_threshold"], opts["reset_timeout"])
+        retry = Retry(
+            total=opts["retries"],
+            backoff_factor=opts["backoff_factor"],
+            status_forcelist=(502, 503, 504),
+            # Verification calls are read-only on the gateway side, so POSTs are safe to retry
+            allowed_methods=frozenset({"GET", "POST"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=opts["pool_maxsize"], max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs) -> requests.Response:
+        self.breaker.before_call()
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self.breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def post(self, url, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    async def apost(self, url, **kwargs) -> requests.Response:
+        """Awaitable POST; runs on a worker thread so several calls can overlap."""
+        return await asyncio.to_thread(self.post, url, **kwargs)
+
+
+_clients: dict[str, GatewayClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_gateway_client(name: str) -> GatewayClient:
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                options = getattr(settings, "PAYMENT_GATEWAY_CLIENTS", {}).get(name, {})
+                client = _clients[name] = GatewayClient(name, **options)
+    return client
+
+
+def reset_gateway_clients():
+    """Drop cached clients, e.g. after changing PAYMENT_GATEWAY_CLIENTS in tests."""
+    with _clients_lock:
+        for client in _clients.values():
+            client.session.close()
+        _clients.clear()
@@ -0,0 +1,108 @@
+"""Starting a payment: one pending payment per order and method, and its signed form.
+
+A customer who clicks "pay" twice, or comes back after closing the gateway tab,
+used to leave another pending Payment behind each time for the callbacks to sift
+through. The pending payment is now the single record of an initiation:
+`pending_payment` upserts it in one statement,
+
+    INSERT ... ON CONFLICT (order_id, method) WHERE status = 'pending' DO UPDATE
+
+against the partial unique ``payment_pending_idx``, so a repeat initiation gets
+the same row back with its transaction uuid and product code already set. A
+changed order total gets a fresh uuid, as the gateway binds a uuid to its amount.
+
+The signed eSewa form is cached for ``PAYMENT_INITIATION_CACHE_TIMEOUT`` seconds
+under a key covering everything signed or sent in it, so a repeat initiation
+hands back the stored form instead of building and signing it again.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.utils import timezone
+
+from orders.money import ZERO, format_amount, quantize
+
+from .models import Payment
+from .state import PENDING
+from .utils import generate_esewa_signature
+
+DEFAULT_FORM_TIMEOUT = 15 * 60
+ESEWA_SIGNED_FIELDS = ("amount", "tax_amount", "total_amount", "transaction_uuid", "product_code")
+_COLUMNS = ("user_id", "order_id", "method", "amount", "status", "transaction_uuid", "product_code", "created_at")
+
+
+def _cache():
+    return caches[getattr(settings, "PAYMENT_INITIATION_CACHE_ALIAS", "default")]
+
+
+def _upsert_sql() -> str:
+    qn = connection.ops.quote_name
+    table = qn(Payment._meta.db_table)
+    returning = ", ".join(qn(field.column) for field in Payment._meta.concrete_fields)
+    # The conflict target repeats the constraint's condition so the partial index is inferred
+    return (
+        f"INSERT INTO {table} ({', '.join(map(qn, _COLUMNS))}) VALUES ({', '.join(['%s'] * len(_COLUMNS))}) "
+        f"ON CONFLICT ({qn('order_id')}, {qn('method')}) WHERE {qn('status')} = '{PENDING}' DO UPDATE SET "
+        f"{qn('transaction_uuid')} = CASE WHEN {table}.{qn('amount')} = EXCLUDED.{qn('amount')} "
+        f"THEN COALESCE({table}.{qn('transaction_uuid')}, EXCLUDED.{qn('transaction_uuid')}) "
+        f"ELSE EXCLUDED.{qn('transaction_uuid')} END, "
+        f"{qn('product_code')} = COALESCE(EXCLUDED.{qn('product_code')}, {table}.{qn('product_code')}), "
+        f"{qn('amount')} = EXCLUDED.{qn('amount')} "
+        f"RETURNING {returning}"
+    )
+
+
+def pending_payment(user, order, method, transaction_uuid=None, product_code=None) -> Payment:
+    """The order's pending `method` payment, created if there is none; `transaction_uuid` is only used for a new one."""
+    values = {
+        "user_id": user.pk,
+        "order_id": order.pk,
+        "method": method,
+        "amount": quantize(order.total),
+        "status": PENDING,
+        "transaction_uuid": transaction_uuid,
+        "product_code": product_code,
+        "created_at": timezone.now(),
+    }
+    params = [
+        Payment._meta.get_field(column).get_db_prep_save(values[column], connection) for column in _COLUMNS
+    ]
+    return next(iter(Payment.objects.raw(_upsert_sql(), params)))
+
+
+def _form_key(payment: Payment, success_url: str, failure_url: str) -> str:
+    parts = (
+        payment.pk, payment.transaction_uuid, format_amount(payment.amount), payment.product_code,
+        settings.ESEWA_MERCHANT_ID, success_url, failure_url,
+    )
+    digest = hashlib.sha256("\0".join(map(str, parts)).encode("utf-8")).hexdigest()
+    return f"payments:initiate:{digest}"
+
+
+def esewa_form(payment: Payment, success_url: str, failure_url: str) -> dict:
+    """Signed eSewa v2 form fields for `payment`, from the cache when it was built before."""
+    key = _form_key(payment, success_url, failure_url)
+    form = _cache().get(key)
+    if form is not None:
+        return form
+
+    total_amount = quantize(payment.amount)
+    tax_amount = ZERO
+    form = {
+        "amount": format_amount(total_amount - tax_amount),
+        "tax_amount": format_amount(tax_amount),
+        "total_amount": format_amount(total_amount),
+        "transaction_uuid": payment.transaction_uuid,
+        "product_code": payment.product_code,
+        "product_service_charge": "0",
+        "product_delivery_charge": "0",
+        "success_url": success_url,
+        "failure_url": failure_url,
+        "merchant_code": settings.ESEWA_MERCHANT_ID,
+        "signed_field_names": ",".join(ESEWA_SIGNED_FIELDS),
+    }
+    form["signature"] = generate_esewa_signature(form, list(ESEWA_SIGNED_FIELDS))
+    _cache().set(key, form, getattr(settings, "PAYMENT_INITIATION_CACHE_TIMEOUT", DEFAULT_FORM_TIMEOUT))
+    return form
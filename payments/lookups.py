@@ -0,0 +1,30 @@
+"""Payment lookups used by the gateway callbacks.
+
+Every callback resolves its Payment through `find_payment`, so the handful of query
+shapes it issues are exactly the ones Payment.Meta indexes:
+
+* ``transaction_uuid = %s`` -- unique index, at most one row.
+* ``order_id = %s AND method = %s ORDER BY created_at DESC, id DESC`` --
+  ``payment_order_method_idx`` serves both the filter and the ordering.
+* the same with ``status = 'pending'`` -- the partial unique ``payment_pending_idx``,
+  which holds the one payment per order and method still waiting on the customer.
+"""
+from .models import Payment
+
+
+def find_payment(method, *, transaction_uuid=None, order_id=None, pending_only=False) -> Payment | None:
+    """Latest `method` payment for a transaction uuid, falling back to the order id."""
+    payments = Payment.objects.filter(method=method)
+    if pending_only:
+        payments = payments.filter(status="pending")
+    if transaction_uuid:
+        payment = payments.filter(transaction_uuid=transaction_uuid).first()
+        if payment:
+            return payment
+    if order_id:
+        try:
+            order_id = int(order_id)
+        except (TypeError, ValueError):
+            return None
+        return payments.filter(order_id=order_id).order_by("-created_at", "-id").first()
+    return None
@@ -0,0 +1,81 @@
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from payments.utils import _evaluate_esewa_response, _parse_esewa_response
+
+# Responses as eSewa sends them (legacy transrec XML, the v2 status JSON, key=value)
+SAMPLES = {
+    "xml_success": "<response>\n<response_code>\nSuccess\n</response_code>\n</response>\n",
+    "xml_failure": "<response>\n<response_code>\nfailure\n</response_code>\n</response>\n",
+    "xml_detailed": (
+        "<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n<response><response_code>Success</response_code>"
+        "<refId>0007ZKM</refId><amount>1500.00</amount><pid>9f1c2a7e-55d4-4b1e-9d0e-1c8f3b2a6e10</pid>"
+        "<scd>EPAYTEST</scd><message>Transaction completed successfully</message></response>"
+    ),
+    "json_v2": json.dumps({
+        "product_code": "EPAYTEST",
+        "transaction_uuid": "9f1c2a7e-55d4-4b1e-9d0e-1c8f3b2a6e10",
+        "total_amount": 1500.0,
+        "status": "COMPLETE",
+        "ref_id": "0007ZKM",
+    }),
+    "json_nested": json.dumps({
+        "response": {
+            "response_code": "Success",
+            "refId": "0007ZKM",
+            "amount": "1500.00",
+            "productId": "9f1c2a7e-55d4-4b1e-9d0e-1c8f3b2a6e10",
+            "merchant": {"code": "EPAYTEST", "name": "Evercart", "branches": ["KTM", "PKR"]},
+            "customer": {"name": "Test User", "mobile": "98XXXXXXXX", "address": {"city": "Kathmandu"}},
+        },
+        "meta": {"requested_at": "2024-01-01T10:00:00+05:45", "channel": "web", "version": "2"},
+    }),
+    "kv": "response_code=Success&refId=0007ZKM&amt=1500.00&pid=9f1c2a7e-55d4-4b1e-9d0e-1c8f3b2a6e10",
+}
+REF_ID = "0007ZKM"
+AMOUNT = "1500.00"
+PID = "9f1c2a7e-55d4-4b1e-9d0e-1c8f3b2a6e10"
+
+
+class Command(BaseCommand):
+    help = "Time and measure the memory of parsing and evaluating recorded eSewa verification responses."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        for name, body in SAMPLES.items():
+            self.stdout.write(json.dumps({
+                "sample": name,
+                "bytes": len(body),
+                "parse_us": self._best_us(lambda: _parse_esewa_response(body), options),
+                "evaluate_us": self._best_us(lambda: _evaluate_esewa_response(body, REF_ID, AMOUNT, PID), options),
+                "peak_bytes": self._peak(lambda: _evaluate_esewa_response(body, REF_ID, AMOUNT, PID)),
+            }))
+
+    @staticmethod
+    def _best_us(call, options):
+        best = None
+        for _ in range(options["repeat"]):
+            started = time.perf_counter()
+            for _ in range(options["iterations"]):
+                call()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return round(best / options["iterations"] * 1e6, 2)
+
+    @staticmethod
+    def _peak(call):
+        call()  # warm caches (compiled patterns, interned strings) outside the measurement
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            call()
+            return tracemalloc.get_traced_memory()[1] - baseline
+        finally:
+            tracemalloc.stop()
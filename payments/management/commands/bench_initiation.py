@@ -0,0 +1,52 @@
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from orders.models import Order
+from payments.models import Payment
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Queries, time and pending payments left behind by repeated payment initiations of one order."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--initiations", type=int, default=200)
+        parser.add_argument("--methods", default="esewa,bank")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                user = get_user_model().objects.create_user("bench-pay", "bench-pay@example.com", "bench")
+                order = Order.objects.create(user=user, total=1500, inventory_reserved=True)
+                client = APIClient(SERVER_NAME="localhost")
+                client.force_authenticate(user)
+                for method in options["methods"].split(","):
+                    self._run(client, order, method, options["initiations"])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, client, order, method, initiations):
+        data = {"method": method, "order_id": order.pk}
+        client.post("/api/payments/initiate/", data)  # first initiation creates the payment
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(initiations):
+                client.post("/api/payments/initiate/", data)
+            elapsed = time.perf_counter() - started
+        self.stdout.write(json.dumps({
+            "method": method,
+            "initiations": initiations + 1,
+            "queries_per_repeat": round(len(queries) / initiations, 2),
+            "us_per_repeat": round(elapsed / initiations * 1e6, 1),
+            "pending_payments": Payment.objects.filter(order=order, method=method, status="pending").count(),
+        }))
@@ -0,0 +1,21 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from payments.queue import Worker
+
+
+class Command(BaseCommand):
+    help = "Process queued payment verifications (see payments.queue)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--poll-interval", type=float, default=1.0)
+        parser.add_argument("--worker-id", default=None)
+        parser.add_argument("--until-idle", action="store_true", help="Exit once no job is ready to run.")
+
+    def handle(self, *args, **options):
+        worker = Worker(poll_interval=options["poll_interval"], worker_id=options["worker_id"])
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: worker.stop())
+        self.stdout.write(f"{worker.worker_id} processing {worker.concurrency}")
+        worker.run(until_idle=options["until_idle"])
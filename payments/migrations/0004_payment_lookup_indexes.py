@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-18 00:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def clear_duplicate_uuids(apps, schema_editor):
+    """Blank uuids become NULL and only the newest payment keeps a repeated uuid."""
+    Payment = apps.get_model("payments", "Payment")
+    Payment.objects.filter(transaction_uuid="").update(transaction_uuid=None)
+    seen = set()
+    rows = (
+        Payment.objects.exclude(transaction_uuid=None)
+        .order_by("transaction_uuid", "-created_at", "-id")
+        .values_list("id", "transaction_uuid")
+    )
+    duplicates = []
+    for pk, transaction_uuid in rows.iterator():
+        if transaction_uuid in seen:
+            duplicates.append(pk)
+        seen.add(transaction_uuid)
+    Payment.objects.filter(pk__in=duplicates).update(transaction_uuid=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_order_listing_indexes'),
+        ('payments', '0003_payment_verification_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_duplicate_uuids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='payment',
+            name='transaction_uuid',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['order', 'method', '-created_at', '-id'], name='payment_order_method_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['order', 'method'], name='payment_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:25
+
+from django.db import migrations, models
+
+
+def fail_duplicate_pending(apps, schema_editor):
+    """Only the newest pending payment per order and method stays pending."""
+    Payment = apps.get_model("payments", "Payment")
+    seen = set()
+    rows = (
+        Payment.objects.filter(status="pending")
+        .order_by("order_id", "method", "-created_at", "-id")
+        .values_list("id", "order_id", "method")
+    )
+    duplicates = []
+    for pk, order_id, method in rows.iterator():
+        if (order_id, method) in seen:
+            duplicates.append(pk)
+        seen.add((order_id, method))
+    Payment.objects.filter(pk__in=duplicates).update(status="failed")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_payment_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_pending, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='payment',
+            name='payment_pending_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('order', 'method'), name='payment_pending_idx'),
+        ),
+    ]
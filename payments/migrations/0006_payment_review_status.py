@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_single_pending_payment'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('verifying', 'Verifying'), ('success', 'Success'), ('failed', 'Failed'), ('review', 'Needs review')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0006_payment_review_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VerificationGateway',
+            fields=[
+                ('gateway', models.CharField(choices=[('esewa', 'eSewa'), ('khalti', 'Khalti'), ('fonepay', 'Fonepay'), ('bank', 'Bank Transfer')], max_length=20, primary_key=True, serialize=False)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
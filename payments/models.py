@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from orders.models import Order
 
 User = settings.AUTH_USER_MODEL
@@ -13,8 +14,10 @@ class Payment(models.Model):
     )
     STATUS_CHOICES = (
         ("pending", "Pending"),
+        ("verifying", "Verifying"),
         ("success", "Success"),
         ("failed", "Failed"),
+        ("review", "Needs review"),
     )
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
@@ -22,9 +25,70 @@ class Payment(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     ref_id = models.CharField(max_length=255, blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
-    transaction_uuid = models.CharField(max_length=64, blank=True, null=True)
+    transaction_uuid = models.CharField(max_length=64, unique=True, blank=True, null=True)
     product_code = models.CharField(max_length=64, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Callback lookups, see payments.lookups
+        indexes = [
+            models.Index(fields=["order", "method", "-created_at", "-id"], name="payment_order_method_idx"),
+        ]
+        constraints = [
+            # At most one payment awaiting the customer per order and method; initiation
+            # upserts against it (payments.initiation) and the lookups read through it
+            models.UniqueConstraint(
+                fields=["order", "method"],
+                name="payment_pending_idx",
+                condition=models.Q(status="pending"),
+            ),
+        ]
+
     def __str__(self):
         return f"{self.user} - {self.method} - {self.status}"
+
+
+class VerificationJob(models.Model):
+    """A gateway callback waiting to be verified by a payments worker (see payments.queue)."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+    payment = models.ForeignKey(Payment, related_name="verification_jobs", on_delete=models.CASCADE)
+    gateway = models.CharField(max_length=20, choices=Payment.PAYMENT_METHODS)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["gateway", "status", "available_at"], name="verifyjob_claim_idx"),
+            models.Index(fields=["payment", "status"], name="verifyjob_payment_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.gateway} job #{self.pk} ({self.status})"
+
+
+class VerificationGateway(models.Model):
+    """One row per gateway, locked while a worker counts and claims its jobs (see payments.queue)."""
+
+    gateway = models.CharField(max_length=20, choices=Payment.PAYMENT_METHODS, primary_key=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.gateway
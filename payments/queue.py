@@ -0,0 +1,226 @@
+"""Database-backed queue for payment verification.
+
+Callback views only record what the gateway sent (`enqueue_verification`) and
+return; `run_payment_worker` processes do the remote verification. No broker is
+involved: workers claim rows from VerificationJob with SELECT ... FOR UPDATE SKIP
+LOCKED where the database supports it, and a per-claim token plus a conditional
+UPDATE everywhere else, so a job is only ever run by one worker at a time.
+
+Concurrency is bounded per gateway across all workers: a worker only claims as
+many jobs as the gateway's limit minus the jobs already running. Counting and
+claiming happen under a lock on the gateway's VerificationGateway row, so two
+workers cannot both see the same free slots.
+"""
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Payment, VerificationGateway, VerificationJob
+from .state import begin_verification, settle_failure, settle_success
+from .verification import FAILED, HANDLERS, RETRY, SUCCESS, cached_outcome
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = {"esewa": 8, "khalti": 4, "fonepay": 4}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def gateway_concurrency() -> dict[str, int]:
+    return {**DEFAULT_CONCURRENCY, **_setting("PAYMENT_VERIFY_CONCURRENCY", {})}
+
+
+def enqueue_verification(payment: Payment, payload: dict) -> tuple[VerificationJob | None, bool]:
+    """Settle the callback, or move the payment to verifying and queue it for a worker.
+
+    Only the callback whose conditional UPDATE wins the move to verifying goes
+    on; a duplicate delivery or racing redirect stops after that one statement.
+    The winner is settled on the spot when the gateway's answers are already
+    stored (payments.results), with no job and no gateway call, and otherwise
+    gets a job. Either way a late success reopens a failed payment the same way.
+    Returns ``(job, True)`` when a job was created, else ``(None, False)``. With
+    PAYMENT_VERIFY_INLINE the job is processed before returning, which is handy
+    for local development without a worker.
+    """
+    outcome = cached_outcome(payment, payload)
+    if outcome is not None:
+        if outcome.state == FAILED and payment.status == "failed":
+            return None, False  # nothing to reopen
+        if begin_verification(payment):
+            if outcome.state == SUCCESS:
+                settle_success(payment, ref_id=outcome.ref_id, transaction_uuid=outcome.transaction_uuid)
+            else:
+                settle_failure(payment)
+        return None, False
+    with transaction.atomic():
+        if not begin_verification(payment):
+            return None, False
+        job = VerificationJob.objects.create(payment=payment, gateway=payment.method, payload=payload)
+    if _setting("PAYMENT_VERIFY_INLINE", False):
+        claimed = claim_jobs(payment.method, limit=1, worker_id="inline", job_ids=[job.pk])
+        for claimed_job in claimed:
+            process_job(claimed_job)
+    return job, True
+
+
+def _requeue_stale(gateway, now):
+    lease = timedelta(seconds=_setting("PAYMENT_VERIFY_LEASE_SECONDS", 120))
+    VerificationJob.objects.filter(
+        gateway=gateway, status=VerificationJob.RUNNING, locked_at__lt=now - lease
+    ).update(status=VerificationJob.QUEUED, locked_by="", locked_at=None)
+
+
+def _lock_gateway(gateway, now):
+    """Hold the gateway's row until the transaction ends.
+
+    An UPDATE rather than SELECT ... FOR UPDATE: it is a row lock on PostgreSQL
+    and MySQL and also takes SQLite's write lock, before anything is counted.
+    """
+    if not VerificationGateway.objects.filter(gateway=gateway).update(claimed_at=now):
+        VerificationGateway.objects.get_or_create(gateway=gateway)
+        VerificationGateway.objects.filter(gateway=gateway).update(claimed_at=now)
+
+
+def claim_jobs(gateway, limit, worker_id, job_ids=None) -> list[VerificationJob]:
+    now = timezone.now()
+    _requeue_stale(gateway, now)
+    with transaction.atomic():
+        _lock_gateway(gateway, now)
+        running = VerificationJob.objects.filter(gateway=gateway, status=VerificationJob.RUNNING).count()
+        slots = min(limit, gateway_concurrency().get(gateway, limit) - running)
+        if slots <= 0:
+            return []
+        candidates = VerificationJob.objects.filter(
+            gateway=gateway, status=VerificationJob.QUEUED, available_at__lte=now
+        )
+        if job_ids is not None:
+            candidates = candidates.filter(pk__in=job_ids)
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates.order_by("available_at", "id").values_list("id", flat=True)[:slots])
+        if not ids:
+            return []
+        token = f"{worker_id}:{uuid.uuid4().hex[:12]}"
+        VerificationJob.objects.filter(pk__in=ids, status=VerificationJob.QUEUED).update(
+            status=VerificationJob.RUNNING, locked_by=token, locked_at=now, attempts=F("attempts") + 1
+        )
+    return list(
+        VerificationJob.objects.select_related("payment").filter(locked_by=token, status=VerificationJob.RUNNING)
+    )
+
+
+def _retry_delay(attempts) -> timedelta:
+    base = _setting("PAYMENT_VERIFY_RETRY_BASE_SECONDS", 5)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 15 * 60))
+
+
+def process_job(job: VerificationJob) -> str:
+    """Verify one claimed job and settle it. Returns the outcome state."""
+    payment = job.payment
+    handler = HANDLERS.get(job.gateway)
+    error = ""
+    if payment.status == "success":
+        outcome_state, details = SUCCESS, {"note": "already settled"}
+    elif handler is None:
+        outcome_state, details = FAILED, {"error": f"no handler for {job.gateway}"}
+    else:
+        try:
+            outcome = handler(payment, job.payload)
+            outcome_state, details = outcome.state, outcome.details
+            if outcome.state == SUCCESS:
+                settle_success(payment, ref_id=outcome.ref_id, transaction_uuid=outcome.transaction_uuid)
+        except Exception as exc:  # a crashing verifier must not take the worker down
+            logger.exception("Verification job %s crashed", job.pk)
+            outcome_state, details, error = RETRY, {}, repr(exc)
+
+    done = {"locked_by": "", "locked_at": None, "last_error": error}
+    if outcome_state == RETRY and job.attempts < _setting("PAYMENT_VERIFY_MAX_ATTEMPTS", 5):
+        VerificationJob.objects.filter(pk=job.pk).update(
+            status=VerificationJob.QUEUED,
+            available_at=timezone.now() + _retry_delay(job.attempts),
+            result={"outcome": RETRY, "details": _jsonable(details)},
+            **done,
+        )
+        return RETRY
+
+    job_status = VerificationJob.DONE
+    if outcome_state == RETRY:
+        # Out of attempts: give up on the gateway and fail the payment
+        job_status, outcome_state = VerificationJob.FAILED, FAILED
+    if outcome_state == FAILED:
+        settle_failure(payment)
+    VerificationJob.objects.filter(pk=job.pk).update(
+        status=job_status,
+        result={"outcome": outcome_state, "details": _jsonable(details)},
+        **done,
+    )
+    return outcome_state
+
+
+def _jsonable(details):
+    return {key: value if isinstance(value, (str, int, float, bool, type(None), dict, list)) else str(value)
+            for key, value in (details or {}).items()}
+
+
+class Worker:
+    """Claims jobs for every gateway and runs them on per-gateway thread pools."""
+
+    def __init__(self, poll_interval=1.0, worker_id=None):
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"worker-{uuid.uuid4().hex[:8]}"
+        self.concurrency = gateway_concurrency()
+        self.executors = {
+            gateway: ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f"verify-{gateway}")
+            for gateway, limit in self.concurrency.items()
+        }
+        self.in_flight = {gateway: 0 for gateway in self.concurrency}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def _run(self, gateway, job):
+        try:
+            process_job(job)
+        finally:
+            with self._lock:
+                self.in_flight[gateway] -= 1
+            connection.close()
+
+    def run_once(self) -> int:
+        claimed = 0
+        for gateway, limit in self.concurrency.items():
+            with self._lock:
+                free = limit - self.in_flight[gateway]
+            if free <= 0:
+                continue
+            for job in claim_jobs(gateway, free, self.worker_id):
+                with self._lock:
+                    self.in_flight[gateway] += 1
+                self.executors[gateway].submit(self._run, gateway, job)
+                claimed += 1
+        return claimed
+
+    def run(self, until_idle=False):
+        while not self._stopping.is_set():
+            claimed = self.run_once()
+            busy = any(self.in_flight.values())
+            if until_idle and not claimed and not busy:
+                break
+            if not claimed:
+                self._stopping.wait(self.poll_interval)
+        self.shutdown()
+
+    def stop(self):
+        self._stopping.set()
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
@@ -0,0 +1,66 @@
+"""Remembered gateway verification answers.
+
+A gateway's answer for a given ``(gateway, ref_id, pid)`` does not change once
+it is final, yet the same reference is presented again and again: the browser
+redirect and the server callback, a page refresh, the failure fallback, and
+every candidate pid of an eSewa lookup. Answers are kept in the cache alias
+``PAYMENT_RESULT_CACHE_ALIAS`` together with the amount that was verified, and
+only reused for that same amount.
+
+Confirmed payments are kept for ``PAYMENT_RESULT_TTL`` seconds. Rejections are
+kept only for ``PAYMENT_NEGATIVE_RESULT_TTL`` seconds, because the gateway may
+still be settling them. Transport and gateway errors are never stored. Point the
+alias at a shared backend so web processes see what the workers learned.
+"""
+import hashlib
+from decimal import InvalidOperation
+
+from django.conf import settings
+from django.core.cache import caches
+
+from orders.money import format_amount
+
+DEFAULT_TTL = 24 * 3600
+DEFAULT_NEGATIVE_TTL = 60
+
+
+def _cache():
+    return caches[getattr(settings, "PAYMENT_RESULT_CACHE_ALIAS", "default")]
+
+
+def _key(gateway, ref_id, pid):
+    digest = hashlib.sha256(f"{gateway}\0{ref_id}\0{pid}".encode("utf-8")).hexdigest()
+    return f"payments:verify:{digest}"
+
+
+def _amount(amount) -> str:
+    try:
+        return format_amount(amount)
+    except InvalidOperation:
+        return str(amount)
+
+
+def get_results(gateway, ref_id, pids, amount) -> dict:
+    """Stored ``(is_valid, details)`` answers for whichever of `pids` have one for `amount`."""
+    keys = {_key(gateway, ref_id, pid): pid for pid in pids}
+    amount = _amount(amount)
+    found = {}
+    for key, record in _cache().get_many(list(keys)).items():
+        if record["amount"] == amount:
+            found[keys[key]] = (record["valid"], record["details"])
+    return found
+
+
+def get_result(gateway, ref_id, pid, amount):
+    return get_results(gateway, ref_id, [pid], amount).get(pid)
+
+
+def store_result(gateway, ref_id, pid, amount, valid, details) -> None:
+    if (details or {}).get("error"):
+        return  # transient: ask the gateway again next time
+    if valid:
+        timeout = getattr(settings, "PAYMENT_RESULT_TTL", DEFAULT_TTL)
+    else:
+        timeout = getattr(settings, "PAYMENT_NEGATIVE_RESULT_TTL", DEFAULT_NEGATIVE_TTL)
+    record = {"amount": _amount(amount), "valid": valid, "details": details or {}}
+    _cache().set(_key(gateway, ref_id, pid), record, timeout)
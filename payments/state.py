@@ -0,0 +1,82 @@
+"""Payment status transitions, and what each one does to the order.
+
+    pending --> verifying --> success --> review (the order could not take it)
+       |            |
+       +------------+-------> failed --> verifying (a late success callback)
+
+Like orders.state, every transition is a single conditional UPDATE on the
+expected source states. Whichever caller's UPDATE matches the row owns the
+transition and its side effects: marking the order paid or handing its stock
+back. Duplicate callbacks and concurrent workers find nothing to update and
+stop there. `begin_verification` is the gate in front of the gateway: only
+the callback that moves the payment to verifying gets a verification job.
+
+A confirmed payment whose order can no longer be paid (cancelled meanwhile, or
+already paid by another payment) ends in review: the customer was charged for
+nothing, so it is logged for a refund instead of being reported as a success.
+"""
+import logging
+
+from django.db import transaction
+
+from orders.inventory import release_order_inventory
+from orders.state import mark_paid
+
+from .models import Payment
+
+PENDING = "pending"
+VERIFYING = "verifying"
+SUCCESS = "success"
+FAILED = "failed"
+REVIEW = "review"
+
+TRANSITIONS = {
+    PENDING: (VERIFYING, SUCCESS, FAILED),
+    VERIFYING: (SUCCESS, FAILED),
+    FAILED: (VERIFYING,),
+    SUCCESS: (REVIEW,),
+    REVIEW: (),
+}
+# Statuses at which a new callback has nothing left to start
+IN_FLIGHT = (VERIFYING, SUCCESS, REVIEW)
+
+logger = logging.getLogger(__name__)
+
+
+def sources(target: str) -> tuple[str, ...]:
+    return tuple(state for state, targets in TRANSITIONS.items() if target in targets)
+
+
+def transition(payment_id, target: str, from_states=None, **fields) -> bool:
+    """Move the payment to `target` from `from_states` (default: every allowed source)."""
+    allowed = sources(target)
+    if from_states is not None:
+        allowed = tuple(state for state in from_states if state in allowed)
+    return bool(Payment.objects.filter(pk=payment_id, status__in=allowed).update(status=target, **fields))
+
+
+def begin_verification(payment: Payment) -> bool:
+    return transition(payment.pk, VERIFYING)
+
+
+@transaction.atomic
+def settle_success(payment: Payment, ref_id=None, transaction_uuid=None) -> bool:
+    """Record a confirmed payment and mark its order paid; False if either was not this call's to settle."""
+    if not transition(payment.pk, SUCCESS, **({"ref_id": ref_id} if ref_id else {})):
+        return False
+    if mark_paid(payment.order_id, transaction_id=ref_id, transaction_uuid=transaction_uuid):
+        return True
+    transition(payment.pk, REVIEW)
+    logger.warning(
+        "Payment %s (%s, ref %s) was confirmed but order %s can no longer be paid; needs a refund",
+        payment.pk, payment.method, ref_id, payment.order_id,
+    )
+    return False
+
+
+@transaction.atomic
+def settle_failure(payment: Payment, from_states=None) -> bool:
+    if not transition(payment.pk, FAILED, from_states=from_states):
+        return False
+    release_order_inventory(payment.order_id, unpaid_only=True)
+    return True
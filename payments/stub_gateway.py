@@ -0,0 +1,96 @@
+"""A throwaway local HTTP server that impersonates the payment gateways.
+
+Tests (or a developer running the frontend offline) point ESEWA_VERIFY_URL /
+KHALTI_VERIFY_URL at it and queue canned responses per path:
+
+    with StubGateway() as gateway:
+        gateway.respond("/esewa", "<response><response_code>Success</response_code></response>")
+        settings.ESEWA_VERIFY_URL = gateway.url("/esewa")
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class StubGateway:
+    def __init__(self, host="127.0.0.1", port=0):
+        self._responses = defaultdict(deque)
+        self._defaults = {}
+        self._lock = threading.Lock()
+        self.requests = []
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path="/"):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{path}"
+
+    def respond(self, path, body="", status=200, delay=0.0, times=None, content_type="text/plain"):
+        """Serve `body` on `path`; once `times` responses are used up, fall back to the default."""
+        response = (status, body, delay, content_type)
+        with self._lock:
+            if times is None:
+                self._defaults[path] = response
+            else:
+                self._responses[path].extend([response] * times)
+
+    def _next_response(self, path):
+        with self._lock:
+            queue = self._responses[path]
+            if queue:
+                return queue.popleft()
+            return self._defaults.get(path, (404, "", 0.0, "text/plain"))
+
+    def _handler_class(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length).decode("utf-8") if length else ""
+                with gateway._lock:
+                    gateway.requests.append({
+                        "method": self.command,
+                        "path": self.path,
+                        "headers": dict(self.headers),
+                        "form": {key: values[-1] for key, values in parse_qs(raw).items()},
+                    })
+                status, body, delay, content_type = gateway._next_response(self.path)
+                if delay:
+                    time.sleep(delay)
+                payload = body.encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up (e.g. a timeout test); nothing to report
+                    self.close_connection = True
+
+            do_GET = do_POST = _serve
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
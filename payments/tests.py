@@ -1,3 +1,463 @@
-from django.test import TestCase
+import base64
+import hashlib
+import hmac
+import threading
+import time
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from orders.inventory import reserve_inventory
+from orders.models import Order
+from orders.services import create_order
+from orders.state import transition_order
+from products.models import Product
+
+from .gateways import CircuitBreaker, GatewayUnavailable, reset_gateway_clients
+from .initiation import pending_payment
+from .lookups import find_payment
+from .models import Payment, VerificationJob
+from .queue import claim_jobs, process_job
+from .results import store_result
+from .state import settle_failure, settle_success, transition
+from .stub_gateway import StubGateway
+from .utils import (
+    _evaluate_esewa_response,
+    _parse_esewa_response,
+    verify_esewa,
+    verify_esewa_candidates,
+    verify_khalti,
+)
+
+User = get_user_model()
+
+ESEWA_SUCCESS = (
+    "<response><response_code>Success</response_code>"
+    "<amount>100.00</amount><refId>REF-1</refId></response>"
+)
+ESEWA_FAILURE = "<response><response_code>failure</response_code></response>"
+
+
+class StubGatewayMixin:
+    """Runs a stub gateway and points the verification URLs at it."""
+
+    client_options = {
+        "esewa": {"retries": 2, "backoff_factor": 0, "failure_threshold": 3, "reset_timeout": 60},
+        "khalti": {"retries": 0, "read_timeout": 0.2},
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.gateway = StubGateway().start()
+        cls.addClassCleanup(cls.gateway.stop)
+
+    def setUp(self):
+        cache.clear()  # remembered gateway answers, see payments.results
+        self.gateway.requests.clear()
+        self.gateway._responses.clear()
+        self.gateway._defaults.clear()
+        overrides = override_settings(
+            ESEWA_VERIFY_URL=self.gateway.url("/esewa"),
+            KHALTI_VERIFY_URL=self.gateway.url("/khalti"),
+            PAYMENT_GATEWAY_CLIENTS=self.client_options,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        reset_gateway_clients()
+        self.addCleanup(reset_gateway_clients)
+
+
+class GatewayClientTests(StubGatewayMixin, SimpleTestCase):
+    def test_esewa_success(self):
+        self.gateway.respond("/esewa", ESEWA_SUCCESS)
+        ok, details = verify_esewa("REF-1", "100", "pid-1")
+        self.assertTrue(ok)
+        self.assertEqual(details["amount"], "100.00")
+        self.assertEqual(self.gateway.requests[0]["form"], {"amt": "100.00", "rid": "REF-1", "pid": "pid-1", "scd": "EPAYTEST"})
+
+    def test_answers_are_remembered_per_amount(self):
+        self.gateway.respond("/esewa", ESEWA_SUCCESS)
+        self.assertTrue(verify_esewa("REF-1", "100", "pid-1")[0])
+        self.assertTrue(verify_esewa("REF-1", 100, "pid-1")[0])
+        self.assertEqual(len(self.gateway.requests), 1)
+        self.assertFalse(verify_esewa("REF-1", "5", "pid-1")[0])
+        self.assertEqual(len(self.gateway.requests), 2)
+
+    def test_transient_errors_are_retried(self):
+        self.gateway.respond("/esewa", "busy", status=503, times=2)
+        self.gateway.respond("/esewa", ESEWA_SUCCESS)
+        ok, _ = verify_esewa("REF-1", "100", "pid-1")
+        self.assertTrue(ok)
+        self.assertEqual(len(self.gateway.requests), 3)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        self.gateway.respond("/esewa", "down", status=500)
+        for _ in range(3):
+            verify_esewa("REF-1", "100", "pid-1")
+        calls = len(self.gateway.requests)
+
+        ok, details = verify_esewa("REF-1", "100", "pid-1")
+        self.assertFalse(ok)
+        self.assertEqual(details, {"error": "network_error"})
+        self.assertEqual(len(self.gateway.requests), calls)
+
+    def test_candidates_are_verified_concurrently(self):
+        self.gateway.respond("/esewa", ESEWA_FAILURE, delay=0.3)
+        started = time.perf_counter()
+        results = verify_esewa_candidates("REF-1", "100", ["a", "b", "c"])
+        elapsed = time.perf_counter() - started
+        self.assertEqual([ok for ok, _ in results], [False, False, False])
+        self.assertEqual(sorted(r["form"]["pid"] for r in self.gateway.requests), ["a", "b", "c"])
+        self.assertLess(elapsed, 0.6)
+
+    def test_khalti_times_out(self):
+        self.gateway.respond("/khalti", '{"state": {"name": "Completed"}}', delay=0.5, content_type="application/json")
+        self.assertFalse(verify_khalti("token", "10"))
+
+    def test_khalti_success(self):
+        self.gateway.respond("/khalti", '{"state": {"name": "Completed"}}', content_type="application/json")
+        self.assertTrue(verify_khalti("token", "10"))
+        self.assertEqual(self.gateway.requests[0]["form"]["amount"], "1000")
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def _open_breaker(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertRaises(GatewayUnavailable, breaker.before_call)
+        time.sleep(0.06)
+        return breaker
+
+    def test_one_probe_after_the_timeout(self):
+        breaker = self._open_breaker()
+        callers = 20
+        barrier = threading.Barrier(callers)
+        admitted, rejected = [], []
+
+        def call():
+            barrier.wait()
+            try:
+                breaker.before_call()
+                admitted.append(1)
+            except GatewayUnavailable:
+                rejected.append(1)
+
+        threads = [threading.Thread(target=call) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((len(admitted), len(rejected)), (1, callers - 1))
+
+        breaker.record_success()
+        breaker.before_call()
+        breaker.before_call()
+        self.assertFalse(breaker.is_open)
+
+    def test_failed_probe_reopens(self):
+        breaker = self._open_breaker()
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertRaises(GatewayUnavailable, breaker.before_call)
+        time.sleep(0.06)
+        breaker.before_call()  # the next probe
+        self.assertRaises(GatewayUnavailable, breaker.before_call)
+
+
+class EsewaParserTests(SimpleTestCase):
+    def test_each_format_yields_the_verifier_keys(self):
+        expected = {"response_code": "Success", "refid": "R1", "amt": "10.00"}
+        bodies = [
+            '{"response": {"response_code": "Success", "refId": "R1", "amt": "10.00"}, "meta": {"channel": "web"}}',
+            "<response><response_code>Success</response_code><refId>R1</refId><amt>10.00</amt><scd>X</scd></response>",
+            "response_code=Success&refId=R1 amt=10.00&scd=X",
+        ]
+        for body in bodies:
+            self.assertEqual(_parse_esewa_response(body), expected)
+
+    def test_unrecognised_bodies(self):
+        self.assertEqual(_parse_esewa_response("  "), {})
+        self.assertEqual(_parse_esewa_response("{not json"), {"message": "{not json"})
+        self.assertEqual(_parse_esewa_response("<p>hi</p>"), {})
+        self.assertEqual(_parse_esewa_response("<refId>A&amp;B</refId>"), {"refid": "A&B"})
+
+    def test_status_free_bodies_fall_back_to_the_raw_hint(self):
+        self.assertTrue(_evaluate_esewa_response("SUCCESS", "R1", "10", "pid")[0])
+        self.assertFalse(_evaluate_esewa_response("Success? no, failed", "R1", "10", "pid")[0])
+
+
+class VerificationQueueTests(StubGatewayMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("buyer", "buyer@example.com", "pw")
+        self.product = Product.objects.create(title="Phone", slug="phone", price=100, inventory=3)
+        reserve_inventory([(self.product, 1)])
+        self.order = create_order(self.user, [(self.product, 1)], inventory_reserved=True)
+        self.payment = Payment.objects.create(
+            user=self.user, order=self.order, method="esewa", amount=100, transaction_uuid="uuid-1"
+        )
+        self.client = APIClient()
+
+    def _callback(self):
+        return self.client.get(
+            "/api/payments/esewa-verify/", {"refId": "REF-1", "amt": "100", "oid": self.order.pk, "uuid": "uuid-1"}
+        )
+
+    def _work(self):
+        return [process_job(job) for job in claim_jobs("esewa", 10, "test")]
+
+    def test_callback_only_records_and_redirects(self):
+        response = self._callback()
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(f"order_id={self.order.pk}", response["Location"])
+        self.assertEqual(self.gateway.requests, [])
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "verifying")
+        self.assertEqual(VerificationJob.objects.get().payload["ref_id"], "REF-1")
+
+    def test_worker_settles_payment_and_order(self):
+        self.gateway.respond("/esewa", ESEWA_SUCCESS)
+        self._callback()
+        self._callback()  # duplicate delivery reuses the queued job
+        self.assertEqual(VerificationJob.objects.count(), 1)
+        self.assertEqual(self._work(), ["success"])
+
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.ref_id), ("success", "REF-1"))
+        self.assertTrue(self.order.is_paid)
+        self.assertEqual(self.order.status, "paid")
+
+        self.client.force_authenticate(self.user)
+        polled = self.client.get("/api/payments/status/", {"order_id": self.order.pk}).json()
+        self.assertEqual((polled["status"], polled["is_paid"]), ("success", True))
+
+    def test_duplicate_callback_costs_one_lookup(self):
+        self._callback()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self._callback().status_code, 302)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(VerificationJob.objects.count(), 1)
+
+    def test_settling_is_idempotent(self):
+        self.assertTrue(settle_success(self.payment, ref_id="REF-1"))
+        self.assertFalse(settle_success(self.payment, ref_id="REF-2"))
+        self.assertFalse(settle_failure(self.payment))
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual((self.payment.status, self.order.transaction_id), ("success", "REF-1"))
+        self.assertEqual((self.order.status, self.order.inventory_reserved), ("paid", True))
+
+    def test_success_for_a_cancelled_order_goes_to_review(self):
+        self.assertTrue(transition_order(self.order.pk, "cancelled"))
+        with self.assertLogs("payments.state", "WARNING"):
+            self.assertFalse(settle_success(self.payment, ref_id="REF-1"))
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.ref_id), ("review", "REF-1"))
+        self.assertEqual((self.order.status, self.order.is_paid), ("cancelled", False))
+        self.assertFalse(settle_success(self.payment, ref_id="REF-1"))
+
+        response = self._callback()  # a late duplicate callback queues nothing and reports failure
+        self.assertIn("/payment/failure", response["Location"])
+        self.assertFalse(VerificationJob.objects.exists())
+
+    def test_rejected_payment_fails_and_releases_stock(self):
+        self.gateway.respond("/esewa", ESEWA_FAILURE)
+        self._callback()
+        self.assertEqual(self._work(), ["failed"])
+        self.payment.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.payment.status, "failed")
+        self.assertEqual(self.product.inventory, 3)
+
+    def test_repeat_callback_uses_the_stored_answer(self):
+        self.gateway.respond("/esewa", ESEWA_FAILURE)
+        self._callback()
+        self.assertEqual(self._work(), ["failed"])
+        requests_made = len(self.gateway.requests)
+
+        response = self._callback()
+        self.assertIn("/payment/failure", response["Location"])
+        self.assertEqual(len(self.gateway.requests), requests_made)
+        self.assertEqual(VerificationJob.objects.count(), 1)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "failed")
+
+    def test_stored_late_success_reopens_a_failed_payment(self):
+        self.gateway.respond("/esewa", ESEWA_FAILURE)
+        self._callback()
+        self.assertEqual(self._work(), ["failed"])
+        # eSewa settles after all: the answer is known before this callback arrives
+        for pid in ("uuid-1", str(self.order.pk)):
+            store_result("esewa", "REF-1", pid, "100", True, {})
+        requests_made = len(self.gateway.requests)
+
+        response = self._callback()
+        self.assertIn(f"order_id={self.order.pk}", response["Location"])
+        self.assertNotIn("/payment/failure", response["Location"])
+        self.assertEqual(len(self.gateway.requests), requests_made)
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.ref_id), ("success", "REF-1"))
+        self.assertTrue(self.order.is_paid)
+
+    def test_gateway_outage_is_retried_later(self):
+        self.gateway.respond("/esewa", "down", status=500)
+        self._callback()
+        self.assertEqual(self._work(), ["retry"])
+        job = VerificationJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (VerificationJob.QUEUED, 1))
+        self.assertEqual(self._work(), [])  # backing off
+
+    def test_inline_mode_answers_synchronously(self):
+        self.gateway.respond("/khalti", '{"state": {"name": "Completed"}}', content_type="application/json")
+        self.payment.method = "khalti"
+        self.payment.save()
+        self.client.force_authenticate(self.user)
+        with override_settings(PAYMENT_VERIFY_INLINE=True):
+            response = self.client.post(
+                "/api/payments/khalti-verify/", {"token": "tok", "amount": "100", "order_id": self.order.pk}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.transaction_id, "tok")
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentClaimTests(TransactionTestCase):
+    """Workers claiming at once never run more jobs for a gateway than its limit.
+
+    Needs a database with real row locks (run with DATABASE_URL pointing at
+    PostgreSQL); SQLite's in-memory test database cannot take concurrent writers.
+    """
+
+    WORKERS = 10
+    LIMIT = 3
+
+    def test_claims_respect_the_gateway_limit(self):
+        user = User.objects.create_user("buyer", "buyer@example.com", "pw")
+        order = create_order(user, [])
+        for i in range(20):
+            payment = Payment.objects.create(user=user, order=order, method="esewa", amount=10, status="failed")
+            VerificationJob.objects.create(payment=payment, gateway="esewa")
+        barrier = threading.Barrier(self.WORKERS)
+        claimed, errors = [], []
+
+        def worker(i):
+            barrier.wait()
+            try:
+                claimed.extend(claim_jobs("esewa", self.LIMIT, f"worker-{i}"))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        with override_settings(PAYMENT_VERIFY_CONCURRENCY={"esewa": self.LIMIT}):
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.WORKERS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(claimed), self.LIMIT)
+        self.assertEqual(VerificationJob.objects.filter(status=VerificationJob.RUNNING).count(), self.LIMIT)
+
+
+class PaymentInitiationTests(TestCase):
+    def setUp(self):
+        cache.clear()  # signed forms, see payments.initiation
+        self.user = User.objects.create_user("buyer", "buyer@example.com", "pw")
+        self.product = Product.objects.create(title="Phone", slug="phone", price=100, inventory=3)
+        reserve_inventory([(self.product, 1)])
+        self.order = create_order(self.user, [(self.product, 1)], inventory_reserved=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _initiate(self, method="esewa"):
+        response = self.client.post("/api/payments/initiate/", {"method": method, "order_id": self.order.pk})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_repeat_initiation_reuses_the_pending_payment_and_form(self):
+        first = self._initiate()["params"]
+        with CaptureQueriesContext(connection) as queries:
+            second = self._initiate()["params"]
+        self.assertEqual(second, first)
+        self.assertEqual(len(queries), 2)  # the order and the upsert
+        payment = Payment.objects.get()
+        self.assertEqual((payment.transaction_uuid, payment.product_code), (first["transaction_uuid"], "EPAYTEST"))
+
+        message = ",".join(f"{field}={first[field]}" for field in first["signed_field_names"].split(","))
+        digest = hmac.new(b"8gBm/:&EnhH.1/q", message.encode(), hashlib.sha256).digest()
+        self.assertEqual(first["signature"], base64.b64encode(digest).decode())
+        self.assertEqual(first["total_amount"], "100.00")
+
+    def test_new_total_gets_a_new_uuid(self):
+        first = self._initiate()["params"]
+        Order.objects.filter(pk=self.order.pk).update(total=120)
+        second = self._initiate()["params"]
+        self.assertNotEqual(second["transaction_uuid"], first["transaction_uuid"])
+        self.assertEqual(second["total_amount"], "120.00")
+        self.assertEqual(Payment.objects.get().transaction_uuid, second["transaction_uuid"])
+
+    def test_cancelled_orders_take_no_payment(self):
+        self.assertEqual(self.client.post(f"/api/orders/orders/{self.order.pk}/cancel/").status_code, 200)
+        response = self.client.post("/api/payments/initiate/", {"method": "esewa", "order_id": self.order.pk})
+        self.assertEqual(response.status_code, 400)
+        self.product.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual((self.product.inventory, self.order.inventory_reserved), (3, False))
+        self.assertFalse(Payment.objects.exists())
+
+    def test_unknown_or_missing_method_is_rejected_first(self):
+        # An order whose stock was handed back would be reserved again by a valid initiation
+        Order.objects.filter(pk=self.order.pk).update(inventory_reserved=False)
+        for data in ({"method": "bogus", "order_id": self.order.pk}, {"order_id": self.order.pk}):
+            with self.subTest(data=data):
+                response = self.client.post("/api/payments/initiate/", data)
+                self.assertEqual(response.status_code, 400)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 2)
+        self.assertFalse(Payment.objects.exists())
+
+    def test_settled_payments_are_not_reused(self):
+        payment = pending_payment(self.user, self.order, "bank")
+        self.assertEqual(pending_payment(self.user, self.order, "bank").pk, payment.pk)
+        transition(payment.pk, "failed")
+        self._initiate("bank")
+        self._initiate("esewa")
+        statuses = sorted(Payment.objects.values_list("method", "status"))
+        self.assertEqual(statuses, [("bank", "failed"), ("bank", "pending"), ("esewa", "pending")])
+
+
+class PaymentLookupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", "buyer@example.com", "pw")
+        self.order = create_order(self.user, [])
+        self.older = Payment.objects.create(user=self.user, order=self.order, method="esewa", amount=10, transaction_uuid="a")
+        self.newer = Payment.objects.create(user=self.user, order=self.order, method="esewa", amount=10, status="failed")
+
+    def test_uuid_wins_then_newest_for_order(self):
+        self.assertEqual(find_payment("esewa", transaction_uuid="a", order_id=self.order.pk), self.older)
+        self.assertEqual(find_payment("esewa", transaction_uuid="missing", order_id=self.order.pk), self.newer)
+        self.assertEqual(find_payment("esewa", order_id=self.order.pk, pending_only=True), self.older)
+        self.assertIsNone(find_payment("khalti", order_id=self.order.pk))
+        self.assertIsNone(find_payment("esewa", order_id="not-a-number"))
+
+    @skipUnless(connection.vendor == "sqlite", "plan text is SQLite specific")
+    def test_lookups_use_payment_indexes(self):
+        by_order = Payment.objects.filter(method="esewa", order_id=self.order.pk).order_by("-created_at", "-id")
+        self.assertIn("payment_order_method_idx", by_order.explain())
+        self.assertNotIn("TEMP B-TREE", by_order.explain())
+        pending = Payment.objects.filter(method="bank", order_id=self.order.pk, status="pending")
+        self.assertIn("payment_pending_idx", pending.explain())
+        self.assertIn("transaction_uuid", Payment.objects.filter(transaction_uuid="a").explain())
@@ -6,6 +6,7 @@ from .views import (
     fonepay_verify,
     initiate_payment,
     khalti_verify,
+    payment_status,
 )
 
 urlpatterns = [
@@ -15,4 +16,5 @@ urlpatterns = [
     path("khalti-verify/", khalti_verify, name="khalti_verify"),
     path("fonepay-verify/", fonepay_verify, name="fonepay_verify"),
     path("bank-confirm/", bank_confirm, name="bank_confirm"),
+    path("status/", payment_status, name="payment_status"),
 ]
@@ -1,119 +1,128 @@
+import asyncio
 import base64
 import hashlib
 import hmac
 import json
 import re
-from decimal import Decimal, InvalidOperation
+from decimal import Decimal
 from typing import Any, Dict, Tuple, Union
-from xml.etree import ElementTree
+from xml.sax.saxutils import unescape as xml_unescape
 
 import requests
 from django.conf import settings
 
-def _format_amount(value: Union[str, float, Decimal, int]) -> str:
-    decimal_value = value if isinstance(value, Decimal) else Decimal(str(value))
-    quantized = decimal_value.quantize(Decimal('0.01'))
-    text = format(quantized, 'f')
-    # eSewa expects amounts with two decimal places even for whole numbers.
-    if '.' not in text:
-        text = f"{text}.00"
-    else:
-        fractional = text.split('.')[-1]
-        if len(fractional) == 1:
-            text = f"{text}0"
-    return text or '0'
-
-def _normalize_amount(amount: Union[str, float, Decimal, int, None]) -> Decimal | None:
-    if amount is None:
-        return None
-    try:
-        return (amount if isinstance(amount, Decimal) else Decimal(str(amount))).quantize(Decimal('0.01'))
-    except (InvalidOperation, ValueError, TypeError):
-        return None
+from orders.money import format_amount, parse_amount, to_paisa
 
+from .gateways import get_gateway_client
+from .results import get_results, get_result, store_result
 
-def _parse_esewa_response(body: str) -> Dict[str, Any]:
-    """Attempt to parse eSewa verification response into a dict with lowercase keys."""
-    body = body.strip()
-    if not body:
-        return {}
+# The only response fields the verifier reads (see _evaluate_esewa_response and
+# payments.verification); everything else eSewa sends is dropped while parsing.
+ESEWA_RESPONSE_KEYS = frozenset({
+    'status', 'responsecode', 'response_code',
+    'amount', 'amt', 'totalamount', 'total_amount',
+    'refid', 'referenceid', 'reference_id',
+    'productid', 'product_id', 'productcode', 'product_code', 'pid', 'transaction_uuid',
+    'oid', 'orderid', 'order_id',
+})
+_XML_ELEMENT = re.compile(r'<([A-Za-z_][\w.-]*)[^>/]*>([^<]*)</\1\s*>')
+_KV_SEPARATOR = re.compile(r'[&\s]+')
+_SUCCESS_HINT = re.compile('success', re.IGNORECASE)
+_FAILURE_HINT = re.compile('fail', re.IGNORECASE)
 
-    # Try JSON first
-    try:
-        parsed_json = json.loads(body)
-        if isinstance(parsed_json, dict):
-            result: Dict[str, Any] = {}
-            # Flatten nested "response" payloads commonly returned by eSewa
-            stacks = [parsed_json]
-            while stacks:
-                node = stacks.pop()
-                for key, value in node.items():
-                    if isinstance(value, dict):
-                        stacks.append(value)
-                    else:
-                        result[key.lower()] = value
-            return result
-    except json.JSONDecodeError:
-        pass
 
-    # Try XML payload
-    try:
-        root = ElementTree.fromstring(body)
-        result: Dict[str, Any] = {}
-        for element in root.iter():
-            if element is root:
+def _pick_json(document: dict) -> Dict[str, Any]:
+    # Nested "response" objects are flattened; deeper values win, as before
+    result: Dict[str, Any] = {}
+    stack = [document]
+    while stack:
+        node = stack.pop()
+        for key, value in node.items():
+            if isinstance(value, dict):
+                stack.append(value)
                 continue
-            if element.text is not None:
-                result[element.tag.lower()] = element.text
-        if result:
-            return result
-    except ElementTree.ParseError:
-        pass
+            key = key.lower()
+            if key in ESEWA_RESPONSE_KEYS:
+                result[key] = value
+    return result
+
 
-    # Fallback for key=value responses separated by & or whitespace
+def _pick_xml(body: str) -> Dict[str, Any] | None:
+    """Leaf elements of a flat XML document, or None when there are none at all."""
     result: Dict[str, Any] = {}
-    normalized = body.replace('\n', '&')
-    for part in re.split(r'[&\\s]+', normalized):
-        if '=' in part:
-            key, value = part.split('=', 1)
-            result[key.strip().lower()] = value.strip()
-    if not result and body:
+    matched = False
+    for match in _XML_ELEMENT.finditer(body):
+        matched = True
+        key = match.group(1).lower()
+        if key in ESEWA_RESPONSE_KEYS:
+            text = match.group(2)
+            result[key] = xml_unescape(text) if '&' in text else text
+    return result if matched else None
+
+
+def _pick_kv(body: str) -> Dict[str, Any]:
+    result: Dict[str, Any] = {}
+    for part in _KV_SEPARATOR.split(body):
+        key, sep, value = part.partition('=')
+        if sep:
+            key = key.strip().lower()
+            if key in ESEWA_RESPONSE_KEYS:
+                result[key] = value.strip()
+    if not result:
         result['message'] = body
     return result
 
 
-def verify_esewa(ref_id: str, amount: Union[str, float, Decimal, int], pid: str) -> Tuple[bool, Dict[str, Any]]:
-    """Verify eSewa payment using transaction reference and identifier (pid).
+def _parse_esewa_response(body: str) -> Dict[str, Any]:
+    """Parse an eSewa verification response into a dict of the lowercase keys the verifier uses.
 
-    Returns a tuple of (is_success, response_details) where response_details contains any
-    parsed values returned by eSewa for downstream validation.
+    The format is picked from the first character (``{`` JSON, ``<`` XML, anything
+    else ``key=value`` pairs separated by ``&`` or whitespace) and the body is parsed
+    once; a body that fails its sniffed format is read as key=value pairs.
     """
+    body = body.strip()
+    if not body:
+        return {}
+    first = body[0]
+    if first == '{':
+        try:
+            document = json.loads(body)
+        except ValueError:
+            document = None
+        if isinstance(document, dict):
+            return _pick_json(document)
+    elif first == '<':
+        result = _pick_xml(body)
+        if result is not None:
+            return result
+    return _pick_kv(body)
 
-    payload = {
-        'amt': _format_amount(amount),
+
+def _esewa_verify_payload(ref_id: str, amount: Union[str, float, Decimal, int], pid: str) -> Dict[str, str]:
+    return {
+        'amt': format_amount(amount),
         'rid': ref_id,
         'pid': pid,
         'scd': settings.ESEWA_MERCHANT_ID,
     }
 
-    try:
-        resp = requests.post(settings.ESEWA_VERIFY_URL, data=payload, timeout=10)
-    except requests.RequestException:
-        return False, {'error': 'network_error'}
 
-    body = resp.text.strip()
+def _evaluate_esewa_response(body: str, ref_id: str, amount, pid: str) -> Tuple[bool, Dict[str, Any]]:
+    body = body.strip()
     parsed = _parse_esewa_response(body)
 
     status_value = str(parsed.get('status') or parsed.get('responsecode') or parsed.get('response_code') or '').strip().lower()
-    raw_upper = body.upper()
-    success_hint = 'SUCCESS' in raw_upper and 'FAIL' not in raw_upper
-    is_success = status_value == 'success' or (not status_value and success_hint)
+    if status_value:
+        is_success = status_value == 'success'
+    else:
+        # No status field: fall back to scanning the raw body
+        is_success = bool(_SUCCESS_HINT.search(body)) and not _FAILURE_HINT.search(body)
 
     if not is_success:
         return False, {'raw': body, 'parsed': parsed}
 
-    expected_amount = _normalize_amount(amount)
-    response_amount = _normalize_amount(
+    expected_amount = parse_amount(amount)
+    response_amount = parse_amount(
         parsed.get('amount')
         or parsed.get('amt')
         or parsed.get('totalamount')
@@ -150,16 +159,87 @@ def verify_esewa(ref_id: str, amount: Union[str, float, Decimal, int], pid: str)
 
     return True, details
 
+
+def _request_esewa(ref_id: str, amount: Union[str, float, Decimal, int], pid: str) -> Tuple[bool, Dict[str, Any]]:
+    payload = _esewa_verify_payload(ref_id, amount, pid)
+    try:
+        resp = get_gateway_client('esewa').post(settings.ESEWA_VERIFY_URL, data=payload)
+    except requests.RequestException:
+        return False, {'error': 'network_error'}
+    if resp.status_code >= 500:
+        return False, {'error': 'gateway_error', 'status_code': resp.status_code}
+    return _evaluate_esewa_response(resp.text, ref_id, amount, pid)
+
+
+async def averify_esewa(ref_id: str, amount: Union[str, float, Decimal, int], pid: str) -> Tuple[bool, Dict[str, Any]]:
+    """Awaitable `verify_esewa`; shares the same pooled client and circuit breaker."""
+    payload = _esewa_verify_payload(ref_id, amount, pid)
+    try:
+        resp = await get_gateway_client('esewa').apost(settings.ESEWA_VERIFY_URL, data=payload)
+    except requests.RequestException:
+        return False, {'error': 'network_error'}
+    if resp.status_code >= 500:
+        return False, {'error': 'gateway_error', 'status_code': resp.status_code}
+    return _evaluate_esewa_response(resp.text, ref_id, amount, pid)
+
+
+def verify_esewa_candidates(ref_id: str, amount, pids: list[str]) -> list[Tuple[bool, Dict[str, Any]]]:
+    """Verify every candidate pid concurrently; results are returned in `pids` order.
+
+    Pids with a stored answer (see payments.results) are not sent to eSewa again.
+    """
+    known = get_results('esewa', ref_id, pids, amount)
+    missing = [pid for pid in pids if pid not in known]
+    if len(missing) == 1:
+        fresh = [_request_esewa(ref_id, amount, missing[0])]
+    elif missing:
+        async def _gather():
+            return await asyncio.gather(*(averify_esewa(ref_id, amount, pid) for pid in missing))
+
+        fresh = asyncio.run(_gather())
+    else:
+        fresh = []
+    for pid, (is_valid, details) in zip(missing, fresh):
+        store_result('esewa', ref_id, pid, amount, is_valid, details)
+        known[pid] = (is_valid, details)
+    return [known[pid] for pid in pids]
+
+
+def verify_esewa(ref_id: str, amount: Union[str, float, Decimal, int], pid: str) -> Tuple[bool, Dict[str, Any]]:
+    """Verify eSewa payment using transaction reference and identifier (pid).
+
+    Returns a tuple of (is_success, response_details) where response_details contains any
+    parsed values returned by eSewa for downstream validation.
+    """
+    return verify_esewa_candidates(ref_id, amount, [pid])[0]
+
 def verify_khalti(token, amount):
+    known = get_result('khalti', token, '', amount)
+    if known is not None:
+        return known[0]
+    is_valid, details = _request_khalti(token, amount)
+    store_result('khalti', token, '', amount, is_valid, details)
+    return is_valid
+
+
+def _request_khalti(token, amount) -> Tuple[bool, Dict[str, Any]]:
     headers = {
         'Authorization': f'Key {settings.KHALTI_SECRET_KEY}'
     }
     payload = {
         'token': token,
-        'amount': int(Decimal(amount) * 100)
+        'amount': to_paisa(amount)
     }
-    resp = requests.post(settings.KHALTI_VERIFY_URL, data=payload, headers=headers)
-    return resp.status_code == 200 and resp.json().get("state", {}).get("name") == "Completed"
+    try:
+        resp = get_gateway_client('khalti').post(settings.KHALTI_VERIFY_URL, data=payload, headers=headers)
+    except requests.RequestException:
+        return False, {'error': 'network_error'}
+    if resp.status_code >= 500:
+        return False, {'error': 'gateway_error', 'status_code': resp.status_code}
+    try:
+        return resp.status_code == 200 and resp.json().get("state", {}).get("name") == "Completed", {}
+    except ValueError:
+        return False, {}
 
 def generate_fonepay_checksum(data_dict):
     """Simple checksum generator"""
@@ -172,12 +252,27 @@ def verify_fonepay(tran_id):
     return True
 
 
+# HMAC-SHA256 keyed with each eSewa secret seen, copied per signature so the key is only set up once
+_signing_keys: dict[str, hmac.HMAC] = {}
+
+
+def _esewa_signing_key(secret: str) -> hmac.HMAC:
+    key = _signing_keys.get(secret)
+    if key is None:
+        key = _signing_keys[secret] = hmac.new(secret.encode('utf-8'), digestmod=hashlib.sha256)
+    return key
+
+
+def esewa_signature_message(payload: dict, signed_fields: list[str]) -> str:
+    return ','.join(f"{field}={payload[field]}" for field in signed_fields)
+
+
 def generate_esewa_signature(payload: dict, signed_fields: list[str]) -> str:
     """Create base64 encoded HMAC-SHA256 signature for eSewa requests."""
     secret = getattr(settings, "ESEWA_SECRET_KEY", "")
     if not secret:
         raise ValueError("ESEWA_SECRET_KEY is not configured")
 
-    message = ','.join(f"{field}={payload[field]}" for field in signed_fields)
-    digest = hmac.new(secret.encode('utf-8'), message.encode('utf-8'), hashlib.sha256).digest()
-    return base64.b64encode(digest).decode('utf-8')
+    mac = _esewa_signing_key(secret).copy()
+    mac.update(esewa_signature_message(payload, signed_fields).encode('utf-8'))
+    return base64.b64encode(mac.digest()).decode('utf-8')
@@ -0,0 +1,121 @@
+"""Gateway verification for recorded payment callbacks.
+
+Each handler receives a Payment and the payload stored by its callback view and
+returns an Outcome; it never mutates anything itself. Outcomes are applied through
+payments.state, whose conditional UPDATEs make processing the same callback twice
+(a retried job, a duplicate delivery) leave the Payment and Order exactly as
+processing it once.
+"""
+from dataclasses import dataclass, field
+
+from .models import Payment
+from .results import get_result, get_results
+from .utils import verify_esewa_candidates, verify_fonepay, verify_khalti
+
+SUCCESS = "success"
+FAILED = "failed"
+RETRY = "retry"
+
+
+@dataclass
+class Outcome:
+    state: str
+    ref_id: str | None = None
+    transaction_uuid: str | None = None
+    details: dict = field(default_factory=dict)
+
+
+def _esewa_candidate_pids(payment: Payment, payload: dict) -> list[str]:
+    oid = payload.get("oid") or payment.order_id
+    transaction_uuid = payload.get("transaction_uuid")
+    candidate_pids: list[str] = []
+    if transaction_uuid:
+        candidate_pids.append(transaction_uuid)
+    if oid:
+        candidate_pids.append(str(oid))
+    if payment.product_code:
+        candidate_pids.append(payment.product_code)
+    # Ensure uniqueness while preserving order
+    seen = set()
+    return [pid for pid in candidate_pids if not (pid in seen or seen.add(pid))]
+
+
+def _esewa_outcome(payment: Payment, payload: dict, results) -> Outcome:
+    ref_id = payload["ref_id"]
+    oid = payload.get("oid") or payment.order_id
+    transaction_uuid = payload.get("transaction_uuid")
+    for is_valid, details in results:
+        if not is_valid:
+            continue
+        parsed_payload = (details or {}).get("parsed", {})
+        response_oid = parsed_payload.get("oid") or parsed_payload.get("orderid") or parsed_payload.get("order_id")
+        if response_oid and oid and str(response_oid).strip() != str(oid).strip():
+            continue
+        return Outcome(SUCCESS, ref_id=ref_id, transaction_uuid=payment.transaction_uuid or transaction_uuid, details=details)
+
+    last_details = results[-1][1] if results else {}
+    if any(details.get("error") for _, details in results):
+        return Outcome(RETRY, details=last_details)
+    raw_status = str(payload.get("status") or "").strip().lower()
+    parsed_status = str((last_details.get("parsed") or {}).get("status") or "").strip().lower()
+    if "pending" in raw_status or "pending" in parsed_status:
+        # eSewa has not settled the transaction yet; ask again later
+        return Outcome(RETRY, details=last_details)
+    return Outcome(FAILED, details=last_details)
+
+
+def verify_esewa_payment(payment: Payment, payload: dict) -> Outcome:
+    amount = payload.get("amount") or payment.amount
+    results = verify_esewa_candidates(payload["ref_id"], amount, _esewa_candidate_pids(payment, payload))
+    return _esewa_outcome(payment, payload, results)
+
+
+def cached_esewa_outcome(payment: Payment, payload: dict) -> Outcome | None:
+    pids = _esewa_candidate_pids(payment, payload)
+    amount = payload.get("amount") or payment.amount
+    known = get_results("esewa", payload["ref_id"], pids, amount)
+    if len(known) < len(pids):
+        return None
+    return _esewa_outcome(payment, payload, [known[pid] for pid in pids])
+
+
+def verify_khalti_payment(payment: Payment, payload: dict) -> Outcome:
+    token = payload["token"]
+    if verify_khalti(token, payload["amount"]):
+        return Outcome(SUCCESS, ref_id=token)
+    return Outcome(FAILED)
+
+
+def cached_khalti_outcome(payment: Payment, payload: dict) -> Outcome | None:
+    known = get_result("khalti", payload["token"], "", payload["amount"])
+    if known is None:
+        return None
+    return Outcome(SUCCESS, ref_id=payload["token"]) if known[0] else Outcome(FAILED)
+
+
+def verify_fonepay_payment(payment: Payment, payload: dict) -> Outcome:
+    if verify_fonepay(payload.get("prn")):
+        return Outcome(SUCCESS)
+    return Outcome(FAILED)
+
+
+HANDLERS = {
+    "esewa": verify_esewa_payment,
+    "khalti": verify_khalti_payment,
+    "fonepay": verify_fonepay_payment,
+}
+# Same decisions from stored gateway answers only (payments.results); None when one is missing
+CACHED_HANDLERS = {
+    "esewa": cached_esewa_outcome,
+    "khalti": cached_khalti_outcome,
+}
+
+
+def cached_outcome(payment: Payment, payload: dict) -> Outcome | None:
+    """The final outcome of a callback if the gateway's answers for it are already known."""
+    handler = CACHED_HANDLERS.get(payment.method)
+    outcome = handler(payment, payload) if handler else None
+    if outcome is None or outcome.state == RETRY:
+        return None
+    return outcome
+
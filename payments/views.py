@@ -1,5 +1,4 @@
 import uuid
-from decimal import Decimal
 
 from django.conf import settings
 from django.shortcuts import redirect
@@ -9,14 +8,18 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
+from orders import state as order_state
+from orders.inventory import InsufficientInventory, reserve_order_inventory
 from orders.models import Order
+from orders.money import format_amount
+from .initiation import esewa_form, pending_payment
+from .lookups import find_payment
 from .models import Payment
+from .queue import enqueue_verification
+from .state import FAILED, IN_FLIGHT, PENDING, REVIEW, SUCCESS, settle_failure, settle_success
 from .utils import (
-    generate_esewa_signature,
+    esewa_signature_message,
     generate_fonepay_checksum,
-    verify_esewa,
-    verify_fonepay,
-    verify_khalti,
 )
 
 # ---------- INITIATE PAYMENT ----------
@@ -24,73 +27,49 @@ from .utils import (
 @permission_classes([IsAuthenticated])
 def initiate_payment(request):
     method = request.data.get("method")
+    # Checked first: an unknown method must not reserve stock or leave a pending payment
+    if method not in dict(Payment.PAYMENT_METHODS):
+        return Response({"detail": "Invalid method"}, status=status.HTTP_400_BAD_REQUEST)
     order_id = request.data.get("order_id")
     order = Order.objects.filter(id=order_id, user=request.user).first()
 
     if not order:
         return Response({"detail": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
 
-    payment = Payment.objects.create(
-        user=request.user,
-        order=order,
-        method=method,
-        amount=order.total
+    # Cancelled, paid and shipped orders take no new payment (nor stock)
+    if order.status != order_state.PENDING:
+        return Response({"detail": "Only pending orders can be paid"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Stock handed back after a failed payment has to be taken again before retrying
+    if not order.is_paid and not order.inventory_reserved:
+        try:
+            reserve_order_inventory(order)
+        except InsufficientInventory as exc:
+            return Response(exc.as_response_data(), status=status.HTTP_409_CONFLICT)
+
+    esewa = method == "esewa"
+    payment = pending_payment(
+        request.user,
+        order,
+        method,
+        transaction_uuid=str(uuid.uuid4()) if esewa else None,
+        product_code=getattr(settings, "ESEWA_PRODUCT_CODE", settings.ESEWA_MERCHANT_ID) if esewa else None,
     )
 
-    if method == "esewa":
-        transaction_uuid = str(uuid.uuid4())
-        product_code = getattr(settings, "ESEWA_PRODUCT_CODE", settings.ESEWA_MERCHANT_ID)
-
-        def _fmt(value: Decimal | str | float | int) -> str:
-            decimal_value = value if isinstance(value, Decimal) else Decimal(str(value))
-            quantized = decimal_value.quantize(Decimal("0.01"))
-            sval = format(quantized, "f")
-            if "." not in sval:
-                sval = f"{sval}.00"
-            else:
-                fractional = sval.split(".")[-1]
-                if len(fractional) == 1:
-                    sval = f"{sval}0"
-            return sval or "0"
-
-        total_amount_decimal = (
-            order.total if isinstance(order.total, Decimal) else Decimal(str(order.total))
-        ).quantize(Decimal("0.01"))
-        tax_amount_decimal = Decimal("0")
-        base_amount_decimal = (total_amount_decimal - tax_amount_decimal).quantize(Decimal("0.01"))
-
+    if esewa:
+        transaction_uuid = payment.transaction_uuid
         success_callback = request.build_absolute_uri(
             reverse("esewa_verify") + f"?oid={order.id}&uuid={transaction_uuid}"
         )
         failure_callback = request.build_absolute_uri(
             reverse("esewa_fail") + f"?oid={order.id}&uuid={transaction_uuid}"
         )
-
-        payload = {
-            "amount": _fmt(base_amount_decimal),
-            "tax_amount": _fmt(tax_amount_decimal),
-            "total_amount": _fmt(total_amount_decimal),
-            "transaction_uuid": transaction_uuid,
-            "product_code": product_code,
-            "product_service_charge": "0",
-            "product_delivery_charge": "0",
-            "success_url": success_callback,
-            "failure_url": failure_callback,
-            "merchant_code": settings.ESEWA_MERCHANT_ID,
-            "signed_field_names": "amount,tax_amount,total_amount,transaction_uuid,product_code",
-        }
-
-        signed_fields = payload["signed_field_names"].split(",")
-        signature_message = ",".join(f"{field}={payload[field]}" for field in signed_fields)
-        payload["signature"] = generate_esewa_signature(payload, signed_fields)
-
-        payment.transaction_uuid = transaction_uuid
-        payment.product_code = product_code
-        payment.save(update_fields=["transaction_uuid", "product_code"])
+        payload = esewa_form(payment, success_callback, failure_callback)
 
         response_payload = {"url": settings.ESEWA_PAYMENT_URL, "params": payload}
         if getattr(settings, "DEBUG", False):
-            response_payload["debug"] = {"signature_message": signature_message}
+            signed_fields = payload["signed_field_names"].split(",")
+            response_payload["debug"] = {"signature_message": esewa_signature_message(payload, signed_fields)}
 
         return Response(response_payload)
 
@@ -102,29 +81,24 @@ def initiate_payment(request):
         data = {
             "MERCHANT_CODE": settings.FONEPAY_MERCHANT_CODE,
             "PRN": str(order.id),
-            "AMOUNT": str(order.total),
+            "AMOUNT": format_amount(order.total),
             "CURRENCY": "NPR",
         }
         checksum = generate_fonepay_checksum(data)
         data["CHECKSUM"] = checksum
         return Response({"url": settings.FONEPAY_PAYMENT_URL, "params": data})
 
-    elif method == "bank":
+    else:  # bank
         # Generate a bank reference and provide instructions
         reference = f"BANK-{order.id}"
-        payment.method = "bank"
-        payment.save()
         instructions = {
             "reference": reference,
-            "amount": str(order.total),
+            "amount": format_amount(order.total),
             "bank_account": settings.BANK_ACCOUNT_NUMBER if hasattr(settings, "BANK_ACCOUNT_NUMBER") else "<ADD_BANK_ACCOUNT>",
             "bank_name": settings.BANK_NAME if hasattr(settings, "BANK_NAME") else "<BANK_NAME>",
         }
         return Response({"method": "bank", "instructions": instructions})
 
-    else:
-        return Response({"detail": "Invalid method"}, status=status.HTTP_400_BAD_REQUEST)
-
 
 # ---------- VERIFY ESEWA ----------
 def _frontend_success_redirect(order_id: str | int, ref_id: str | None = None) -> str:
@@ -145,9 +119,18 @@ def _frontend_failure_redirect(order_id: str | int | None = None) -> str:
     return f"{base_url}{extras}" if base_url.endswith('/') else f"{base_url}{extras}"
 
 
+def _current_status(payment: Payment) -> str:
+    return Payment.objects.values_list("status", flat=True).get(pk=payment.pk)
+
+
 @api_view(["GET", "POST"])
 @permission_classes([AllowAny])
 def esewa_verify(request):
+    """Record the eSewa callback for background verification and send the user on.
+
+    The frontend lands on the success page with the order id and polls
+    `payment_status` until the worker has settled the payment.
+    """
     data = request.data if request.method == "POST" else request.GET
 
     ref_id = data.get("refId") or data.get("reference_id")
@@ -158,93 +141,26 @@ def esewa_verify(request):
     if not (ref_id and (amt or transaction_uuid) and (oid or transaction_uuid)):
         return redirect(_frontend_failure_redirect(oid))
 
-    payment_qs = Payment.objects.filter(method="esewa")
-    payment = None
-    if transaction_uuid:
-        payment = payment_qs.filter(transaction_uuid=transaction_uuid).order_by("-created_at").first()
-    if not payment and oid:
-        payment = payment_qs.filter(order_id=oid).order_by("-created_at").first()
-    if payment and not oid:
-        oid = payment.order_id
-
-    amount_to_verify = amt or (payment.amount if payment else None)
-    if amount_to_verify is None:
-        return redirect(_frontend_failure_redirect(oid))
-
-    candidate_pids: list[str] = []
-    if transaction_uuid:
-        candidate_pids.append(transaction_uuid)
-    if oid:
-        candidate_pids.append(str(oid))
-    if payment and payment.product_code:
-        candidate_pids.append(payment.product_code)
-    # Ensure uniqueness while preserving order
-    seen = set()
-    candidate_pids = [pid for pid in candidate_pids if not (pid in seen or seen.add(pid))]
-
-    if not candidate_pids:
+    payment = find_payment("esewa", transaction_uuid=transaction_uuid, order_id=oid)
+    if not payment:
         return redirect(_frontend_failure_redirect(oid))
 
-    success = False
-    details: dict[str, object] = {}
-    for pid in candidate_pids:
-        is_valid, details = verify_esewa(ref_id, amount_to_verify, pid)
-        if not is_valid:
-            continue
-
-        parsed_payload = (details or {}).get('parsed', {})
-        response_oid = parsed_payload.get('oid') or parsed_payload.get('orderid') or parsed_payload.get('order_id')
-        if response_oid and oid and str(response_oid).strip() != str(oid).strip():
-            continue
-
-        success = True
-        break
-
-    if success:
-        order_identifier = oid or transaction_uuid or ""
-        if payment:
-            payment.status = "success"
-            payment.ref_id = ref_id
-            payment.save(update_fields=["status", "ref_id"])
-
-            if payment.order:
-                order_obj = payment.order
-                order_obj.status = "paid"
-                order_obj.is_paid = True
-                order_obj.transaction_id = ref_id
-
-                update_fields = ["status", "is_paid", "transaction_id"]
-                desired_uuid = payment.transaction_uuid or transaction_uuid
-                if desired_uuid and order_obj.transaction_uuid != desired_uuid:
-                    order_obj.transaction_uuid = desired_uuid
-                    update_fields.append("transaction_uuid")
-
-                order_obj.save(update_fields=update_fields)
-                order_identifier = order_obj.id
-
-        return redirect(_frontend_success_redirect(order_identifier, ref_id))
-
-    raw_status = str(data.get("status") or "").strip().lower()
-    parsed_status = str((details.get("parsed") or {}).get("status") or "").strip().lower()
-    pending_in_response = "pending" in raw_status or "pending" in parsed_status
-    payment_is_pending = bool(payment and str(payment.status or "").strip().lower() == "pending")
-    pending_order_id = None
-    if payment and payment.order_id:
-        pending_order_id = payment.order_id
-    elif oid:
-        pending_order_id = oid
-    elif transaction_uuid:
-        pending_order_id = transaction_uuid
-
-    if (pending_in_response or payment_is_pending) and pending_order_id:
-        return redirect(_frontend_success_redirect(pending_order_id, ref_id))
-
-    if payment:
-        if payment.status != "failed":
-            payment.status = "failed"
-            payment.save(update_fields=["status"])
+    # Already verifying or settled: a duplicate delivery, nothing more to do
+    if payment.status not in IN_FLIGHT:
+        enqueue_verification(payment, {
+            "ref_id": ref_id,
+            "amount": str(amt) if amt else None,
+            "oid": str(oid) if oid else None,
+            "transaction_uuid": transaction_uuid,
+            "status": data.get("status"),
+        })
+        # Settled from a stored gateway answer, or verified inline
+        if _current_status(payment) in (FAILED, REVIEW):
+            return redirect(_frontend_failure_redirect(payment.order_id))
+    elif payment.status == REVIEW:
+        return redirect(_frontend_failure_redirect(payment.order_id))
 
-    return redirect(_frontend_failure_redirect(oid))
+    return redirect(_frontend_success_redirect(payment.order_id, ref_id))
 
 
 @api_view(["GET", "POST"])
@@ -253,24 +169,38 @@ def esewa_fail(request):
     data = request.data if request.method == "POST" else request.GET
     oid = data.get("oid") or data.get("order_id")
     transaction_uuid = data.get("transaction_uuid") or data.get("uuid")
-    payment_qs = Payment.objects.filter(method="esewa")
-    payment = None
-    if transaction_uuid:
-        payment = payment_qs.filter(transaction_uuid=transaction_uuid).order_by("-created_at").first()
-    if not payment and oid:
-        payment = payment_qs.filter(order_id=oid).order_by("-created_at").first()
+    payment = find_payment("esewa", transaction_uuid=transaction_uuid, order_id=oid)
     if payment:
-        if payment.status == "success":
+        if payment.status == SUCCESS:
             return redirect(_frontend_success_redirect(payment.order_id, payment.ref_id))
-        if payment.status != "failed":
-            payment.status = "failed"
-            payment.save(update_fields=["status"])
+        # A success callback may already be verifying; let the worker settle it
+        if payment.status == PENDING:
+            settle_failure(payment, from_states=(PENDING,))
         fallback_oid = payment.order_id
     else:
         fallback_oid = oid
     return redirect(_frontend_failure_redirect(fallback_oid))
 
 
+def _queued_response(payment: Payment, success_message: str, failure_message: str):
+    """Answer a verification request from the payment's status after enqueueing."""
+    # Only a payment that was just queued (and maybe verified inline) needs re-reading
+    payment_status = payment.status if payment.status in IN_FLIGHT else _current_status(payment)
+    if payment_status == SUCCESS:
+        return Response({"message": success_message})
+    if payment_status == FAILED:
+        return Response({"message": failure_message}, status=400)
+    if payment_status == REVIEW:
+        return Response(
+            {"message": "Payment received for an order that can no longer be paid; it will be refunded"},
+            status=status.HTTP_409_CONFLICT,
+        )
+    return Response(
+        {"message": "Payment is being verified", "payment_id": payment.id, "status": payment_status},
+        status=status.HTTP_202_ACCEPTED,
+    )
+
+
 # ---------- VERIFY KHALTI ----------
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
@@ -279,43 +209,54 @@ def khalti_verify(request):
     amount = request.data.get("amount")
     order_id = request.data.get("order_id")
 
-    success = verify_khalti(token, amount)
-    payment = Payment.objects.filter(order_id=order_id, method="khalti").first()
-
-    if success and payment:
-        payment.status = "success"
-        payment.ref_id = token
-        payment.save()
-        payment.order.status = "paid"
-        payment.order.is_paid = True
-        payment.order.transaction_id = token
-        payment.order.save()
-        return Response({"message": "Khalti Payment Successful"})
-    else:
+    payment = find_payment("khalti", order_id=order_id)
+    if not (token and amount and payment):
         return Response({"message": "Khalti Payment Failed"}, status=400)
 
+    if payment.status not in IN_FLIGHT:
+        enqueue_verification(payment, {"token": token, "amount": str(amount)})
+    return _queued_response(payment, "Khalti Payment Successful", "Khalti Payment Failed")
+
 
 # ---------- VERIFY FONEPAY ----------
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def fonepay_verify(request):
     oid = request.GET.get("prn")
-    success = verify_fonepay(oid)
-    payment = Payment.objects.filter(order_id=oid, method="fonepay").first()
-
-    if success and payment:
-        payment.status = "success"
-        payment.save()
-        payment.order.status = "paid"
-        payment.order.is_paid = True
-        payment.order.save()
-        return Response({"message": "Fonepay Payment Successful"})
-    else:
-        if payment:
-            payment.status = "failed"
-            payment.save()
+    payment = find_payment("fonepay", order_id=oid)
+    if not payment:
         return Response({"message": "Fonepay Payment Failed"}, status=400)
 
+    if payment.status not in IN_FLIGHT:
+        enqueue_verification(payment, {"prn": oid})
+    return _queued_response(payment, "Fonepay Payment Successful", "Fonepay Payment Failed")
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def payment_status(request):
+    """Poll the state of the caller's latest payment for ?order_id= (or a ?payment_id=)."""
+    payments = Payment.objects.filter(user=request.user).select_related("order")
+    payment_id = request.GET.get("payment_id")
+    order_id = request.GET.get("order_id")
+    if payment_id:
+        payment = payments.filter(id=payment_id).first()
+    elif order_id:
+        payment = payments.filter(order_id=order_id).order_by("-created_at", "-id").first()
+    else:
+        return Response({"detail": "order_id or payment_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+    if not payment:
+        return Response({"detail": "Payment not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        "payment_id": payment.id,
+        "order_id": payment.order_id,
+        "method": payment.method,
+        "status": payment.status,
+        "ref_id": payment.ref_id,
+        "order_status": payment.order.status,
+        "is_paid": payment.order.is_paid,
+    })
+
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
@@ -328,17 +269,15 @@ def bank_confirm(request):
         return Response({"detail": "order_id and transaction_id are required"}, status=status.HTTP_400_BAD_REQUEST)
 
     order = Order.objects.filter(id=order_id, user=request.user).first()
-    payment = Payment.objects.filter(order_id=order_id, method="bank").first()
+    if order and order.is_paid:
+        return Response({"message": "Bank payment confirmed"})
+    payment = find_payment("bank", order_id=order_id, pending_only=True)
     if not order or not payment:
         return Response({"detail": "Order/payment not found"}, status=status.HTTP_404_NOT_FOUND)
 
-    payment.status = "success"
-    payment.ref_id = transaction_id
-    payment.save()
-    order.status = "paid"
-    order.is_paid = True
-    order.transaction_id = transaction_id
-    order.save()
+    # A concurrent confirmation may win the conditional update; then the order is paid
+    if not settle_success(payment, ref_id=transaction_id) and _current_status(payment) == REVIEW:
+        return Response({"detail": "Order can no longer be paid; payment needs review"}, status=status.HTTP_409_CONFLICT)
     return Response({"message": "Bank payment confirmed"})
 
 
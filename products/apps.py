@@ -1,6 +1,28 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.models.signals import post_migrate
+
+
+def _install_search_index(sender, using, **kwargs):
+    # SQLite drops triggers whenever a migration rebuilds the products table,
+    # so re-assert them after every migrate run.
+    from django.db import connections
+    from .search import install_search_index
+
+    connection = connections[using]
+    if "products_product" not in connection.introspection.table_names():
+        return
+    with connection.schema_editor() as schema_editor:
+        install_search_index(schema_editor)
 
 
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .cache import check_catalog_cache
+        post_migrate.connect(_install_search_index, sender=self)
+        # Only multi-worker deployments need it shared; locmem is fine for runserver
+        checks.register(check_catalog_cache, deploy=True)
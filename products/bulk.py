@@ -0,0 +1,261 @@
+"""Bulk product import and export for catalog syncs.
+
+Imports read CSV or NDJSON a chunk at a time. Each chunk is validated row by
+row, then written with a fixed number of statements: an upsert keyed on the
+product slug (``INSERT ... ON CONFLICT (slug) DO UPDATE``) for each set of
+columns the rows carry, one DELETE and one bulk INSERT for the images of rows
+that supplied them, and one UPDATE each for the denormalized columns. An
+existing product only has the columns its row contains overwritten: a partial
+row, or a CSV row with blank cells, leaves its stock, category and description
+as they were, and new products take the model defaults for them. Invalid rows are reported and skipped; the rest of the
+file still goes in. Exports stream rows straight from a chunked iterator, so
+memory stays flat whatever the catalog size.
+
+Columns: slug, title, description, price, inventory, category (a category slug)
+and images. In CSV, images is a ``|``-separated list of URLs whose first entry is
+the primary image; in NDJSON it is a list of URLs or ``{"image", "alt_text",
+"is_primary"}`` objects. Rows without an images column keep their current images.
+"""
+import codecs
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.db import transaction
+from rest_framework import serializers
+
+from ecommerce.streaming import csv_line_writer
+
+from .cache import schedule_catalog_bump
+from .facets import refresh_facets
+from .models import Category, Product, ProductImage
+from .read_model import refresh_read_model
+from .signals import catalog_signals_suspended
+
+CSV = "csv"
+NDJSON = "ndjson"
+FORMATS = (CSV, NDJSON)
+COLUMNS = ("slug", "title", "description", "price", "inventory", "category", "images")
+IMAGE_SEPARATOR = "|"
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+UPSERT_FIELDS = ("title", "description", "price", "inventory", "category")
+
+
+class ImportImageSerializer(serializers.Serializer):
+    image = serializers.CharField(max_length=500)
+    alt_text = serializers.CharField(max_length=255, required=False, allow_blank=True, default="")
+    is_primary = serializers.BooleanField(required=False, default=False)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = {"image": data}
+        return super().to_internal_value(data)
+
+
+class ProductImportRowSerializer(serializers.Serializer):
+    slug = serializers.SlugField(max_length=50)
+    title = serializers.CharField(max_length=255)
+    # No defaults: a column the row leaves out must not overwrite the stored value
+    description = serializers.CharField(required=False, allow_blank=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    inventory = serializers.IntegerField(min_value=0, required=False)
+    category = serializers.SlugField(required=False, allow_blank=True, allow_null=True)
+    images = ImportImageSerializer(many=True, required=False)
+
+
+def detect_format(name: str = "", requested: str = "") -> str:
+    requested = (requested or "").lower()
+    if requested in FORMATS:
+        return requested
+    if name.lower().endswith((".ndjson", ".jsonl")):
+        return NDJSON
+    return CSV
+
+
+def _csv_rows(lines):
+    for row in csv.DictReader(lines):
+        record = {key: value for key, value in row.items() if key and key != "images" and value}
+        if row.get("images") is not None:
+            urls = [url.strip() for url in row["images"].split(IMAGE_SEPARATOR) if url.strip()]
+            record["images"] = [{"image": url, "is_primary": index == 0} for index, url in enumerate(urls)]
+        yield record
+
+
+def _ndjson_rows(lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as exc:
+            yield exc
+
+
+def read_rows(binary_file, file_format):
+    """Yield dicts from an uploaded file without loading it into memory."""
+    lines = codecs.iterdecode(binary_file, "utf-8-sig")
+    return _csv_rows(lines) if file_format == CSV else _ndjson_rows(lines)
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row, slug, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "slug": slug, "errors": errors})
+
+    def as_dict(self):
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def _validate_chunk(chunk, first_row, seen_slugs, report, validator):
+    category_slugs = {row.get("category") for row in chunk if isinstance(row, dict)}
+    categories = dict(
+        Category.objects.filter(slug__in=[slug for slug in category_slugs if isinstance(slug, str) and slug])
+        .values_list("slug", "id")
+    )
+    valid = []
+    for number, row in enumerate(chunk, start=first_row):
+        if not isinstance(row, dict):
+            report.error(number, None, {"non_field_errors": ["Row is not a JSON object."]})
+            continue
+        try:
+            data = validator.run_validation(row)
+        except serializers.ValidationError as exc:
+            report.error(number, row.get("slug"), exc.detail)
+            continue
+        if data["slug"] in seen_slugs:
+            report.error(number, data["slug"], {"slug": ["Duplicate slug in this import."]})
+            continue
+        if data.get("category") and data["category"] not in categories:
+            report.error(number, data["slug"], {"category": [f'Unknown category "{data["category"]}".']})
+            continue
+        seen_slugs.add(data["slug"])
+        if "category" in data:
+            data["category_id"] = categories.get(data.pop("category"))
+        valid.append(data)
+    return valid
+
+
+def _upsert_groups(rows):
+    """Rows grouped by the product columns they carry, one upsert per group."""
+    groups = defaultdict(list)
+    for data in rows:
+        columns = tuple(field for field in UPSERT_FIELDS if field in data or f"{field}_id" in data)
+        groups[columns].append(data)
+    return groups.items()
+
+
+@transaction.atomic
+def _write_chunk(rows, report) -> set:
+    """Write a validated chunk; returns the category ids (old and new) of the products it touched."""
+    slugs = [data["slug"] for data in rows]
+    existing = dict(Product.objects.filter(slug__in=slugs).values_list("slug", "category_id"))
+    for columns, group in _upsert_groups(rows):
+        Product.objects.bulk_create(
+            [Product(**{key: value for key, value in data.items() if key != "images"}) for data in group],
+            update_conflicts=True,
+            unique_fields=["slug"],
+            update_fields=list(columns),
+        )
+    current = list(Product.objects.filter(slug__in=slugs).values_list("slug", "id", "category_id"))
+    ids = {slug: pk for slug, pk, _ in current}
+
+    with_images = [data for data in rows if "images" in data]
+    if with_images:
+        ProductImage.objects.filter(product_id__in=[ids[data["slug"]] for data in with_images]).delete()
+        ProductImage.objects.bulk_create(
+            ProductImage(product_id=ids[data["slug"]], **image)
+            for data in with_images
+            for image in data["images"]
+        )
+    refresh_read_model(list(ids.values()))
+
+    report.updated += len(existing)
+    report.created += len(rows) - len(existing)
+    return {*existing.values(), *(category_id for _, _, category_id in current)}
+
+
+def import_products(rows, chunk_size=CHUNK_SIZE) -> dict:
+    """Upsert products by slug from an iterable of row dicts; returns a per-row report.
+
+    Rows are numbered from 1, not counting the CSV header.
+    """
+    report = ImportReport()
+    # One serializer for every row: building its field set costs more than the validation itself
+    validator = ProductImportRowSerializer()
+    seen_slugs, categories = set(), set()
+    rows = iter(rows)
+    first_row = 1
+    with catalog_signals_suspended():
+        while chunk := list(islice(rows, chunk_size)):
+            valid = _validate_chunk(chunk, first_row, seen_slugs, report, validator)
+            if valid:
+                categories |= _write_chunk(valid, report)
+            first_row += len(chunk)
+    if report.created or report.updated:
+        # The per-row signal handlers were off, so recount the touched facets and expire the cache once
+        refresh_facets(categories)
+        schedule_catalog_bump()
+    return report.as_dict()
+
+
+def _export_records(chunk_size):
+    """Yield (product values, image values) pairs; images are fetched once per chunk."""
+    products = (
+        Product.objects.order_by("id")
+        .values_list("id", "slug", "title", "description", "price", "inventory", "category__slug")
+        .iterator(chunk_size=chunk_size)
+    )
+    while chunk := list(islice(products, chunk_size)):
+        images = defaultdict(list)
+        rows = (
+            ProductImage.objects.filter(product_id__in=[row[0] for row in chunk])
+            .order_by("product_id", "-is_primary", "id")
+            .values_list("product_id", "image", "alt_text", "is_primary")
+        )
+        for product_id, *image in rows:
+            images[product_id].append(image)
+        for row in chunk:
+            yield row[1:], images[row[0]]
+
+
+def export_rows(file_format, chunk_size=2000):
+    """Yield the catalog as CSV or NDJSON text, one line at a time."""
+    if file_format == CSV:
+        writer = csv_line_writer()
+        yield writer.writerow(COLUMNS)
+        for (slug, title, description, price, inventory, category), images in _export_records(chunk_size):
+            yield writer.writerow([
+                slug, title, description, price, inventory, category or "",
+                IMAGE_SEPARATOR.join(image for image, _, _ in images),
+            ])
+        return
+    for (slug, title, description, price, inventory, category), images in _export_records(chunk_size):
+        yield json.dumps({
+            "slug": slug,
+            "title": title,
+            "description": description,
+            "price": str(price),
+            "inventory": inventory,
+            "category": category,
+            "images": [
+                {"image": image, "alt_text": alt_text, "is_primary": is_primary}
+                for image, alt_text, is_primary in images
+            ],
+        }) + "\n"
@@ -0,0 +1,141 @@
+"""Versioned read-through cache for the public catalog endpoints.
+
+Every cached response key embeds the current catalog version. Any write to a
+product, image or category bumps the version, which orphans all existing entries
+at once instead of having to enumerate and delete them; orphans age out through
+the cache timeout. The ETag is derived from the same key, so conditional requests
+are answered with a 304 after a single version lookup.
+
+The cache alias is configured in settings (``CATALOG_CACHE_ALIAS``). Local memory
+works for a single process; point the alias at a shared backend (Redis, Memcached,
+database) when running several workers so that they all see the same version.
+`check_catalog_cache` reports a per-process alias under ``manage.py check --deploy``.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Error
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from ecommerce.caches import process_local_backend
+
+VERSION_KEY = "catalog:version"
+CACHE_PARAMS = ("category", "min_price", "max_price", "search", "ordering", "cursor", "page", "page_size")
+
+
+def _cache():
+    return caches[getattr(settings, "CATALOG_CACHE_ALIAS", "default")]
+
+
+def _timeout():
+    return getattr(settings, "CATALOG_CACHE_TIMEOUT", 300)
+
+
+def check_catalog_cache(app_configs, **kwargs):
+    alias = getattr(settings, "CATALOG_CACHE_ALIAS", "default")
+    backend = process_local_backend(alias)
+    if not backend:
+        return []
+    return [Error(
+        f"The catalog cache {alias!r} is {backend}, so a catalog change on one worker "
+        f"is not seen by the others for up to CATALOG_CACHE_TIMEOUT seconds.",
+        hint="Set CATALOG_CACHE_BACKEND/CATALOG_CACHE_LOCATION to a shared cache (e.g. Redis).",
+        id="products.E001",
+    )]
+
+
+def get_catalog_version() -> int:
+    cache = _cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so an evicted counter never reuses an old version
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version() -> None:
+    cache = _cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def schedule_catalog_bump() -> None:
+    """Bump the version once the current transaction commits (immediately if none)."""
+    transaction.on_commit(bump_catalog_version)
+
+
+def normalize_params(query_params) -> str:
+    parts = []
+    for name in CACHE_PARAMS:
+        value = (query_params.get(name) or "").strip()
+        if value:
+            parts.append(f"{name}={value.lower() if name == 'search' else value}")
+    return "&".join(parts)
+
+
+def catalog_cache_key(namespace: str, action: str, host: str, lookup, query_params) -> str:
+    fingerprint = hashlib.sha1(
+        f"{host}|{lookup or ''}|{normalize_params(query_params)}".encode("utf-8")
+    ).hexdigest()
+    return f"catalog:{get_catalog_version()}:{namespace}:{action}:{fingerprint}"
+
+
+def _etag_for(key: str) -> str:
+    return 'W/"%s"' % hashlib.md5(key.encode("utf-8")).hexdigest()
+
+
+class CatalogCacheMixin:
+    """Cache rendered JSON for `list` and `retrieve` on read-mostly viewsets."""
+
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response("list", super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response("retrieve", super().retrieve, request, *args, **kwargs)
+
+    def _cached_response(self, action, handler, request, *args, **kwargs):
+        # The browsable API and other renderers are not worth caching
+        if getattr(request.accepted_renderer, "format", None) != "json":
+            return handler(request, *args, **kwargs)
+
+        key = catalog_cache_key(
+            self.cache_namespace or self.basename,
+            action,
+            request.get_host(),
+            kwargs.get(self.lookup_url_kwarg or self.lookup_field),
+            request.query_params,
+        )
+        etag = _etag_for(key)
+
+        if_none_match = request.headers.get("If-None-Match", "")
+        if etag in (tag.strip() for tag in if_none_match.split(",")):
+            response = HttpResponseNotModified()
+            response["ETag"] = etag
+            return response
+
+        cache = _cache()
+        cached = cache.get(key)
+        if cached is not None:
+            response = HttpResponse(cached, content_type="application/json")
+            response["ETag"] = etag
+            response["X-Cache"] = "HIT"
+            patch_vary_headers(response, ("Accept",))
+            return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response["ETag"] = etag
+            response["X-Cache"] = "MISS"
+            response.add_post_render_callback(
+                lambda rendered: cache.set(key, rendered.content, _timeout())
+            )
+        return response
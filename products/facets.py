@@ -0,0 +1,148 @@
+"""Category and price-band counts for the catalog filter sidebar.
+
+ProductFacet holds one row per (category, price band) with the number of
+products in it. The signal handlers in products.signals refresh only the
+categories a write touched, so the table stays current without rescanning the
+catalog. An unfiltered or category-only sidebar is answered from that table;
+once a search term or price range narrows the catalog, the same numbers are
+computed live from Product. Either way it is one grouped aggregate query.
+
+Bands are half-open ``[edge, next_edge)`` ranges over ``PRODUCT_PRICE_BANDS``;
+call `rebuild_facets` after changing the edges.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from rest_framework.exceptions import ValidationError
+
+from .models import Category, Product, ProductFacet
+
+DEFAULT_PRICE_BANDS = (0, 1000, 5000, 10000, 50000, 100000)
+UNCATEGORIZED = 0
+
+
+def price_bands() -> tuple[Decimal, ...]:
+    return tuple(Decimal(str(edge)) for edge in getattr(settings, "PRODUCT_PRICE_BANDS", DEFAULT_PRICE_BANDS))
+
+
+def band_expression(edges=None, field="price"):
+    """SQL expression numbering the band a price falls in (0 for anything below the first edge)."""
+    edges = edges or price_bands()
+    whens = [When(**{f"{field}__gte": edge}, then=Value(index)) for index, edge in reversed(list(enumerate(edges)))]
+    return Case(*whens, default=Value(0), output_field=IntegerField())
+
+
+def _grouped_products(queryset):
+    return (
+        queryset.order_by()
+        .values(category_key=Coalesce("category_id", Value(UNCATEGORIZED)), price_band=band_expression())
+        .annotate(product_count=Count("id"))
+    )
+
+
+def _category_filter(keys):
+    keys = set(keys)
+    condition = Q(category_id__in=keys - {UNCATEGORIZED})
+    if UNCATEGORIZED in keys:
+        condition |= Q(category__isnull=True)
+    return condition
+
+
+@transaction.atomic
+def refresh_facets(category_ids) -> None:
+    """Recount the facet rows of the given categories (None meaning uncategorized)."""
+    keys = {UNCATEGORIZED if pk is None else pk for pk in category_ids}
+    if not keys:
+        return
+    rows = [ProductFacet(**row) for row in _grouped_products(Product.objects.filter(_category_filter(keys)))]
+    # Zero, upsert, then drop what is still zero: safe against a concurrent refresh of the same category
+    ProductFacet.objects.filter(category_key__in=keys).update(product_count=0)
+    if rows:
+        ProductFacet.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["category_key", "price_band"],
+            update_fields=["product_count"],
+        )
+    ProductFacet.objects.filter(category_key__in=keys, product_count=0).delete()
+
+
+@transaction.atomic
+def rebuild_facets() -> None:
+    ProductFacet.objects.all().delete()
+    ProductFacet.objects.bulk_create(ProductFacet(**row) for row in _grouped_products(Product.objects.all()))
+
+
+def _parse(params, name, cast):
+    value = (params.get(name) or "").strip()
+    if not value:
+        return None
+    try:
+        return cast(value)
+    except (TypeError, ValueError, InvalidOperation):
+        raise ValidationError({name: f"Invalid value: {value!r}."})
+
+
+def _facet_rows(queryset, min_price, max_price, search):
+    """(category_key, price_band, name, products, products within the price range) rows."""
+    if not (search or min_price is not None or max_price is not None):
+        category_name = Subquery(Category.objects.filter(pk=OuterRef("category_key")).values("name")[:1])
+        rows = ProductFacet.objects.annotate(name=category_name).values_list(
+            "category_key", "price_band", "name", "product_count", "product_count"
+        )
+        return list(rows)
+
+    in_range = Q()
+    if min_price is not None:
+        in_range &= Q(price__gte=min_price)
+    if max_price is not None:
+        in_range &= Q(price__lte=max_price)
+    rows = (
+        queryset.order_by()
+        .values(category_key=Coalesce("category_id", Value(UNCATEGORIZED)), band=band_expression())
+        .annotate(
+            name=Max("category_name"),
+            products=Count("id"),
+            in_range=Count("id", filter=in_range) if in_range else Count("id"),
+        )
+        .values_list("category_key", "band", "name", "products", "in_range")
+    )
+    return list(rows)
+
+
+def product_facets(queryset, params, search=None) -> dict:
+    """Facet counts for the list filters in `params`.
+
+    `queryset` should already be narrowed by `search` (and nothing else). Category
+    counts honour the price range, band counts honour the category, and `total`
+    honours both, matching what the product list would return for each choice.
+    """
+    category = _parse(params, "category", int)
+    min_price = _parse(params, "min_price", Decimal)
+    max_price = _parse(params, "max_price", Decimal)
+
+    categories, bands, total = {}, {}, 0
+    for key, band, name, products, in_range in _facet_rows(queryset, min_price, max_price, search):
+        if in_range:
+            entry = categories.setdefault(key, {"id": key or None, "name": name or "", "count": 0})
+            entry["count"] += in_range
+        if category is None or key == category:
+            bands[band] = bands.get(band, 0) + products
+            total += in_range
+
+    edges = price_bands()
+    return {
+        "total": total,
+        "categories": sorted(categories.values(), key=lambda entry: (entry["id"] is None, entry["name"])),
+        "price_bands": [
+            {
+                "min": str(edge),
+                "max": str(edges[index + 1]) if index + 1 < len(edges) else None,
+                "count": bands.get(index, 0),
+            }
+            for index, edge in enumerate(edges)
+        ],
+    }
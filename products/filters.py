@@ -0,0 +1,12 @@
+from rest_framework.filters import OrderingFilter
+
+from .search import RANK_FIELD
+
+
+class ProductOrderingFilter(OrderingFilter):
+    """Order search results by relevance unless the client asks for a column."""
+
+    def get_default_ordering(self, view):
+        if view.request.query_params.get("search", "").strip():
+            return [f"-{RANK_FIELD}"]
+        return super().get_default_ordering(view)
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 00:38
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+from products.search import install_search_index
+
+
+def create_search_index(apps, schema_editor):
+    install_search_index(schema_editor, rebuild=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_product_keyset_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, migrations.RunPython.noop),
+    ]
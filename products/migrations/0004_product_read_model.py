@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 00:53
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    ProductImage = apps.get_model("products", "ProductImage")
+    Category = apps.get_model("products", "Category")
+    images = ProductImage.objects.filter(product=OuterRef("pk")).order_by("-is_primary", "id").values("image")[:1]
+    names = Category.objects.filter(pk=OuterRef("category_id")).values("name")[:1]
+    Product.objects.update(
+        primary_image_url=Coalesce(Subquery(images), Value("")),
+        category_name=Coalesce(Subquery(names), Value("")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='category_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=120),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='primary_image_url',
+            field=models.CharField(blank=True, default='', editable=False, max_length=500),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-18 00:56
+
+from django.db import migrations, models
+from django.db.models import Count, Value
+from django.db.models.functions import Coalesce
+
+from products.facets import band_expression
+
+
+def backfill(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    ProductFacet = apps.get_model("products", "ProductFacet")
+    rows = (
+        Product.objects.order_by()
+        .values(category_key=Coalesce("category_id", Value(0)), price_band=band_expression())
+        .annotate(product_count=Count("id"))
+    )
+    ProductFacet.objects.bulk_create(ProductFacet(**row) for row in rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_read_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category_key', models.PositiveIntegerField()),
+                ('price_band', models.PositiveSmallIntegerField()),
+                ('product_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('category_key', 'price_band'), name='productfacet_category_band_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
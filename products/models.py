@@ -1,3 +1,4 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
 class Category(models.Model):
@@ -15,6 +16,20 @@ class Product(models.Model):
     inventory = models.PositiveIntegerField(default=0)
     category = models.ForeignKey(Category, related_name="products", on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Copies of the primary image and category name for list pages; see products.read_model
+    primary_image_url = models.CharField(max_length=500, blank=True, default="", editable=False)
+    category_name = models.CharField(max_length=120, blank=True, default="", editable=False)
+    # Maintained by a database trigger on PostgreSQL; see products.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination seeks: one index per sortable column, id as tie-breaker
+            models.Index(fields=["-created_at", "-id"], name="product_created_id_idx"),
+            models.Index(fields=["price", "id"], name="product_price_id_idx"),
+            models.Index(fields=["title", "id"], name="product_title_id_idx"),
+        ]
+        # GIN/trigram indexes are vendor specific and created by products.search
 
     def __str__(self):
         return self.title
@@ -24,3 +39,16 @@ class ProductImage(models.Model):
     image = models.CharField(max_length=500)  # Changed to CharField to support URLs
     alt_text = models.CharField(max_length=255, blank=True)
     is_primary = models.BooleanField(default=False)
+
+
+class ProductFacet(models.Model):
+    """Product count per category and price band; maintained by products.facets."""
+
+    category_key = models.PositiveIntegerField()  # Category id, 0 for uncategorized
+    price_band = models.PositiveSmallIntegerField()
+    product_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["category_key", "price_band"], name="productfacet_category_band_uniq"),
+        ]
@@ -0,0 +1,30 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ProductCursorPagination(CursorPagination):
+    """Keyset pagination for the storefront catalog.
+
+    Pages are located by seeking on the ordering column (backed by the composite
+    indexes on Product) instead of an OFFSET, so page 500 costs the same as page 1.
+
+    DRF positions the cursor on the first ordering column only. The `id`
+    tie-breaker makes the order within a run of equal values (one price, one
+    title) total, but a cursor stepping inside such a run seeks to its start and
+    skips the rows already served with an OFFSET. Walking a run therefore lists
+    each product exactly once while the run is unchanged and shorter than DRF's
+    `offset_cutoff` (1000 rows), at a cost that grows with the run's length;
+    `created_at` rarely repeats, so the default ordering always seeks. A product
+    added to or removed from a run between requests shifts that offset by a row.
+    """
+
+    page_size = 24
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-created_at", "-id")
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if any(field.lstrip("-") in ("id", "pk") for field in ordering):
+            return ordering
+        tie_breaker = "-id" if ordering[0].startswith("-") else "id"
+        return tuple(ordering) + (tie_breaker,)
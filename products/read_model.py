@@ -0,0 +1,49 @@
+"""Denormalized catalog columns on Product.
+
+`Product.primary_image_url` and `Product.category_name` copy what the storefront
+list shows from ProductImage and Category, so a page of products is read from
+the products table alone. The signal handlers in products.signals keep them in
+step; each refresh is a single UPDATE with a correlated subquery, so a change
+costs one statement however many products it touches.
+"""
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Category, Product, ProductImage
+
+
+def _primary_image():
+    # Same choice as the image galleries: the flagged image, else the oldest one
+    return Subquery(
+        ProductImage.objects.filter(product=OuterRef("pk")).order_by("-is_primary", "id").values("image")[:1]
+    )
+
+
+def _category_name():
+    return Subquery(Category.objects.filter(pk=OuterRef("category_id")).values("name")[:1])
+
+
+def refresh_primary_images(product_ids=None) -> int:
+    products = Product.objects.all() if product_ids is None else Product.objects.filter(pk__in=product_ids)
+    return products.update(primary_image_url=Coalesce(_primary_image(), Value("")))
+
+
+def refresh_category_names(product_ids=None) -> int:
+    products = Product.objects.all() if product_ids is None else Product.objects.filter(pk__in=product_ids)
+    return products.update(category_name=Coalesce(_category_name(), Value("")))
+
+
+def rename_category(category: Category) -> int:
+    return Product.objects.filter(category_id=category.pk).exclude(category_name=category.name).update(
+        category_name=category.name
+    )
+
+
+def clear_orphaned_category_names() -> int:
+    """Blank the name on products whose category was deleted (SET_NULL skips signals)."""
+    return Product.objects.filter(category__isnull=True).exclude(category_name="").update(category_name="")
+
+
+def refresh_read_model(product_ids=None):
+    refresh_primary_images(product_ids)
+    refresh_category_names(product_ids)
@@ -0,0 +1,170 @@
+"""Full-text search backends for the product catalog.
+
+PostgreSQL keeps a weighted `tsvector` in `Product.search_vector` (GIN indexed) and
+falls back to trigram similarity on the title for typos and partial words. SQLite,
+used for local development and tests, mirrors title/description into an FTS5 table.
+Both are maintained by database triggers, so `save()`, `bulk_update()` and
+`QuerySet.update()` all keep the index current without Python-side hooks.
+"""
+import re
+
+from django.db import connections
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = "english"
+RANK_FIELD = "search_rank"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class ProductSearchBackend:
+    """Plain substring matching, used when no full-text engine is available."""
+
+    vendor = None
+
+    def install(self, schema_editor):
+        """Create triggers/indexes needed by the backend. Must be idempotent."""
+
+    def rebuild(self, schema_editor):
+        """Re-index every existing product."""
+
+    def search(self, queryset, term):
+        return queryset.filter(
+            Q(title__icontains=term) | Q(description__icontains=term)
+        ).annotate(**{RANK_FIELD: RawSQL("0", (), output_field=FloatField())})
+
+
+class PostgresProductSearch(ProductSearchBackend):
+    vendor = "postgresql"
+
+    install_sql = (
+        f"""
+        CREATE OR REPLACE FUNCTION products_product_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.title, '')), 'A') ||
+                setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.description, '')), 'B');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS products_product_search_vector_trigger ON products_product",
+        """
+        CREATE TRIGGER products_product_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF title, description ON products_product
+        FOR EACH ROW EXECUTE FUNCTION products_product_search_vector_update()
+        """,
+        "CREATE INDEX IF NOT EXISTS product_search_vector_gin ON products_product USING gin (search_vector)",
+        "CREATE INDEX IF NOT EXISTS product_title_trgm_gin ON products_product USING gin (title gin_trgm_ops)",
+    )
+
+    def install(self, schema_editor):
+        for statement in self.install_sql:
+            schema_editor.execute(statement)
+
+    def rebuild(self, schema_editor):
+        # Touching title fires the trigger for every row
+        schema_editor.execute("UPDATE products_product SET title = title")
+
+    def search(self, queryset, term):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+
+        query = SearchQuery(term, config=SEARCH_CONFIG, search_type="websearch")
+        return queryset.filter(
+            Q(search_vector=query) | Q(title__trigram_similar=term)
+        ).annotate(
+            **{RANK_FIELD: SearchRank(F("search_vector"), query) + TrigramSimilarity("title", term)}
+        )
+
+
+class SqliteProductSearch(ProductSearchBackend):
+    vendor = "sqlite"
+
+    install_sql = (
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_product_fts USING fts5(
+            title, description, content='products_product', content_rowid='id'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS products_product_fts_ai AFTER INSERT ON products_product BEGIN
+            INSERT INTO products_product_fts(rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS products_product_fts_ad AFTER DELETE ON products_product BEGIN
+            INSERT INTO products_product_fts(products_product_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS products_product_fts_au
+        AFTER UPDATE OF title, description ON products_product BEGIN
+            INSERT INTO products_product_fts(products_product_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO products_product_fts(rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END
+        """,
+    )
+
+    def install(self, schema_editor):
+        for statement in self.install_sql:
+            schema_editor.execute(statement)
+
+    def rebuild(self, schema_editor):
+        schema_editor.execute("INSERT INTO products_product_fts(products_product_fts) VALUES ('rebuild')")
+
+    @staticmethod
+    def _match_expression(term):
+        # Quote every token so user input can never be read as FTS5 query syntax,
+        # and prefix-match the last one to behave like search-as-you-type.
+        tokens = _TOKEN_RE.findall(term)
+        if not tokens:
+            return None
+        quoted = [f'"{token}"' for token in tokens]
+        quoted[-1] += "*"
+        return " ".join(quoted)
+
+    def search(self, queryset, term):
+        match = self._match_expression(term)
+        if match is None:
+            return super().search(queryset, term).none()
+        # bm25() is lower-is-better; negate it so every backend sorts by -search_rank
+        rank = RawSQL(
+            "SELECT -bm25(products_product_fts) FROM products_product_fts "
+            "WHERE products_product_fts MATCH %s AND products_product_fts.rowid = products_product.id",
+            (match,),
+            output_field=FloatField(),
+        )
+        matches = RawSQL(
+            "SELECT rowid FROM products_product_fts WHERE products_product_fts MATCH %s",
+            (match,),
+        )
+        return queryset.filter(id__in=matches).annotate(**{RANK_FIELD: rank})
+
+
+_BACKENDS = {backend.vendor: backend for backend in (PostgresProductSearch(), SqliteProductSearch())}
+_FALLBACK = ProductSearchBackend()
+
+
+def get_search_backend(vendor):
+    return _BACKENDS.get(vendor, _FALLBACK)
+
+
+def search_products(queryset, term):
+    """Filter `queryset` to products matching `term`, annotated with `search_rank`."""
+    term = (term or "").strip()
+    if not term:
+        return queryset
+    return get_search_backend(connections[queryset.db].vendor).search(queryset, term)
+
+
+def install_search_index(schema_editor, rebuild=False):
+    """Idempotently create the search triggers/indexes for the connected database."""
+    backend = get_search_backend(schema_editor.connection.vendor)
+    backend.install(schema_editor)
+    if rebuild:
+        backend.rebuild(schema_editor)
@@ -1,4 +1,8 @@
+from django.db import transaction
 from rest_framework import serializers
+from .cache import schedule_catalog_bump
+from .read_model import refresh_primary_images
+from .signals import catalog_signals_suspended
 from .models import Category, Product, ProductImage
 
 class ProductImageSerializer(serializers.ModelSerializer):
@@ -15,7 +19,23 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = ("id", "title", "slug", "description", "price", "inventory", "category", "images")
 
 
+class ProductListSerializer(serializers.ModelSerializer):
+    """Storefront list shape, read entirely from Product's denormalized columns."""
+
+    category = serializers.CharField(source="category_name", read_only=True)
+    image = serializers.CharField(source="primary_image_url", read_only=True)
+
+    # Columns the list query loads; nothing else is deferred-loaded while rendering
+    load_fields = ("id", "title", "slug", "price", "inventory", "category_id", "category_name",
+                   "primary_image_url", "created_at")
+
+    class Meta:
+        model = Product
+        fields = ("id", "title", "slug", "price", "inventory", "category", "category_id", "image")
+
+
 class ProductAdminWriteImageSerializer(serializers.Serializer):
+    id = serializers.IntegerField(required=False)
     image = serializers.CharField(max_length=500)
     alt_text = serializers.CharField(max_length=255, required=False, allow_blank=True)
     is_primary = serializers.BooleanField(required=False)
@@ -41,13 +61,18 @@ class ProductAdminSerializer(serializers.ModelSerializer):
         images_data = validated_data.pop("images", [])
         validated_data = self._ensure_slug(validated_data)
         product = Product.objects.create(**validated_data)
-        for img in images_data:
-            ProductImage.objects.create(
-                product=product,
-                image=img.get("image"),
-                alt_text=img.get("alt_text", ""),
-                is_primary=img.get("is_primary", False),
+        if images_data:
+            ProductImage.objects.bulk_create(
+                ProductImage(
+                    product=product,
+                    image=img.get("image"),
+                    alt_text=img.get("alt_text", ""),
+                    is_primary=img.get("is_primary", False),
+                )
+                for img in images_data
             )
+            # bulk_create skips the image signals
+            refresh_primary_images([product.pk])
         return product
 
     def update(self, instance, validated_data):
@@ -55,19 +80,56 @@ class ProductAdminSerializer(serializers.ModelSerializer):
         validated_data = self._ensure_slug(validated_data)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
-        if images_data is not None:
-            # Replace existing images with provided set
-            instance.images.all().delete()
-            for img in images_data:
-                ProductImage.objects.create(
-                    product=instance,
-                    image=img.get("image"),
-                    alt_text=img.get("alt_text", ""),
-                    is_primary=img.get("is_primary", False),
-                )
+        with transaction.atomic():
+            instance.save()
+            if images_data is not None:
+                self._sync_images(instance, images_data)
+        schedule_catalog_bump()
         return instance
 
+    @staticmethod
+    def _sync_images(product, images_data):
+        """Make the product's images match `images_data`, writing only the differences.
+
+        Incoming images are matched to existing rows by `id` when given, otherwise
+        by URL, so unchanged images keep their rows. The rest is at most one DELETE,
+        one bulk UPDATE and one bulk INSERT.
+        """
+        existing = {image.pk: image for image in product.images.order_by("id")}
+        matched, changed, added = set(), [], []
+        for img in images_data:
+            values = {
+                "image": img["image"],
+                "alt_text": img.get("alt_text", ""),
+                "is_primary": img.get("is_primary", False),
+            }
+            image = existing.get(img.get("id"))
+            if image is None or image.pk in matched:
+                image = next(
+                    (row for row in existing.values() if row.pk not in matched and row.image == values["image"]),
+                    None,
+                )
+            if image is None:
+                added.append(ProductImage(product=product, **values))
+                continue
+            matched.add(image.pk)
+            if any(getattr(image, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(image, field, value)
+                changed.append(image)
+
+        stale = [pk for pk in existing if pk not in matched]
+        if not (stale or changed or added):
+            return
+        with catalog_signals_suspended():
+            if stale:
+                ProductImage.objects.filter(pk__in=stale).delete()
+            if changed:
+                ProductImage.objects.bulk_update(changed, ["image", "alt_text", "is_primary"])
+            if added:
+                ProductImage.objects.bulk_create(added)
+        refresh_primary_images([product.pk])
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
@@ -0,0 +1,103 @@
+import functools
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import schedule_catalog_bump
+from .facets import refresh_facets
+from .models import Category, Product, ProductImage
+from .read_model import (
+    clear_orphaned_category_names,
+    refresh_category_names,
+    refresh_primary_images,
+    rename_category,
+)
+
+_state = threading.local()
+
+
+@contextmanager
+def catalog_signals_suspended():
+    """Skip the per-row handlers below; the caller refreshes derived data itself (see products.bulk)."""
+    previous = getattr(_state, "suspended", False)
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = previous
+
+
+def _unless_suspended(handler):
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        if not getattr(_state, "suspended", False):
+            handler(*args, **kwargs)
+    return wrapper
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@_unless_suspended
+def invalidate_catalog_cache(sender, **kwargs):
+    schedule_catalog_bump()
+
+
+@receiver(post_save, sender=Product)
+@_unless_suspended
+def sync_product_category_name(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and "category" not in update_fields):
+        return
+    refresh_category_names([instance.pk])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@_unless_suspended
+def sync_primary_image(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_primary_images([instance.product_id])
+
+
+@receiver(post_save, sender=Category)
+@_unless_suspended
+def sync_category_name(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rename_category(instance)
+
+
+@receiver(post_delete, sender=Category)
+@_unless_suspended
+def drop_category_name(sender, **kwargs):
+    clear_orphaned_category_names()
+
+
+@receiver(pre_save, sender=Product)
+@_unless_suspended
+def remember_facet_category(sender, instance, raw=False, **kwargs):
+    # A product moving between categories has to be recounted in both
+    instance._previous_category_id = instance.category_id
+    if not raw and not instance._state.adding:
+        instance._previous_category_id = (
+            Product.objects.filter(pk=instance.pk).values_list("category_id", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@_unless_suspended
+def sync_product_facets(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_facets({instance.category_id, getattr(instance, "_previous_category_id", instance.category_id)})
+
+
+@receiver(post_delete, sender=Category)
+@_unless_suspended
+def drop_category_facets(sender, instance, **kwargs):
+    refresh_facets({instance.pk, None})
@@ -1,3 +1,421 @@
-from django.test import TestCase
+from unittest import skipUnless
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .cache import check_catalog_cache
+from .facets import rebuild_facets
+from .models import Category, Product, ProductFacet, ProductImage
+from .search import RANK_FIELD, search_products
+
+User = get_user_model()
+
+
+class ProductReadModelTests(TestCase):
+    def setUp(self):
+        self.phones = Category.objects.create(name="Phones", slug="phones")
+        self.product = Product.objects.create(title="Phone", slug="phone", price=100, category=self.phones)
+
+    def _reload(self):
+        self.product.refresh_from_db(fields=["primary_image_url", "category_name"])
+        return self.product.primary_image_url, self.product.category_name
+
+    def test_primary_image_follows_images(self):
+        self.assertEqual(self._reload(), ("", "Phones"))
+        first = ProductImage.objects.create(product=self.product, image="a.jpg")
+        self.assertEqual(self._reload()[0], "a.jpg")
+        flagged = ProductImage.objects.create(product=self.product, image="b.jpg", is_primary=True)
+        self.assertEqual(self._reload()[0], "b.jpg")
+        flagged.delete()
+        self.assertEqual(self._reload()[0], "a.jpg")
+        first.delete()
+        self.assertEqual(self._reload()[0], "")
+
+    def test_category_name_follows_category(self):
+        self.phones.name = "Mobiles"
+        self.phones.save()
+        self.assertEqual(self._reload()[1], "Mobiles")
+
+        laptops = Category.objects.create(name="Laptops", slug="laptops")
+        self.product.category = laptops
+        self.product.save()
+        self.assertEqual(self._reload()[1], "Laptops")
+
+        laptops.delete()
+        self.assertEqual(self._reload()[1], "")
+
+
+class ProductListTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Phones", slug="phones")
+        for i in range(30):
+            product = Product.objects.create(title=f"Phone {i}", slug=f"phone-{i}", price=100 + i, category=category)
+            ProductImage.objects.create(product=product, image=f"{i}.jpg", is_primary=True)
+
+    def test_page_is_one_query_without_joins(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().get("/api/products/products/", {"page_size": 24})
+        self.assertEqual(response.status_code, 200)
+        product_queries = [q["sql"] for q in queries if "products_product" in q["sql"]]
+        self.assertEqual(len(product_queries), 1)
+        self.assertNotIn("JOIN", product_queries[0])
+        first = response.json()["results"][0]
+        self.assertEqual(first["category"], "Phones")
+        self.assertEqual(first["image"], "29.jpg")
+        self.assertNotIn("images", first)
+
+
+class ProductPaginationTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Phones", slug="phones")
+        # Runs of equal prices several pages long, so the cursor must step inside a run
+        self.ids = [
+            Product.objects.create(
+                title=f"Phone {i}", slug=f"phone-{i}", price=100 if i < 17 else 200, category=category
+            ).pk
+            for i in range(30)
+        ]
+
+    def _walk(self, ordering):
+        client = APIClient()
+        url = "/api/products/products/?" + urlencode({"ordering": ordering, "page_size": 4})
+        seen = []
+        while url:
+            body = client.get(url, HTTP_ACCEPT="application/json").json()
+            seen += [item["id"] for item in body["results"]]
+            url = body["next"]
+        return seen
+
+    def test_every_page_over_equal_prices_lists_each_product_once(self):
+        for ordering in ("price", "-price"):
+            with self.subTest(ordering=ordering):
+                seen = self._walk(ordering)
+                self.assertEqual(sorted(seen), sorted(self.ids))
+                prices = dict(Product.objects.values_list("id", "price"))
+                expected = sorted(self.ids, key=lambda pk: (prices[pk], pk), reverse=ordering.startswith("-"))
+                self.assertEqual(seen, expected)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        caches[settings.CATALOG_CACHE_ALIAS].clear()
+        self.category = Category.objects.create(name="Phones", slug="phones")
+        self.product = Product.objects.create(title="Phone", slug="phone", price=100, category=self.category)
+        self.client = APIClient()
+
+    def _get(self, url="/api/products/products/", **headers):
+        return self.client.get(url, HTTP_ACCEPT="application/json", **headers)
+
+    def test_miss_then_hit_with_the_same_body(self):
+        first = self._get()
+        self.assertEqual((first.status_code, first["X-Cache"]), (200, "MISS"))
+        with CaptureQueriesContext(connection) as queries:
+            second = self._get()
+        self.assertEqual((second.status_code, second["X-Cache"]), (200, "HIT"))
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["ETag"], first["ETag"])
+        self.assertEqual(self._get(f"/api/products/products/{self.product.pk}/")["X-Cache"], "MISS")
+
+    def test_if_none_match_answers_304(self):
+        etag = self._get()["ETag"]
+        response = self._get(HTTP_IF_NONE_MATCH=f'W/"other", {etag}')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(self._get(HTTP_IF_NONE_MATCH='W/"other"').status_code, 200)
+
+    def test_catalog_writes_drop_cached_responses(self):
+        writes = (
+            lambda: Product.objects.create(title="Tablet", slug="tablet", price=300),
+            lambda: Category.objects.filter(pk=self.category.pk).get().save(),
+            lambda: ProductImage.objects.create(product=self.product, image="phone.jpg", is_primary=True),
+        )
+        for write in writes:
+            before = self._get()
+            self.assertEqual(self._get()["X-Cache"], "HIT")
+            with self.captureOnCommitCallbacks(execute=True):
+                write()
+            after = self._get()
+            self.assertEqual(after["X-Cache"], "MISS")
+            self.assertNotEqual(after["ETag"], before["ETag"])
+            self.assertEqual(self._get(HTTP_IF_NONE_MATCH=before["ETag"]).status_code, 200)
+        self.assertIn("phone.jpg", after.content.decode())
+
+    def test_deploy_check_needs_a_shared_catalog_cache(self):
+        self.assertEqual([error.id for error in check_catalog_cache(None)], ["products.E001"])
+        shared = {**settings.CACHES, "catalog": {"BACKEND": "django.core.cache.backends.redis.RedisCache"}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_catalog_cache(None), [])
+
+
+@skipUnless(connection.vendor == "sqlite", "exercises the SQLite FTS5 index")
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.phone = Product.objects.create(
+            title="Phone", slug="phone", price=100, description="A phone for phone calls, phone games and more."
+        )
+        self.cable = Product.objects.create(
+            title="Cable", slug="cable", price=5,
+            description="A braided charging cable that works with a phone, a tablet, a laptop and a lamp.",
+        )
+        self.case = Product.objects.create(title="Leather case", slug="case", price=20, description="Fits most models.")
+
+    def _slugs(self, term, ordered=False):
+        results = search_products(Product.objects.all(), term)
+        if ordered:
+            return list(results.order_by(f"-{RANK_FIELD}").values_list("slug", flat=True))
+        return set(results.values_list("slug", flat=True))
+
+    def _indexed(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM products_product_fts WHERE rowid = %s", [product.pk])
+            return cursor.fetchone()[0]
+
+    def test_matches_title_description_and_prefixes(self):
+        self.assertEqual(self._slugs("phone"), {"phone", "cable"})
+        self.assertEqual(self._slugs("leath"), {"case"})
+        self.assertEqual(self._slugs("braided cable"), {"cable"})
+        self.assertEqual(self._slugs("submarine"), set())
+        self.assertEqual(search_products(Product.objects.all(), "  ").count(), 3)
+
+    def test_ranks_closer_matches_first(self):
+        self.assertEqual(self._slugs("phone", ordered=True), ["phone", "cable"])
+        ranks = search_products(Product.objects.all(), "phone").values_list(RANK_FIELD, flat=True)
+        self.assertTrue(all(rank > 0 for rank in ranks))
+
+    def test_triggers_follow_updates_and_deletes(self):
+        Product.objects.filter(pk=self.case.pk).update(title="Silicone cover")
+        self.assertEqual(self._slugs("leather"), set())
+        self.assertEqual(self._slugs("silicone"), {"case"})
+
+        self.cable.description = "Plain cable."
+        self.cable.save()
+        self.assertEqual(self._slugs("phone"), {"phone"})
+
+        self.phone.delete()
+        self.assertEqual(self._slugs("phone"), set())
+        self.assertEqual(self._indexed(self.phone), 0)
+
+    def test_query_syntax_is_treated_as_text(self):
+        self.assertEqual(self._slugs('"phone'), {"phone", "cable"})
+        self.assertEqual(self._slugs("phone*"), {"phone", "cable"})
+        self.assertEqual(self._slugs("-phone"), {"phone", "cable"})  # not a negation
+        self.assertEqual(self._slugs("cable - phone"), {"cable"})
+        self.assertEqual(self._slugs("phone NEAR tablet"), set())  # NEAR is just a word nobody uses
+        self.assertEqual(self._slugs("phone OR leather"), set())
+        self.assertEqual(self._slugs('"'), set())
+        self.assertEqual(self._slugs("*"), set())
+        response = APIClient().get("/api/products/products/", {"search": 'phone" NEAR("x'})
+        self.assertEqual((response.status_code, response.json()["results"]), (200, []))
+
+
+@override_settings(PRODUCT_PRICE_BANDS=(0, 100, 500))
+class ProductFacetTests(TestCase):
+    def setUp(self):
+        self.phones = Category.objects.create(name="Phones", slug="phones")
+        self.cases = Category.objects.create(name="Cases", slug="cases")
+        for title, price, category in [
+            ("Budget phone", 90, self.phones),
+            ("Pro phone", 600, self.phones),
+            ("Mid phone", 300, self.phones),
+            ("Leather case", 40, self.cases),
+            ("Sticker", 5, None),
+        ]:
+            Product.objects.create(title=title, slug=title.lower().replace(" ", "-"), price=price, category=category)
+
+    def _facets(self, **params):
+        response = APIClient().get("/api/products/products/facets/", params)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        return (
+            body["total"],
+            {entry["name"]: entry["count"] for entry in body["categories"]},
+            [band["count"] for band in body["price_bands"]],
+        )
+
+    def test_table_tracks_product_changes(self):
+        facets = lambda: dict(((f.category_key, f.price_band), f.product_count) for f in ProductFacet.objects.all())
+        self.assertEqual(facets()[(self.phones.pk, 0)], 1)
+        pro = Product.objects.get(slug="pro-phone")
+        pro.category = self.cases
+        pro.price = 50
+        pro.save()
+        self.assertEqual(facets()[(self.cases.pk, 0)], 2)
+        self.assertNotIn((self.phones.pk, 2), facets())
+        self.cases.delete()
+        self.assertEqual(facets()[(0, 0)], 3)
+        rebuilt = facets()
+        rebuild_facets()
+        self.assertEqual(facets(), rebuilt)
+
+    def test_unfiltered_sidebar_reads_materialized_counts(self):
+        with CaptureQueriesContext(connection) as queries:
+            total, categories, bands = self._facets()
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"products_product"', queries[0]["sql"])
+        self.assertEqual(total, 5)
+        self.assertEqual(categories, {"Cases": 1, "Phones": 3, "": 1})
+        self.assertEqual(bands, [3, 1, 1])
+
+    def test_counts_follow_other_filters(self):
+        total, categories, bands = self._facets(category=self.phones.pk, max_price=400)
+        self.assertEqual(total, 2)
+        # categories honour the price range, bands honour the category
+        self.assertEqual(categories, {"Cases": 1, "Phones": 2, "": 1})
+        self.assertEqual(bands, [1, 1, 1])
+
+        total, categories, _ = self._facets(search="phone")
+        self.assertEqual((total, categories), (3, {"Phones": 3}))
+
+    def test_rejects_bad_filters(self):
+        response = APIClient().get("/api/products/products/facets/", {"min_price": "cheap"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ProductBulkTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user("admin", "admin@example.com", "pw", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.phones = Category.objects.create(name="Phones", slug="phones")
+        self.existing = Product.objects.create(title="Old", slug="phone-1", price=1, category=self.phones)
+        ProductImage.objects.create(product=self.existing, image="old.jpg", is_primary=True)
+
+    def _import(self, name, content, **params):
+        upload = SimpleUploadedFile(name, content.encode("utf-8"))
+        return self.client.post(f"/api/products/admin/products/import/?{urlencode(params)}", {"file": upload})
+
+    def test_csv_import_upserts_and_reports_bad_rows(self):
+        content = (
+            "slug,title,description,price,inventory,category,images\n"
+            'phone-1,Phone One,"multi\nline",100,5,phones,a.jpg|b.jpg\n'
+            "phone-2,Phone Two,,200,3,,\n"
+            "bad slug,Broken,,abc,1,,\n"
+            "phone-3,Ghost,,10,1,missing,\n"
+            "phone-2,Again,,1,1,,\n"
+        )
+        response = self._import("catalog.csv", content)
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual((report["created"], report["updated"], report["failed"]), (1, 1, 3))
+        self.assertEqual([e["row"] for e in report["errors"]], [3, 4, 5])
+        self.assertEqual(set(report["errors"][0]["errors"]), {"slug", "price"})
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.title, self.existing.description), ("Phone One", "multi\nline"))
+        self.assertEqual(self.existing.primary_image_url, "a.jpg")
+        self.assertEqual(list(self.existing.images.values_list("image", flat=True).order_by("id")), ["a.jpg", "b.jpg"])
+        self.assertEqual(Product.objects.get(slug="phone-2").images.count(), 0)
+        self.assertEqual(sum(ProductFacet.objects.values_list("product_count", flat=True)), 2)
+
+    def _keep_fields(self):
+        Product.objects.filter(pk=self.existing.pk).update(inventory=7, description="Keep me")
+
+    def _assert_kept(self):
+        self.existing.refresh_from_db()
+        self.assertEqual(
+            (self.existing.inventory, self.existing.description, self.existing.category_id),
+            (7, "Keep me", self.phones.pk),
+        )
+
+    def test_ndjson_import_keeps_images_when_column_missing(self):
+        self._keep_fields()
+        content = '{"slug": "phone-1", "title": "Renamed", "price": "5"}\nnot json\n'
+        report = self._import("catalog.ndjson", content).json()
+        self.assertEqual((report["updated"], report["failed"]), (1, 1))
+        self.assertEqual(self.existing.images.count(), 1)
+        self._assert_kept()
+        self.assertEqual((self.existing.title, self.existing.price), ("Renamed", 5))
+
+    def test_blank_csv_cells_keep_stored_values(self):
+        self._keep_fields()
+        content = (
+            "slug,title,description,price,inventory,category\n"
+            "phone-1,Renamed,,5,,\n"
+            "case-1,Case,,10,,\n"
+        )
+        report = self._import("catalog.csv", content).json()
+        self.assertEqual((report["created"], report["updated"], report["failed"]), (1, 1, 0))
+        self._assert_kept()
+        new = Product.objects.get(slug="case-1")
+        self.assertEqual((new.inventory, new.description, new.category_id), (0, "", None))
+
+    def test_import_recounts_only_touched_categories(self):
+        cases = Category.objects.create(name="Cases", slug="cases")
+        Product.objects.create(title="Case", slug="case-1", price=5, category=cases)
+        rebuild_facets()
+        ProductFacet.objects.filter(category_key=cases.pk).update(product_count=99)  # untouched: left alone
+
+        content = '{"slug": "phone-1", "title": "Phone", "price": "1", "category": null}\n'
+        self._import("catalog.ndjson", content)
+        counts = dict(ProductFacet.objects.values_list("category_key", "product_count"))
+        self.assertEqual(counts, {0: 1, cases.pk: 99})
+
+    def test_export_round_trips(self):
+        for file_format in ("csv", "ndjson"):
+            response = self.client.get("/api/products/admin/products/export/", {"file_format": file_format})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            body = b"".join(response.streaming_content).decode()
+            self.assertIn("old.jpg", body)
+            report = self._import(f"export.{file_format}", body).json()
+            self.assertEqual((report["updated"], report["failed"]), (1, 0))
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(User.objects.create_user("shopper", "s@example.com", "pw"))
+        self.assertEqual(self.client.get("/api/products/admin/products/export/").status_code, 403)
+
+
+class ProductImageSyncTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user("admin", "admin@example.com", "pw", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.product = Product.objects.create(title="Phone", slug="phone", price=100)
+        self.front, self.back, self.side = (
+            ProductImage.objects.create(product=self.product, image=f"{name}.jpg", is_primary=name == "front")
+            for name in ("front", "back", "side")
+        )
+
+    def _update(self, images):
+        return self.client.patch(f"/api/products/products/{self.product.pk}/", {"images": images}, format="json")
+
+    def test_only_differences_are_written(self):
+        images = [
+            {"id": self.front.pk, "image": "front.jpg", "is_primary": True},
+            {"image": "back.jpg", "alt_text": "Back view"},
+            {"image": "top.jpg"},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self._update(images).status_code, 200)
+        image_writes = [
+            q["sql"].split()[0] for q in queries
+            if q["sql"].startswith(('INSERT INTO "products_productimage"', 'UPDATE "products_productimage"',
+                                    'DELETE FROM "products_productimage"'))
+        ]
+        self.assertEqual(sorted(image_writes), ["DELETE", "INSERT", "UPDATE"])
+
+        rows = {image.image: image for image in self.product.images.all()}
+        self.assertEqual(set(rows), {"front.jpg", "back.jpg", "top.jpg"})
+        self.assertEqual((rows["front.jpg"].pk, rows["back.jpg"].pk), (self.front.pk, self.back.pk))
+        self.assertEqual(rows["back.jpg"].alt_text, "Back view")
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.primary_image_url, "front.jpg")
+
+    def test_unchanged_set_writes_nothing(self):
+        images = [
+            {"image": "front.jpg", "is_primary": True},
+            {"image": "back.jpg"},
+            {"image": "side.jpg"},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            self._update(images)
+        self.assertFalse([q for q in queries if "products_productimage" in q["sql"] and "SELECT" not in q["sql"]])
+        self.assertEqual(self.product.images.count(), 3)
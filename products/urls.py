@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet, CategoryViewSet, manage_products
+from .views import ProductViewSet, CategoryViewSet, export_products_view, import_products_view, manage_products
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet, basename='product')
@@ -9,4 +9,6 @@ router.register(r'categories', CategoryViewSet, basename='category')
 urlpatterns = [
     path('', include(router.urls)),
     path("admin/products/", manage_products, name="manage-products"),
+    path("admin/products/import/", import_products_view, name="import-products"),
+    path("admin/products/export/", export_products_view, name="export-products"),
 ]
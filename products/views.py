@@ -1,19 +1,29 @@
-from rest_framework import viewsets, permissions, filters
-from django.db.models import Q
+from rest_framework import viewsets, permissions
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from .cache import CatalogCacheMixin
+from .facets import product_facets
+from .filters import ProductOrderingFilter
 from .models import Product, Category
-from .serializers import ProductSerializer, CategorySerializer, ProductAdminSerializer
+from .pagination import ProductCursorPagination
+from .search import search_products
+from .serializers import ProductSerializer, ProductListSerializer, CategorySerializer, ProductAdminSerializer
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all().prefetch_related("images")
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['title', 'description']
+    filter_backends = [ProductOrderingFilter]
     ordering_fields = ['price', 'title', 'created_at']
     ordering = ['-created_at']  # Default ordering
+    pagination_class = ProductCursorPagination
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        if self.action == "list":
+            # The list serializer only reads denormalized columns: no joins, no prefetch
+            queryset = Product.objects.only(*ProductListSerializer.load_fields)
+        else:
+            queryset = super().get_queryset()
         
         # Filter by category
         category_id = self.request.query_params.get('category', None)
@@ -29,15 +39,25 @@ class ProductViewSet(viewsets.ModelViewSet):
         if max_price:
             queryset = queryset.filter(price__lte=max_price)
         
-        # Search in title and description (if not using DRF's built-in search)
+        # Full-text search over title and description, ranked by relevance
         search = self.request.query_params.get('search', None)
         if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) | Q(description__icontains=search)
-            )
+            queryset = search_products(queryset, search)
         
         return queryset
 
+    @action(detail=False, methods=["get"])
+    def facets(self, request):
+        """Category and price-band counts for the same category/min_price/max_price/search params as the list."""
+        return self._cached_response("facets", self._facets, request)
+
+    def _facets(self, request):
+        search = request.query_params.get('search', None)
+        queryset = Product.objects.all()
+        if search:
+            queryset = search_products(queryset, search)
+        return Response(product_facets(queryset, request.query_params, search=search))
+
     def get_permissions(self):
         if self.request.method in ('GET', 'HEAD', 'OPTIONS'):
             return [permissions.AllowAny()]
@@ -46,9 +66,11 @@ class ProductViewSet(viewsets.ModelViewSet):
     def get_serializer_class(self):
         if self.request.method in ('POST', 'PUT', 'PATCH'):
             return ProductAdminSerializer
+        if self.action == "list":
+            return ProductListSerializer
         return ProductSerializer
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
@@ -61,6 +83,8 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
+from django.http import StreamingHttpResponse
+from .bulk import CSV, detect_format, export_rows, import_products, read_rows
 from .models import Product
 from .serializers import ProductAdminSerializer
 
@@ -69,7 +93,7 @@ from .serializers import ProductAdminSerializer
 @permission_classes([IsAdminUser])
 def manage_products(request):
     if request.method == "GET":
-        products = Product.objects.all()
+        products = Product.objects.all().prefetch_related("images")
         serializer = ProductAdminSerializer(products, many=True)
         return Response(serializer.data)
     
@@ -106,3 +130,24 @@ def manage_products(request):
             return Response({"error": "Not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
+@api_view(["POST"])
+@permission_classes([IsAdminUser])
+def import_products_view(request):
+    """Upsert products by slug from an uploaded CSV or NDJSON `file` (see products.bulk)."""
+    upload = request.FILES.get("file")
+    if not upload:
+        return Response({"error": "CSV or NDJSON file required"}, status=status.HTTP_400_BAD_REQUEST)
+    file_format = detect_format(upload.name, request.query_params.get("file_format"))
+    report = import_products(read_rows(upload, file_format))
+    return Response(report)
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def export_products_view(request):
+    """Stream the whole catalog as CSV (default) or NDJSON (`?file_format=ndjson`)."""
+    file_format = detect_format(requested=request.query_params.get("file_format"))
+    content_type = "text/csv" if file_format == CSV else "application/x-ndjson"
+    response = StreamingHttpResponse(export_rows(file_format), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="products.{file_format}"'
+    return response
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .auth import check_role_cache
+        from .sessions import check_session_mode
+        checks.register(check_session_mode)
+        # Only multi-worker deployments need it shared; locmem is fine for runserver
+        checks.register(check_role_cache, deploy=True)
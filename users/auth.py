@@ -0,0 +1,140 @@
+"""Role claims in issued JWTs, and a short-lived cache of each user's current roles.
+
+Login passes the user that just authenticated straight into token issuance, so
+the views never decode the token they minted to look that user up again.
+Tokens carry the user's role flags as claims, but those are only a snapshot:
+every access token minted on refresh gets its claims from `current_role_claims`,
+and request authentication (users.authentication) checks the same answer, so a
+deactivated or demoted user loses their rights at the next request rather than
+when the 7-day refresh token runs out. The answer is cached per user for
+``AUTH_ROLE_CACHE_TIMEOUT`` seconds and dropped whenever the user row is saved
+or deleted (see users.signals), so a refresh normally reads no table at all.
+
+That drop only reaches other workers through a shared cache, so with several
+workers ``AUTH_ROLE_CACHE_ALIAS`` must not be a per-process one (locmem), or a
+revoked role lives on elsewhere until the timeout; `check_role_cache` reports
+that under ``manage.py check --deploy``.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.checks import Error
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from ecommerce.caches import process_local_backend
+
+ROLE_CLAIMS = ("is_staff", "is_superuser", "is_admin", "is_customer")
+ADMIN_FLAGS = ("is_staff", "is_superuser", "is_admin")
+
+
+def is_admin_user(user) -> bool:
+    """True for staff, superusers and users flagged is_admin; works on users and token payloads alike."""
+    if isinstance(user, dict):
+        return any(user.get(flag) for flag in ADMIN_FLAGS)
+    return any(getattr(user, flag, False) for flag in ADMIN_FLAGS)
+
+
+def role_claims(user) -> dict:
+    return {claim: bool(getattr(user, claim, False)) for claim in ROLE_CLAIMS}
+
+
+def has_role_claims(payload) -> bool:
+    return all(claim in payload for claim in ROLE_CLAIMS)
+
+
+def _cache():
+    return caches[getattr(settings, "AUTH_ROLE_CACHE_ALIAS", "default")]
+
+
+def _timeout():
+    return getattr(settings, "AUTH_ROLE_CACHE_TIMEOUT", 60)
+
+
+def check_role_cache(app_configs, **kwargs):
+    alias = getattr(settings, "AUTH_ROLE_CACHE_ALIAS", "default")
+    backend = process_local_backend(alias)
+    if not backend:
+        return []
+    return [Error(
+        f"The role cache {alias!r} is {backend}, so a role change or deactivation on one "
+        f"worker is not seen by the others for up to AUTH_ROLE_CACHE_TIMEOUT seconds.",
+        hint="Set AUTH_CACHE_BACKEND/AUTH_CACHE_LOCATION to a shared cache (e.g. Redis).",
+        id="users.E003",
+    )]
+
+
+def _key(user_id):
+    return f"auth:roles:{user_id}"
+
+
+def remember_role(user) -> None:
+    _cache().set(_key(user.pk), role_claims(user) if user.is_active else {}, _timeout())
+
+
+def forget_role(user_id) -> None:
+    _cache().delete(_key(user_id))
+
+
+def current_role_claims(user_id) -> dict:
+    """The user's role flags as they are now; empty if the user is gone or inactive. Cached per user."""
+    cache = _cache()
+    claims = cache.get(_key(user_id))
+    if claims is None:
+        claims = (
+            get_user_model().objects.filter(pk=user_id, is_active=True)
+            .values(*ROLE_CLAIMS)
+            .first()
+        ) or {}
+        cache.set(_key(user_id), claims, _timeout())
+    return claims
+
+
+def refreshed_access_token(refresh):
+    """Access token for `refresh` with the user's current role claims; None if the user is gone or inactive."""
+    user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+    claims = current_role_claims(user_id) if user_id else None
+    if not claims:
+        return None
+    access = refresh.access_token
+    for claim, value in claims.items():
+        access[claim] = value
+    return access
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Token pair whose claims include the user's role flags as of login."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim, value in role_claims(user).items():
+            token[claim] = value
+        return token
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """`/api/token/refresh/` with the role claims re-read instead of copied from the refresh token."""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        access = refreshed_access_token(refresh)
+        if access is None:
+            raise AuthenticationFailed(self.error_messages["no_active_account"], "no_active_account")
+        data = {"access": str(access)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                try:
+                    refresh.blacklist()
+                except AttributeError:
+                    pass  # blacklist app not installed
+            for claim in ROLE_CLAIMS:
+                refresh[claim] = access[claim]
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+            data["refresh"] = str(refresh)
+        return data
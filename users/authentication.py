@@ -0,0 +1,38 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .auth import current_role_claims, has_role_claims
+from .models import TokenClaimsUser
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWT authentication that trusts the token's claims instead of reading the user row.
+
+    Tokens carrying role claims (see users.auth) authenticate as a TokenClaimsUser
+    built from the user's current roles, which come from the per-user role cache
+    (one query on a miss); the rest of the user is loaded only if a view reads it.
+    Inactive or deleted users are rejected, and a demoted user loses the role
+    within ``AUTH_ROLE_CACHE_TIMEOUT`` seconds (at once in the process that saved
+    the change). Older tokens without the claims, and setups that must compare
+    the token with the stored user (``CHECK_REVOKE_TOKEN``), fall back to the
+    usual lookup.
+    """
+
+    def get_user(self, validated_token):
+        if (
+            api_settings.CHECK_REVOKE_TOKEN
+            or api_settings.USER_ID_FIELD not in ("id", "pk")
+            or not has_role_claims(validated_token)
+        ):
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+        claims = current_role_claims(user_id)
+        if not claims:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return TokenClaimsUser.from_claims(user_id, claims)
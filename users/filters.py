@@ -0,0 +1,37 @@
+from django.db.models import Q
+from rest_framework.filters import BaseFilterBackend
+
+from ecommerce.filters import parse_bound, parse_flag
+
+
+class UserFilterBackend(BaseFilterBackend):
+    """Filter users by search (username/email prefix), is_staff, is_customer and joined_after/joined_before.
+
+    Search is a prefix match so it can use the UPPER(...) pattern indexes created
+    by migration 0002 on PostgreSQL instead of scanning every row.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        search = (params.get("search") or "").strip()
+        if search:
+            queryset = queryset.filter(Q(username__istartswith=search) | Q(email__istartswith=search))
+
+        for flag in ("is_staff", "is_customer"):
+            value = params.get(flag)
+            if value:
+                queryset = queryset.filter(**{flag: parse_flag(flag, value)})
+
+        joined_after = params.get("joined_after")
+        if joined_after:
+            queryset = queryset.filter(date_joined__gte=parse_bound("joined_after", joined_after))
+
+        joined_before = params.get("joined_before")
+        if joined_before:
+            # A bare date is inclusive: joined_before=2025-01-31 keeps the whole day
+            queryset = queryset.filter(
+                date_joined__lt=parse_bound("joined_before", joined_before, end_of_day=True)
+            )
+
+        return queryset
@@ -0,0 +1,72 @@
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from users.sessions import SESSION_ENGINES
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare database queries and time per request across the session modes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--write-every", type=int, default=10, help="Modify the session on every Nth request.")
+        parser.add_argument("--modes", nargs="+", choices=list(SESSION_ENGINES), default=list(SESSION_ENGINES))
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                for mode in options["modes"]:
+                    self._run(mode, options["requests"], options["write_every"])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, mode, requests, write_every):
+        def view(request):
+            # What the admin does on each request: resolve the logged-in user, sometimes write
+            request.session.get(SESSION_KEY)
+            if request.write:
+                request.session["last_seen"] = time.time()
+            return HttpResponse()
+
+        factory = RequestFactory()
+        with override_settings(SESSION_ENGINE=SESSION_ENGINES[mode]):
+            caches[settings.SESSION_CACHE_ALIAS].clear()
+            middleware = SessionMiddleware(view)
+
+            def request(cookie, write):
+                req = factory.get("/admin/")
+                req.write = write
+                if cookie:
+                    req.COOKIES[settings.SESSION_COOKIE_NAME] = cookie
+                response = middleware(req)
+                morsel = response.cookies.get(settings.SESSION_COOKIE_NAME)
+                return morsel.value if morsel else cookie
+
+            cookie = request(None, write=True)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                for n in range(requests):
+                    cookie = request(cookie, write=bool(write_every) and n % write_every == 0)
+                elapsed = time.perf_counter() - started
+        self.stdout.write(json.dumps({
+            "mode": mode,
+            "requests": requests,
+            "queries": len(queries),
+            "queries_per_request": round(len(queries) / requests, 3),
+            "mean_us": round(elapsed / requests * 1e6, 1),
+        }))
@@ -0,0 +1,28 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from users.sessions import SWEEP_BATCH_SIZE, sweep_expired_sessions
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired rows from django_session in batches, once or every --interval seconds. "
+        "Unlike clearsessions (one DELETE of every expired row) it never holds one long lock."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=SWEEP_BATCH_SIZE)
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+        parser.add_argument("--interval", type=float, default=0.0, help="Keep running, sweeping this often.")
+
+    def handle(self, *args, **options):
+        stopping = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stopping.set())
+        while True:
+            deleted = sweep_expired_sessions(batch_size=options["batch_size"], pause=options["pause"])
+            self.stdout.write(f"Deleted {deleted} expired sessions")
+            if not options["interval"] or stopping.wait(options["interval"]):
+                return
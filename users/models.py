@@ -1,6 +1,8 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.conf import settings
+from django.core.cache import caches
+from django.db import router
 
 class CustomUser(AbstractUser):
     # make email unique and required
@@ -10,10 +12,84 @@ class CustomUser(AbstractUser):
     is_admin = models.BooleanField(default=False)
     
     # add extra fields later if needed: phone, address...
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Admin user list: keyset pagination, and the short staff-only listing
+            models.Index(fields=["-date_joined", "-id"], name="user_joined_id_idx"),
+            models.Index(
+                fields=["-date_joined", "-id"],
+                name="user_staff_joined_idx",
+                condition=models.Q(is_staff=True),
+            ),
+        ]
+        # Prefix-search indexes are PostgreSQL specific; see migration 0002
+
     def __str__(self):
         return self.username
 
 
+class TokenClaimsUser(CustomUser):
+    """A user built from JWT claims alone, for requests that only need the id and role flags.
+
+    Only the primary key and role flags are loaded. The first access to any other
+    field fills in all of them with one query, or from a per-user cache entry when
+    ``AUTH_USER_CACHE_TIMEOUT`` is set. It is a real user instance, so it can be
+    assigned to foreign keys and used in filters without a query.
+    """
+
+    CLAIM_FIELDS = ("is_staff", "is_superuser", "is_admin", "is_customer")
+
+    class Meta:
+        proxy = True
+
+    @classmethod
+    def from_claims(cls, user_id, claims):
+        names = ["id", *cls.CLAIM_FIELDS]
+        values = [cls._meta.pk.to_python(user_id), *(bool(claims.get(name)) for name in cls.CLAIM_FIELDS)]
+        return cls.from_db(router.db_for_read(cls), names, values)
+
+    @staticmethod
+    def cache_key(user_id):
+        return f"auth:user:{user_id}"
+
+    @classmethod
+    def _cache(cls):
+        return caches[getattr(settings, "AUTH_ROLE_CACHE_ALIAS", "default")]
+
+    @classmethod
+    def forget(cls, user_id):
+        cls._cache().delete(cls.cache_key(user_id))
+
+    @classmethod
+    def hydrated_fields(cls):
+        # The password hash is never cached; reading it is a separate single-field load
+        return [field.attname for field in cls._meta.concrete_fields if field.attname != "password"]
+
+    def _hydrate(self):
+        cache = self._cache()
+        timeout = getattr(settings, "AUTH_USER_CACHE_TIMEOUT", 0)
+        values = cache.get(self.cache_key(self.pk)) if timeout else None
+        if values is None:
+            values = type(self)._base_manager.db_manager(self._state.db).filter(pk=self.pk).values(
+                *self.hydrated_fields()
+            ).first()
+            if values is None:
+                raise self.DoesNotExist("User in token no longer exists.")
+            if timeout:
+                cache.set(self.cache_key(self.pk), values, timeout)
+        for attname in self.get_deferred_fields() & values.keys():
+            self.__dict__[attname] = values[attname]
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # Deferred-field access lands here one field at a time; load them all instead
+        deferred = self.get_deferred_fields() - {"password"}
+        if fields is not None and using is None and from_queryset is None and set(fields) <= deferred:
+            self._hydrate()
+            return
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
+
 class AdminProfile(models.Model):
     """
     Optional admin-only profile for custom admin dashboard metadata.
@@ -0,0 +1,79 @@
+"""Session storage modes and the expired-session sweeper.
+
+Sessions only back the Django admin and its CSRF flow; the API itself is JWT.
+``SESSION_MODE`` picks where they live:
+
+- ``signed_cookies``: the session is the cookie itself; no server-side storage
+- ``cache``: the ``sessions`` cache alias only; lost when that cache is flushed
+- ``cached_db``: read through the cache, written to ``django_session``
+- ``db`` (default): every request with a session cookie reads ``django_session``
+
+The two cache modes need a ``sessions`` cache shared by every worker: with a
+per-process cache (the locmem default) a logout on one worker leaves the session
+alive in the others' copies, so `check_session_mode` refuses that combination.
+
+Expired rows in ``django_session`` can be cleared with Django's
+``clearsessions``, which deletes them all in one statement. The
+``sweep_sessions`` command runs `sweep_expired_sessions` instead: the same
+cleanup in short batches with an optional pause between them, so a large
+backlog never holds one long lock, once or on an interval.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.checks import Error
+from django.db import connection
+from django.utils import timezone
+
+from ecommerce.caches import process_local_backend
+
+SESSION_ENGINES = {
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+    "cache": "django.contrib.sessions.backends.cache",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "db": "django.contrib.sessions.backends.db",
+}
+SWEEP_BATCH_SIZE = 5000
+
+
+def check_session_mode(app_configs, **kwargs):
+    mode = getattr(settings, "SESSION_MODE", None)
+    if mode is None:
+        return []
+    if mode not in SESSION_ENGINES:
+        return [Error(
+            f"SESSION_MODE must be one of {', '.join(SESSION_ENGINES)}; got {mode!r}.",
+            id="users.E001",
+        )]
+    backend = process_local_backend(settings.SESSION_CACHE_ALIAS)
+    if mode in ("cache", "cached_db") and backend:
+        return [Error(
+            f"SESSION_MODE={mode!r} needs a cache shared by every worker, but the "
+            f"{settings.SESSION_CACHE_ALIAS!r} cache is {backend}.",
+            hint="Set SESSION_CACHE_BACKEND/SESSION_CACHE_LOCATION (e.g. Redis) or use SESSION_MODE=db.",
+            id="users.E002",
+        )]
+    return []
+
+
+def sweep_expired_sessions(batch_size=SWEEP_BATCH_SIZE, pause=0.0) -> int:
+    """Delete expired rows from ``django_session`` in batches; returns how many went.
+
+    Each batch is its own short DELETE on the expire_date index, so a large
+    backlog never holds one long lock. `pause` sleeps between batches to leave
+    room for live traffic.
+    """
+    if Session._meta.db_table not in connection.introspection.table_names():
+        return 0
+    now = timezone.now()
+    deleted = 0
+    while True:
+        keys = list(Session.objects.filter(expire_date__lt=now).values_list("pk", flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        deleted += Session.objects.filter(pk__in=keys).delete()[0]
+        if len(keys) < batch_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .auth import forget_role
+from .models import TokenClaimsUser
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+@receiver(post_save, sender=TokenClaimsUser)
+@receiver(post_delete, sender=TokenClaimsUser)
+def forget_cached_user(sender, instance, **kwargs):
+    # Role, is_active or profile fields may have changed; the next reader re-reads the row
+    forget_role(instance.pk)
+    TokenClaimsUser.forget(instance.pk)
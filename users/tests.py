@@ -1,3 +1,213 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .auth import RoleTokenObtainPairSerializer, check_role_cache, remember_role
+from .sessions import check_session_mode, sweep_expired_sessions
+
+User = get_user_model()
+
+
+class ListUsersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user("admin", "admin@example.com", "pw", is_staff=True, is_customer=False)
+        now = timezone.now()
+        User.objects.bulk_create(
+            User(username=f"user{i:03}", email=f"shopper{i:03}@example.com", date_joined=now - timedelta(days=i))
+            for i in range(120)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_pages_through_everyone_once(self):
+        seen, url = [], "/api/users/?page_size=50"
+        while url:
+            body = self.client.get(url).json()
+            seen += [user["username"] for user in body["results"]]
+            url = body["next"]
+        self.assertEqual(len(seen), 121)
+        self.assertEqual(len(set(seen)), 121)
+
+    def test_search_and_filters(self):
+        def usernames(**params):
+            response = self.client.get("/api/users/", params)
+            self.assertEqual(response.status_code, 200)
+            return {user["username"] for user in response.json()["results"]}
+
+        self.assertEqual(usernames(search="USER00"), {f"user00{i}" for i in range(10)})
+        self.assertEqual(usernames(search="shopper119"), {"user119"})
+        self.assertEqual(usernames(is_staff="true"), {"admin"})
+        recent = (timezone.now() - timedelta(days=2.5)).isoformat()
+        self.assertEqual(len(usernames(is_customer="1", joined_after=recent)), 3)
+        self.assertEqual(self.client.get("/api/users/", {"is_staff": "maybe"}).status_code, 400)
+
+    def test_csv_export_streams_filtered_users(self):
+        response = self.client.get("/api/users/", {"export": "csv", "search": "user11"})
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["id", "username", "email"])
+        self.assertEqual(len(lines), 11)
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(User.objects.get(username="user001"))
+        self.assertEqual(self.client.get("/api/users/").status_code, 403)
+
+
+class TokenRoleTests(TestCase):
+    def setUp(self):
+        caches[settings.AUTH_ROLE_CACHE_ALIAS].clear()
+        self.admin = User.objects.create_user("admin", "admin@example.com", "pw", is_staff=True)
+        self.shopper = User.objects.create_user("shopper", "shopper@example.com", "pw")
+        self.client = APIClient()
+
+    def _login(self, url, username):
+        return self.client.post(url, {"username": username, "password": "pw"}, format="json")
+
+    def _refresh(self, refresh):
+        return self.client.post("/api/admin/refresh/", {"refresh": refresh}, format="json")
+
+    def test_login_reads_the_user_once_and_embeds_roles(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._login("/api/users/login/", "shopper")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([q for q in queries if q["sql"].startswith("SELECT")]), 1)
+        body = response.json()
+        self.assertEqual(body["user"]["username"], "shopper")
+        claims = AccessToken(body["access"]).payload
+        self.assertEqual((claims["is_staff"], claims["is_admin"], claims["is_customer"]), (False, False, True))
+
+        self.assertEqual(self._login("/api/users/login/", "nobody").status_code, 401)
+
+    def test_admin_login_rejects_shoppers(self):
+        self.assertEqual(self._login("/api/admin/login/", "shopper").status_code, 403)
+        body = self._login("/api/admin/login/", "admin").json()
+        self.assertTrue(body["is_admin"])
+
+    def test_refresh_skips_the_database_until_role_changes(self):
+        refresh = self._login("/api/admin/login/", "admin").json()["refresh"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self._refresh(refresh)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 0)
+        self.assertTrue(AccessToken(response.json()["access"])["is_staff"])
+
+        self.admin.is_staff = False
+        self.admin.save()
+        self.assertEqual(self._refresh(refresh).status_code, 403)
+
+    def test_shopper_refresh_is_refused_from_claims(self):
+        refresh = self._login("/api/users/login/", "shopper").json()["refresh"]
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self._refresh(refresh).status_code, 403)
+        self.assertEqual(len(queries), 0)
+        response = APIClient().post("/api/admin/refresh/", {"refresh": "garbage"}, format="json")
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_reissues_current_roles(self):
+        refresh = self._login("/api/admin/login/", "admin").json()["refresh"]
+        self.admin.is_staff = False
+        self.admin.save()
+        response = APIClient().post("/api/users/refresh/", {"refresh": refresh}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(AccessToken(response.json()["access"])["is_staff"])
+        response = APIClient().post("/api/token/refresh/", {"refresh": refresh}, format="json")
+        self.assertFalse(AccessToken(response.json()["access"])["is_staff"])
+
+    def test_deactivated_admin_loses_access_at_once(self):
+        body = self._login("/api/admin/login/", "admin").json()
+        admin_client = APIClient()
+        admin_client.credentials(HTTP_AUTHORIZATION=f"Bearer {body['access']}")
+        self.assertEqual(admin_client.get("/api/users/").status_code, 200)
+
+        self.admin.is_staff = False
+        self.admin.is_active = False
+        self.admin.save()
+        for url in ("/api/users/refresh/", "/api/token/refresh/"):
+            response = APIClient().post(url, {"refresh": body["refresh"]}, format="json")
+            self.assertEqual(response.status_code, 401, url)
+        self.assertEqual(self._refresh(body["refresh"]).status_code, 403)
+        self.assertEqual(admin_client.get("/api/users/").status_code, 401)
+        self.assertEqual(admin_client.get("/api/orders/").status_code, 401)
+
+
+@override_settings(AUTH_USER_CACHE_TIMEOUT=30)
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        caches[settings.AUTH_ROLE_CACHE_ALIAS].clear()
+        self.user = User.objects.create_user("shopper", "shopper@example.com", "pw", first_name="Sam")
+        self.client = APIClient()
+        remember_role(self.user)  # as login does
+        token = RoleTokenObtainPairSerializer.get_token(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def _user_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [q for q in queries if '"users_customuser"' in q["sql"]]
+
+    def test_cart_reads_no_user_row(self):
+        _, queries = self._user_queries("/api/orders/cart/")
+        self.assertEqual(queries, [])
+
+    def test_other_fields_load_once_then_from_cache(self):
+        response, queries = self._user_queries("/api/users/profile/")
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.json()["first_name"], "Sam")
+        self.assertEqual(self._user_queries("/api/users/profile/")[1], [])
+
+        self.user.first_name = "Alex"
+        self.user.save()
+        response, queries = self._user_queries("/api/users/profile/")
+        # saving dropped both the cached roles and the cached row
+        self.assertEqual((len(queries), response.json()["first_name"]), (2, "Alex"))
+
+    def test_tokens_without_role_claims_use_the_user_row(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        _, queries = self._user_queries("/api/orders/cart/")
+        self.assertEqual(len(queries), 1)
+
+
+class SessionSweepTests(TestCase):
+    def test_deletes_only_expired_rows_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            Session(session_key=f"key{i}", session_data="", expire_date=now + timedelta(days=1 if i % 3 else -1))
+            for i in range(30)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(sweep_expired_sessions(batch_size=4), 10)
+        self.assertEqual(len([q for q in queries if q["sql"].startswith("DELETE")]), 3)
+        self.assertFalse(Session.objects.filter(expire_date__lt=now).exists())
+        self.assertEqual(Session.objects.count(), 20)
+
+    def test_unknown_mode_fails_the_system_check(self):
+        with override_settings(SESSION_MODE="redis"):
+            self.assertEqual([error.id for error in check_session_mode(None)], ["users.E001"])
+        self.assertEqual(check_session_mode(None), [])
+
+    def test_deploy_check_needs_a_shared_role_cache(self):
+        self.assertEqual([error.id for error in check_role_cache(None)], ["users.E003"])
+        shared = {**settings.CACHES, "auth": {"BACKEND": "django.core.cache.backends.redis.RedisCache"}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_role_cache(None), [])
+
+    def test_cache_modes_need_a_shared_cache(self):
+        for mode in ("cache", "cached_db"):
+            with override_settings(SESSION_MODE=mode):
+                self.assertEqual([error.id for error in check_session_mode(None)], ["users.E002"])
+        shared = {**settings.CACHES, "sessions": {"BACKEND": "django.core.cache.backends.redis.RedisCache"}}
+        with override_settings(SESSION_MODE="cached_db", CACHES=shared):
+            self.assertEqual(check_session_mode(None), [])
@@ -1,71 +1,67 @@
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework.response import Response
 from rest_framework import status, generics
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.middleware.csrf import get_token
 from django.contrib.auth import get_user_model
 
+from ecommerce.streaming import csv_line_writer
+
+from .auth import has_role_claims, is_admin_user, refreshed_access_token, remember_role
+from .filters import UserFilterBackend
+from .pagination import UserCursorPagination
 from .serializers import RegisterSerializer, UserSerializer, AdminUserSerializer
 
+USER_EXPORT_FIELDS = UserSerializer.Meta.fields
 
-def _is_admin(user):
-    return (
-        getattr(user, "is_staff", False)
-        or getattr(user, "is_superuser", False)
-        or getattr(user, "is_admin", False)
-    )
 
 class RegisterView(generics.CreateAPIView):
     permission_classes = (AllowAny,)
     serializer_class = RegisterSerializer
 
+def _validated_login(view, request):
+    """Authenticate and mint the token pair; returns (tokens, the authenticated user)."""
+    serializer = view.get_serializer(data=request.data)
+    try:
+        serializer.is_valid(raise_exception=True)
+    except TokenError as e:
+        raise InvalidToken(e.args[0])
+    remember_role(serializer.user)
+    return serializer.validated_data, serializer.user
+
+
+def _login_response(tokens, user, **extra):
+    # Return both tokens and user data in JSON (refresh too, for localStorage)
+    response = JsonResponse({
+        "access": tokens["access"],
+        "refresh": tokens["refresh"],
+        "user": UserSerializer(user).data,
+        **extra,
+    })
+    # Also set refresh token as HttpOnly cookie for additional security
+    response.set_cookie(
+        "refresh",
+        tokens["refresh"],
+        httponly=True,
+        samesite="Lax",
+        secure=False,    # set True in production over HTTPS
+        max_age=7*24*3600,
+    )
+    return response
+
 # login: uses built-in TokenObtainPairView but we set cookie
 class LoginView(TokenObtainPairView):
     permission_classes = (AllowAny,)
 
     def post(self, request, *args, **kwargs):
-        resp = super().post(request, *args, **kwargs)
-        # resp is a DRF Response with data {'refresh':..., 'access':...}
-        if resp.status_code == 200 and "refresh" in resp.data:
-            refresh = resp.data.get("refresh")
-            access = resp.data.get("access")
-            
-            # Get user data
-            from rest_framework_simplejwt.tokens import AccessToken
-            token = AccessToken(access)
-            user_id = token['user_id']
-            
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
-            try:
-                user = User.objects.get(id=user_id)
-                user_data = UserSerializer(user).data
-            except User.DoesNotExist:
-                user_data = None
-            
-            # Return both tokens and user data in JSON
-            response = JsonResponse({
-                "access": access,
-                "refresh": refresh,  # Include refresh in response for localStorage
-                "user": user_data
-            })
-            
-            # Also set refresh token as HttpOnly cookie for additional security
-            response.set_cookie(
-                "refresh",
-                refresh,
-                httponly=True,
-                samesite="Lax",
-                secure=False,    # set True in production over HTTPS
-                max_age=7*24*3600,
-            )
-            return response
-        return JsonResponse(resp.data, status=resp.status_code)
+        tokens, user = _validated_login(self, request)
+        return _login_response(tokens, user)
 
 @method_decorator(csrf_exempt, name="dispatch")
 class AdminLoginView(TokenObtainPairView):
@@ -73,48 +69,12 @@ class AdminLoginView(TokenObtainPairView):
     permission_classes = (AllowAny,)
 
     def post(self, request, *args, **kwargs):
-        resp = super().post(request, *args, **kwargs)
-        if resp.status_code != 200 or "access" not in resp.data:
-            return JsonResponse(resp.data, status=resp.status_code)
-
-        access = resp.data.get("access")
-        refresh = resp.data.get("refresh")
-
-        # Decode access to find user
-        from rest_framework_simplejwt.tokens import AccessToken
-        token = AccessToken(access)
-        user_id = token["user_id"]
-
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-        try:
-            user = User.objects.get(id=user_id)
-        except User.DoesNotExist:
-            return JsonResponse({"detail": "Invalid user"}, status=400)
-
-        is_admin = getattr(user, "is_staff", False) or getattr(user, "is_superuser", False) or getattr(user, "is_admin", False)
-        if not is_admin:
+        tokens, user = _validated_login(self, request)
+        if not is_admin_user(user):
             return JsonResponse({"detail": "Admin access only"}, status=403)
 
-        # OK: return same structure as LoginView with user and cookie
-        # Plus simple keys to match simplified flow (message, is_admin)
-        user_data = UserSerializer(user).data
-        response = JsonResponse({
-            "access": access,
-            "refresh": refresh,
-            "user": user_data,
-            "message": "Login successful",
-            "is_admin": True,
-        })
-        response.set_cookie(
-            "refresh",
-            refresh,
-            httponly=True,
-            samesite="Lax",
-            secure=False,  # set True behind HTTPS in production
-            max_age=7*24*3600,
-        )
-        return response
+        # Same structure as LoginView plus simple keys to match simplified flow (message, is_admin)
+        return _login_response(tokens, user, message="Login successful", is_admin=True)
 
 @api_view(["POST"])
 @permission_classes([AllowAny])
@@ -128,10 +88,13 @@ def refresh_access_token(request):
         return Response({"detail": "No refresh token provided"}, status=status.HTTP_401_UNAUTHORIZED)
     try:
         token = RefreshToken(refresh_token)
-        access = str(token.access_token)
-        return Response({"access": access})
-    except Exception:
+    except TokenError:
         return Response({"detail": "Invalid refresh token"}, status=status.HTTP_401_UNAUTHORIZED)
+    # Claims come from the user as they are now, not from the refresh token
+    access = refreshed_access_token(token)
+    if access is None:
+        return Response({"detail": "No active account found"}, status=status.HTTP_401_UNAUTHORIZED)
+    return Response({"access": str(access)})
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
@@ -156,25 +119,39 @@ def profile_view(request):
 def admin_profile_view(request):
     """Admin-only: Get current admin's profile (requires admin role)"""
     user = request.user
-    if not _is_admin(user):
+    if not is_admin_user(user):
         return Response({"detail": "Admin access only"}, status=status.HTTP_403_FORBIDDEN)
     serializer = UserSerializer(user)
     return Response(serializer.data)
 
 
+def _user_csv_rows(queryset, chunk_size=2000):
+    """Yield the matching users as CSV lines, reading them in chunks."""
+    writer = csv_line_writer()
+    yield writer.writerow(USER_EXPORT_FIELDS)
+    rows = queryset.order_by("-date_joined", "-id").values_list(*USER_EXPORT_FIELDS)
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield writer.writerow(row)
+
+
 @api_view(["GET", "POST"])
 @permission_classes([IsAuthenticated])
 def list_users(request):
-    """Admin-only: list or create users"""
+    """Admin-only: list (paginated, filterable, or ?export=csv for everything) or create users"""
     user = request.user
-    if not _is_admin(user):
+    if not is_admin_user(user):
         return Response({"detail": "Admin access only"}, status=status.HTTP_403_FORBIDDEN)
 
     User = get_user_model()
     if request.method == "GET":
-        queryset = User.objects.all().order_by("-date_joined")
-        serializer = UserSerializer(queryset, many=True)
-        return Response(serializer.data)
+        queryset = UserFilterBackend().filter_queryset(request, User.objects.all(), None)
+        if request.query_params.get("export") == "csv":
+            response = StreamingHttpResponse(_user_csv_rows(queryset), content_type="text/csv")
+            response["Content-Disposition"] = 'attachment; filename="users.csv"'
+            return response
+        paginator = UserCursorPagination()
+        page = paginator.paginate_queryset(queryset, request)
+        return paginator.get_paginated_response(UserSerializer(page, many=True).data)
 
     serializer = AdminUserSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
@@ -186,7 +163,7 @@ def list_users(request):
 @permission_classes([IsAuthenticated])
 def admin_user_detail(request, user_id: int):
     """Admin-only: retrieve, update, or delete a specific user"""
-    if not _is_admin(request.user):
+    if not is_admin_user(request.user):
         return Response({"detail": "Admin access only"}, status=status.HTTP_403_FORBIDDEN)
 
     User = get_user_model()
@@ -224,23 +201,15 @@ def admin_refresh_access_token(request):
         return Response({"detail": "No refresh token provided"}, status=status.HTTP_401_UNAUTHORIZED)
     try:
         token = RefreshToken(refresh_token)
-        # Extract user_id to validate admin role
-        user_id = token.payload.get("user_id")
-        if not user_id:
-            return Response({"detail": "Invalid refresh token"}, status=status.HTTP_401_UNAUTHORIZED)
-        
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-        try:
-            user = User.objects.get(id=user_id)
-        except User.DoesNotExist:
-            return Response({"detail": "User not found"}, status=status.HTTP_401_UNAUTHORIZED)
-        
-        # Verify admin role
-        if not _is_admin(user):
-            return Response({"detail": "Admin access only"}, status=status.HTTP_403_FORBIDDEN)
-        
-        access = str(token.access_token)
-        return Response({"access": access})
-    except Exception:
+    except TokenError:
         return Response({"detail": "Invalid refresh token"}, status=status.HTTP_401_UNAUTHORIZED)
+    # Role claims settle non-admins without a lookup; admins are checked against their
+    # current (cached) roles so a revoked one stops refreshing, and the new access
+    # token carries those current roles rather than the refresh token's copy
+    if has_role_claims(token.payload) and not is_admin_user(token.payload):
+        return Response({"detail": "Admin access only"}, status=status.HTTP_403_FORBIDDEN)
+    access = refreshed_access_token(token)
+    if access is None or not is_admin_user(access.payload):
+        return Response({"detail": "Admin access only"}, status=status.HTTP_403_FORBIDDEN)
+
+    return Response({"access": str(access)})